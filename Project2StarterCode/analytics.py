@@ -0,0 +1,223 @@
+import hashlib
+import heapq
+import pickle
+import tempfile
+from array import array
+from collections.abc import Mapping
+from itertools import islice
+from operator import itemgetter
+
+
+class SpilledList:
+    """
+    An append-only list of strings that keeps at most buffer_size items in memory. Once the buffer is full, its items are
+    pickled as one record to an anonymous temporary file, which is deleted when the list is garbage collected. Iterating
+    streams the records back from the file, so a list of any length can be written out with constant memory.
+
+    A SpilledList pickles as a plain list, which is how it travels in get_crawl_state and checkpoint snapshots.
+    """
+
+    def __init__(self, items=(), buffer_size=10000, spill_dir=None):
+        self.buffer_size = buffer_size
+        self.spill_dir = spill_dir
+        self.buffer = []
+        self.spill_file = None
+        # number of items and of records in the spill file
+        self.spilled = 0
+        self.records = 0
+        self.extend(items)
+
+    def append(self, item):
+        self.buffer.append(item)
+        if len(self.buffer) >= self.buffer_size:
+            self.spill()
+
+    def extend(self, items):
+        for item in items:
+            self.append(item)
+
+    def spill(self):
+        if self.spill_file is None:
+            self.spill_file = tempfile.TemporaryFile(prefix="spilled_list_", dir=self.spill_dir)
+        self.spill_file.seek(0, 2)
+        pickle.dump(self.buffer, self.spill_file, pickle.HIGHEST_PROTOCOL)
+        self.spilled += len(self.buffer)
+        self.records += 1
+        self.buffer = []
+
+    def __iter__(self):
+        for chunk in self.chunks():
+            yield from chunk
+
+    def chunks(self):
+        """
+        Yields the items in lists of at most buffer_size items, reading one record of the spill file at a time
+        """
+        # the records are counted again after each one, so items appended while iterating are yielded too, as with a
+        # list, instead of the records spilled in the meantime being skipped
+        position = 0
+        record = 0
+        while record < self.records:
+            # the position is restored in case items are appended while iterating
+            self.spill_file.seek(position)
+            records = pickle.load(self.spill_file)
+            position = self.spill_file.tell()
+            record += 1
+            yield records
+        yield list(self.buffer)
+
+    def sorted(self):
+        """
+        Returns a new SpilledList holding the items in sorted order. Every chunk is sorted into a run spilled in records
+        small enough for all the runs to be read at the same time, and the runs are merged, so at most about buffer_size
+        items are in memory at once
+        """
+        run_buffer_size = max(1, self.buffer_size // (self.records + 1))
+        runs = [SpilledList(sorted(chunk), run_buffer_size, self.spill_dir) for chunk in self.chunks()]
+        return SpilledList(heapq.merge(*runs), self.buffer_size, self.spill_dir)
+
+    def __getitem__(self, index):
+        """
+        Supports indexing and slicing. Only the items still in the buffer are accessed without reading the spill file
+        """
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if start >= self.spilled and step == 1:
+                return self.buffer[start - self.spilled:stop - self.spilled]
+            return list(islice(self, start, stop, step))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("SpilledList index out of range")
+        if index >= self.spilled:
+            return self.buffer[index - self.spilled]
+        return next(islice(self, index, None))
+
+    def __len__(self):
+        return self.spilled + len(self.buffer)
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def write_repr(self, file):
+        """
+        Writes the same text as str(list(self)) to a file, one item at a time
+        """
+        file.write("[")
+        for i, item in enumerate(self):
+            if i:
+                file.write(", ")
+            file.write(repr(item))
+        file.write("]")
+
+
+class CountMinSketch:
+    """
+    A count-min sketch over strings: depth rows of width counters. The estimate of a count is never lower than the
+    actual count, and exceeds it by more than 2 * total / width with probability at most 2^-depth
+    """
+
+    def __init__(self, width=1 << 16, depth=4):
+        self.width = width
+        self.depth = depth
+        self.counters = array("Q", bytes(8 * width * depth))
+
+    def positions(self, key):
+        digest = int.from_bytes(hashlib.blake2b(key.encode("utf-8", "surrogatepass"), digest_size=8).digest(), "little")
+        h1 = digest & 0xFFFFFFFF
+        h2 = (digest >> 32) | 1
+        return [row * self.width + (h1 + row * h2) % self.width for row in range(self.depth)]
+
+    def add(self, key, count=1):
+        """
+        Adds count to the count of key
+        :return: the new estimate of the count of key
+        """
+        counters = self.counters
+        estimate = None
+        for position in self.positions(key):
+            counters[position] += count
+            if estimate is None or counters[position] < estimate:
+                estimate = counters[position]
+        return estimate
+
+
+class TopKCounter(Mapping):
+    """
+    A bounded replacement for the Counter of word_count that keeps the counts of at most 2 * capacity words, which is
+    enough to rank the capacity most frequent ones. When the table is full, only the capacity largest counts are kept
+    (Space-Saving with batched evictions). A word that is seen again after being evicted starts from an overestimate of
+    its count: the largest count evicted so far, or its count-min sketch estimate when use_sketch is True (tighter for
+    the words that are actually rare). The overestimate is kept as the error of the word, and most_common ranks the words
+    by their guaranteed count, which is their count minus their error. Counts are exact as long as nothing has been
+    evicted, and most_common then returns the same list as Counter.most_common.
+    """
+
+    def __init__(self, capacity=10000, use_sketch=False):
+        self.capacity = capacity
+        # upper bounds of the counts, and by how much they may exceed the actual counts when it is not 0
+        self.counts = {}
+        self.errors = {}
+        # the largest count evicted so far
+        self.floor = 0
+        self.sketch = CountMinSketch() if use_sketch else None
+
+    def update(self, counts):
+        """
+        Adds the counts of a mapping (or another TopKCounter) of words to counts
+        """
+        own_counts = self.counts
+        sketch = self.sketch
+        for word, count in counts.items():
+            estimate = sketch.add(word, count) if sketch is not None else None
+            if word in own_counts:
+                own_counts[word] += count
+            else:
+                upper_bound = self.floor + count if estimate is None else min(estimate, self.floor + count)
+                own_counts[word] = upper_bound
+                if upper_bound > count:
+                    self.errors[word] = upper_bound - count
+        if len(own_counts) > 2 * self.capacity:
+            self.evict()
+
+    def evict(self):
+        kept = dict(heapq.nlargest(self.capacity, self.counts.items(), key=itemgetter(1)))
+        self.floor = max(self.floor, max(count for word, count in self.counts.items() if word not in kept))
+        self.counts = kept
+        self.errors = {word: error for word, error in self.errors.items() if word in kept}
+
+    def most_common(self, n=None):
+        """
+        Returns the n words with the largest guaranteed counts, with these counts, like Counter.most_common
+        """
+        items = self.items()
+        if n is None:
+            return sorted(items, key=itemgetter(1), reverse=True)
+        return heapq.nlargest(n, items, key=itemgetter(1))
+
+    def items(self):
+        """
+        Returns the words and their guaranteed counts
+        """
+        if not self.errors:
+            return self.counts.items()
+        errors = self.errors
+        return [(word, count - errors.get(word, 0)) for word, count in self.counts.items()]
+
+    def __getitem__(self, word):
+        return self.counts[word] - self.errors.get(word, 0)
+
+    def __iter__(self):
+        return iter(self.counts)
+
+    def __contains__(self, word):
+        return word in self.counts
+
+    def __len__(self):
+        return len(self.counts)
@@ -0,0 +1,611 @@
+import argparse
+import json
+import os
+import random
+import resource
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from urllib.parse import urlparse
+
+from cbor import cbor
+from lxml import html
+
+import synthcorpus
+import packcorpus
+from corpus import Corpus, PackedCorpus, get_content_type
+from crawler import Crawler
+from fingerprint import FingerprintSet, url_fingerprint
+from frontier import Frontier
+from instrumentation import Metrics
+from linkgraph import LinkGraph
+from recrawl import RecrawlManifest
+from synthcorpus import HOSTS, WORDS
+from traps import TrapDetector
+
+
+def generate_urls(count, seed=0, prefix=""):
+    """
+    Generates count distinct ICS-like urls. Urls generated with different prefixes never collide
+    """
+    rng = random.Random(seed)
+    for i in range(count):
+        path = "/".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4)))
+        query = "?id=%d" % i if rng.random() < 0.3 else ""
+        yield "http://%s/%s%s/%d.html%s" % (rng.choice(HOSTS), prefix, path, i, query)
+
+
+def legacy_word_token_count(text):
+    """
+    The character by character tokenizer Crawler.word_token_count replaced, kept as a reference. It only lowercases a
+    token once the character following it is read, so a token ending the text is not lowercased
+    """
+    tokenList = []
+    new = True
+    for char in text:
+        if char.isalnum() is False or char.isascii() is False:
+            if tokenList:
+                tokenList[-1] = tokenList[-1].lower()
+            new = True
+        elif new:
+            tokenList.append(char)
+            new = False
+        else:
+            tokenList[-1] = tokenList[-1] + char
+    return tokenList
+
+
+def iter_corpus_texts(corpus_dir, limit):
+    """
+    Yields the text content of up to limit html pages of a corpus directory
+    """
+    count = 0
+    for file_name in sorted(os.listdir(corpus_dir)):
+        if count >= limit:
+            break
+        with open(os.path.join(corpus_dir, file_name), "rb") as corpus_file:
+            data = cbor.load(corpus_file)
+        content = data.get(b"raw_content", {}).get(b"value")
+        if not content:
+            continue
+        try:
+            yield html.fromstring(content).text_content()
+            count += 1
+        except Exception:
+            pass
+
+
+def legacy_extract(url, content, content_type):
+    """
+    The decoding and link extraction Crawler.extract_next_links replaced, kept as a reference: the content is decoded in
+    Python with the charset found after "charset" in the Content-Type (utf-8 without one), then make_links_absolute
+    rewrites every link of the page before iterlinks reads them back
+    :return: the absolute links and the text of the page
+    """
+    if isinstance(content, bytes):
+        encoding = "utf-8"
+        if "charset=" in content_type:
+            encoding = content_type.split("charset")[-1].split(";")[0].strip()
+        content = content.decode(encoding)
+    root = html.fromstring(content)
+    root.make_links_absolute(url)
+    return [link for _, _, link, _ in root.iterlinks()], root.text_content()
+
+
+def legacy_validate(crawler, links):
+    """
+    The per link validation loop of Crawler.crawl_url that Crawler.is_valid_batch replaced, kept as a reference
+    """
+    accepted = []
+    for link in links:
+        with crawler.metrics.stage("validate"):
+            valid = crawler.is_valid(link)
+        if valid:
+            accepted.append((link, crawler.link_info(link)[2]))
+    return accepted
+
+
+def generate_outlinks(rng, corpus_urls, nav_links, count):
+    """
+    Returns the count outlinks of a generated page: the navigation links shared by all pages, then links to the corpus,
+    to missing pages, to other sites, to excluded file types, to traps and to non http schemes, some of them repeated
+    """
+    links = list(nav_links)
+    while len(links) < count:
+        choice = rng.random()
+        if choice < 0.6:
+            link = rng.choice(corpus_urls)
+        elif choice < 0.7:
+            link = "http://%s/missing/%d.html" % (rng.choice(HOSTS), rng.randrange(100000))
+        elif choice < 0.75:
+            link = "http://www.example.com/%s/%d" % (rng.choice(WORDS), rng.randrange(1000))
+        elif choice < 0.8:
+            link = "http://%s/files/%d.%s" % (rng.choice(HOSTS), rng.randrange(1000), rng.choice(["pdf", "jpg", "zip"]))
+        elif choice < 0.85:
+            link = "http://%s/calendar/?date=2019-%02d-%02d" % (rng.choice(HOSTS), rng.randint(1, 12), rng.randint(1, 28))
+        elif choice < 0.9:
+            link = "http://%s/%s" % (rng.choice(HOSTS), "/".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))))
+        elif choice < 0.95:
+            link = "http://%s/search?%s" % (rng.choice(HOSTS),
+                                            "&".join("f%d=%d" % (i, rng.randrange(3)) for i in range(rng.randint(1, 8))))
+        else:
+            link = "mailto:%s@uci.edu" % rng.choice(WORDS)
+        links.append(link)
+        if rng.random() < 0.1:
+            links.append(link)
+    return links[:count]
+
+
+def iter_corpus_pages(corpus_dir, limit):
+    """
+    Yields the url, content and content type of up to limit parsable pages of a corpus directory
+    """
+    crawler = Crawler(None, None)
+    count = 0
+    for file_name in sorted(os.listdir(corpus_dir)):
+        if count >= limit:
+            break
+        with open(os.path.join(corpus_dir, file_name), "rb") as corpus_file:
+            data = cbor.load(corpus_file)
+        url_data = {"http_code": data.get(b"http_code", {}).get(b"value"), "content_type": get_content_type(data)}
+        content = data.get(b"raw_content", {}).get(b"value")
+        if content and b"url" in data and crawler.is_parsable(url_data):
+            yield data[b"url"][b"value"].decode("utf-8"), content, url_data["content_type"] or ""
+            count += 1
+
+
+def generate_texts(count, seed=0):
+    """
+    Generates count page-like texts mixing words, numbers, punctuation and non ascii characters
+    """
+    rng = random.Random(seed)
+    vocabulary = WORDS + ["UCI", "ICS-2019", "na\u00efve", "\u212a", "x86_64", "e-mail", "O'Reilly", "\u00e9t\u00e9", "42"]
+    for _ in range(count):
+        yield " ".join(rng.choice(vocabulary) for _ in range(rng.randint(100, 3000))) + rng.choice(["", ".", " Data"])
+
+
+def bench_tokenize(args):
+    """
+    Compares Crawler.word_token_count and the counting of the tokens against the legacy character by character
+    tokenizer, on corpus pages when a corpus is given and on generated texts otherwise. Also counts the pages where both
+    tokenizers disagree (ignoring the case of a token ending the text, see legacy_word_token_count)
+    """
+    if args.corpus:
+        texts = list(iter_corpus_texts(args.corpus, args.pages))
+    else:
+        texts = list(generate_texts(args.pages))
+    crawler = Crawler(None, None)
+
+    start = time.perf_counter()
+    legacy_word_count = {}
+    for text in texts:
+        for token in legacy_word_token_count(text):
+            if token not in Crawler.STOP_WORDS:
+                legacy_word_count[token] = legacy_word_count.get(token, 0) + 1
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for text in texts:
+        crawler.count_words(crawler.word_token_count(text))
+    new_time = time.perf_counter() - start
+
+    mismatches = sum(1 for text in texts
+                     if [token.lower() for token in legacy_word_token_count(text)] != crawler.word_token_count(text))
+    characters = sum(len(text) for text in texts)
+    return {
+        "pages": len(texts),
+        "characters": characters,
+        "legacy_chars_per_sec": characters / legacy_time,
+        "chars_per_sec": characters / new_time,
+        "speedup": legacy_time / new_time,
+        "mismatched_pages": mismatches
+    }
+
+
+def bench_extract(args):
+    """
+    Compares the parsing and link extraction of Crawler.extract_next_links (parse_html, html_links and text_content)
+    against legacy_extract, on the pages of --corpus or of a generated corpus. Counts the pages where the legacy code
+    fails (it can't decode some pages) and, among the others, those where both give different links or tokens
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus_dir = args.corpus
+        if not corpus_dir:
+            corpus_dir = os.path.join(work_dir, "corpus")
+            synthcorpus.generate_corpus(corpus_dir, pages=args.pages, fan_out=args.fan_out, seed=args.seed,
+                                        **args.generator_options)
+        pages = list(iter_corpus_pages(corpus_dir, args.pages))
+    crawler = Crawler(None, None)
+
+    start = time.perf_counter()
+    legacy_results = []
+    for url, content, content_type in pages:
+        try:
+            legacy_results.append(legacy_extract(url, content, content_type))
+        except Exception:
+            legacy_results.append(None)
+    legacy_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    results = []
+    for url, content, content_type in pages:
+        root = crawler.parse_html({"content": content, "content_type": content_type})
+        results.append(([link for _, _, link in crawler.html_links(root, url)], root.text_content()))
+    new_time = time.perf_counter() - start
+
+    compared = [(legacy, new) for legacy, new in zip(legacy_results, results) if legacy is not None]
+    return {
+        "pages": len(pages),
+        "bytes": sum(len(content) for _, content, _ in pages),
+        "legacy_pages_per_sec": len(pages) / legacy_time,
+        "pages_per_sec": len(pages) / new_time,
+        "speedup": legacy_time / new_time,
+        "legacy_failures": len(pages) - len(compared),
+        "mismatched_links": sum(1 for legacy, new in compared if legacy[0] != new[0]),
+        "mismatched_tokens": sum(1 for legacy, new in compared
+                                 if crawler.word_token_count(legacy[1]) != crawler.word_token_count(new[1]))
+    }
+
+
+def bench_read(args):
+    """
+    Compares the read throughput of the loose file corpus (one file per url) and of the same corpus packed into segments
+    by packcorpus, lazily and eagerly decoded: every url of the corpus is fetched and its content read, then fetched
+    again without reading the content (as for the pages that are not parsed). The pages of --corpus are used when given,
+    otherwise a generated corpus of --pages pages. Both layouts are read from the page cache once before being timed, so
+    the results compare the per file overhead rather than the disk
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus_dir = args.corpus
+        if not corpus_dir:
+            corpus_dir = os.path.join(work_dir, "corpus")
+            synthcorpus.generate_corpus(corpus_dir, pages=args.pages, fan_out=args.fan_out, seed=args.seed,
+                                        **args.generator_options)
+        packed_dir = os.path.join(work_dir, "packed")
+        results = {"packing": packcorpus.pack_corpus(corpus_dir, packed_dir)}
+
+        urls = []
+        for file_name in sorted(os.listdir(corpus_dir)):
+            with open(os.path.join(corpus_dir, file_name), "rb") as corpus_file:
+                data = cbor.load(corpus_file)
+            if b"url" in data:
+                urls.append(data[b"url"][b"value"].decode("utf-8"))
+        random.Random(args.seed).shuffle(urls)
+
+        # the manifest of Corpus is written to the working directory
+        previous_dir = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            backends = [("files", lambda lazy: Corpus(corpus_dir, lazy_decode=lazy)),
+                        ("packed", lambda lazy: PackedCorpus(packed_dir, lazy_decode=lazy))]
+            for name, factory in backends:
+                for lazy in (True, False):
+                    corpus = factory(lazy)
+                    for url in urls:
+                        corpus.fetch_url(url)["content"]
+                    start = time.perf_counter()
+                    total = 0
+                    for url in urls:
+                        url_data = corpus.fetch_url(url)
+                        total += len(url_data["content"] or b"")
+                    elapsed = time.perf_counter() - start
+                    start = time.perf_counter()
+                    for url in urls:
+                        corpus.fetch_url(url)["http_code"]
+                    headers_elapsed = time.perf_counter() - start
+                    results["%s_%s" % (name, "lazy" if lazy else "eager")] = {
+                        "pages": len(urls),
+                        "pages_per_sec": len(urls) / elapsed,
+                        "content_bytes_per_sec": total / elapsed,
+                        "headers_only_pages_per_sec": len(urls) / headers_elapsed
+                    }
+        finally:
+            os.chdir(previous_dir)
+    return results
+
+
+def bench_graph(args):
+    """
+    Records a random link graph of --urls pages with --fan-out links each into a LinkGraph, and reports the memory taken
+    by the edges and the time taken by the analytics of the report
+    """
+    rng = random.Random(args.seed)
+    urls = list(generate_urls(args.urls, args.seed))
+    pages = [(url, [urls[rng.randrange(len(urls))] for _ in range(args.fan_out)]) for url in urls]
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    link_graph = LinkGraph()
+    for url, links in pages:
+        link_graph.add_page(url, links)
+    add_time = time.perf_counter() - start
+    # the urls themselves are shared with the pages above, so this is the memory of the ids and the edges
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    results = {"pages": len(urls), "edges": link_graph.edges_count(), "pages_per_sec": len(urls) / add_time,
+               "bytes_per_edge": memory / link_graph.edges_count()}
+    analytics = [("freeze", link_graph.freeze), ("in_degrees", link_graph.in_degrees),
+                 ("out_degrees", link_graph.out_degrees), ("pagerank", link_graph.pagerank),
+                 ("subdomain_connectivity", link_graph.subdomain_connectivity)]
+    for name, analytic in analytics:
+        start = time.perf_counter()
+        analytic()
+        results["%s_time" % name] = time.perf_counter() - start
+    return results
+
+
+def bench_recrawl(args):
+    """
+    Crawls a generated corpus of --pages pages with a RecrawlManifest, rewrites --changed of its files (half of them with
+    new content, half unchanged) and crawls it again with the manifest. Reports both crawl times and checks that the
+    recrawl writes the same report as a crawl without the manifest
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus_dir = os.path.join(work_dir, "corpus")
+        synthcorpus.generate_corpus(corpus_dir, pages=args.pages, fan_out=args.fan_out, seed=args.seed,
+                                    **args.generator_options)
+        previous_dir = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            def crawl(recrawl_manifest, report_name):
+                frontier = Frontier()
+                frontier.add_url(synthcorpus.SEED_URL)
+                crawler = Crawler(frontier, corpus, recrawl_manifest=recrawl_manifest)
+                start = time.perf_counter()
+                crawler.start_crawling()
+                elapsed = time.perf_counter() - start
+                crawler.write_analytics_report_to_file(report_name)
+                with open(report_name) as report_file:
+                    return elapsed, report_file.read()
+
+            corpus = Corpus(corpus_dir)
+            recrawl_manifest = RecrawlManifest(corpus)
+            full_time, _ = crawl(recrawl_manifest, "full.txt")
+
+            rng = random.Random(args.seed)
+            file_names = sorted(os.listdir(corpus_dir))
+            for i, file_name in enumerate(rng.sample(file_names, min(args.changed, len(file_names)))):
+                with open(os.path.join(corpus_dir, file_name), "rb") as corpus_file:
+                    data = cbor.load(corpus_file)
+                content = data[b"raw_content"][b"value"]
+                if i % 2 and isinstance(content, bytes):
+                    data[b"raw_content"][b"value"] = content + b"<p>changed research data</p>"
+                with open(os.path.join(corpus_dir, file_name), "wb") as corpus_file:
+                    cbor.dump(data, corpus_file)
+
+            corpus = Corpus(corpus_dir)
+            recrawl_manifest.corpus = corpus
+            recrawl_manifest.reused = recrawl_manifest.parsed = 0
+            recrawl_time, recrawl_report = crawl(recrawl_manifest, "recrawl.txt")
+            _, report = crawl(None, "reference.txt")
+        finally:
+            os.chdir(previous_dir)
+
+    return {
+        "pages": args.pages,
+        "changed_files": args.changed,
+        "full_crawl_time": full_time,
+        "recrawl_time": recrawl_time,
+        "speedup": full_time / recrawl_time,
+        "reused_pages": recrawl_manifest.reused,
+        "parsed_pages": recrawl_manifest.parsed,
+        "same_report": recrawl_report == report
+    }
+
+
+def bench_validate(args):
+    """
+    Compares Crawler.is_valid_batch against legacy_validate on --pages generated pages of --fan-out outlinks each (use a
+    large --fan-out, e.g. 300, for high fan-out pages), pointing to the urls of a generated corpus among others. Both
+    run with and without the url cache, each with its own crawler whose trap budget is small enough to be used up. The
+    accepted links of every page and the traps identified must be the same
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus_dir = os.path.join(work_dir, "corpus")
+        synthcorpus.generate_corpus(corpus_dir, pages=args.pages, fan_out=10, seed=args.seed, **args.generator_options)
+        corpus_urls = []
+        for file_name in sorted(os.listdir(corpus_dir)):
+            with open(os.path.join(corpus_dir, file_name), "rb") as corpus_file:
+                corpus_urls.append(cbor.load(corpus_file)[b"url"][b"value"].decode("utf-8"))
+        rng = random.Random(args.seed)
+        nav_links = rng.sample(corpus_urls, min(20, len(corpus_urls)))
+        pages = [generate_outlinks(rng, corpus_urls, nav_links, args.fan_out) for _ in range(args.pages)]
+
+        # the manifest of Corpus is written to the working directory
+        previous_dir = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            corpus = Corpus(corpus_dir)
+            results = {"pages": len(pages), "links": sum(len(links) for links in pages)}
+            for cache_name, url_cache_size in (("cached", 50000), ("uncached", 0)):
+                outcomes = {}
+                for name, validate in (("legacy", legacy_validate), ("batch", Crawler.is_valid_batch)):
+                    frontier = Frontier()
+                    crawler = Crawler(frontier, corpus, trap_detector=TrapDetector(budget=20),
+                                      metrics=Metrics(frontier, report_interval=float("inf")),
+                                      url_cache_size=url_cache_size)
+                    accepted_links = []
+                    elapsed = 0.0
+                    for links in pages:
+                        start = time.perf_counter()
+                        accepted = validate(crawler, links)
+                        elapsed += time.perf_counter() - start
+                        accepted_links.append(accepted)
+                        # admitting the links uses up the trap budgets of their templates
+                        for link, file_name in accepted:
+                            if file_name is not None:
+                                crawler.add_to_frontier(link)
+                    outcomes[name] = (accepted_links, list(crawler.identified_traps))
+                    results["%s_%s_links_per_sec" % (name, cache_name)] = results["links"] / elapsed
+                results["%s_speedup" % cache_name] = (results["batch_%s_links_per_sec" % cache_name] /
+                                                      results["legacy_%s_links_per_sec" % cache_name])
+                results["%s_mismatched_pages" % cache_name] = sum(
+                    1 for legacy, batch in zip(outcomes["legacy"][0], outcomes["batch"][0]) if legacy != batch)
+                results["%s_same_traps" % cache_name] = outcomes["legacy"][1] == outcomes["batch"][1]
+            results["accepted_links"] = sum(len(accepted) for accepted in outcomes["batch"][0])
+            results["identified_traps"] = len(outcomes["batch"][1])
+        finally:
+            os.chdir(previous_dir)
+    return results
+
+
+def bench_dedup(args):
+    """
+    Compares memory and throughput of the frontier dedup set implementations: a Python set of url strings and a
+    FingerprintSet. "admits_per_sec" measures what Crawler.add_to_frontier does with every link: a lookup followed by an
+    insertion of the new urls, the fingerprint being computed once for both
+    """
+    num_urls = args.urls
+    results = {}
+    urls = list(generate_urls(num_urls))
+    new_urls = list(generate_urls(num_urls, prefix="new/"))
+    implementations = [("set", set), ("fingerprint", FingerprintSet)]
+    for name, factory in implementations:
+        # the urls are generated while adding, so only the implementations that keep the strings pay for them
+        tracemalloc.start()
+        urls_set = factory()
+        for url in generate_urls(num_urls):
+            urls_set.add(url)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        start = time.perf_counter()
+        urls_set = factory()
+        for url in urls:
+            urls_set.add(url)
+        add_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        admit_set = factory()
+        if isinstance(admit_set, FingerprintSet):
+            for url in urls + urls:
+                fingerprint = url_fingerprint(url)
+                if not admit_set.contains_fingerprint(fingerprint):
+                    admit_set.add_fingerprint(fingerprint)
+        else:
+            for url in urls + urls:
+                if url not in admit_set:
+                    admit_set.add(url)
+        admit_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        duplicates = sum(1 for url in urls if url in urls_set)
+        duplicate_lookup_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        false_positives = sum(1 for url in new_urls if url in urls_set)
+        new_lookup_time = time.perf_counter() - start
+
+        results[name] = {
+            "urls": num_urls,
+            "bytes_per_url": memory / num_urls,
+            "adds_per_sec": num_urls / add_time,
+            "admits_per_sec": 2 * num_urls / admit_time,
+            "duplicate_lookups_per_sec": num_urls / duplicate_lookup_time,
+            "new_lookups_per_sec": num_urls / new_lookup_time,
+            "duplicates_found": duplicates,
+            "observed_false_positives": false_positives,
+            "false_positive_bound": urls_set.false_positive_rate() if isinstance(urls_set, FingerprintSet) else 0.0
+        }
+    return results
+
+
+def bench_crawl(args):
+    """
+    Crawls a corpus end to end with Crawler, Frontier and Corpus, starting from synthcorpus.SEED_URL. A synthetic corpus of
+    --pages pages is generated in a temporary directory unless --corpus is given, with the generator options of
+    synthcorpus (e.g. --encodings, --non-html-ratio or --traps). Reports the crawl throughput, the peak
+    RSS of the process and the statistics of every stage recorded by instrumentation.Metrics. The stage times are
+    inclusive: fetch includes decode and parse includes tokenize. When the corpus is decoded lazily, decode only covers
+    the small fields of a file (reading the content is part of parse)
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        corpus_dir = os.path.abspath(args.corpus) if args.corpus else os.path.join(work_dir, "corpus")
+        results = {}
+        if not args.corpus:
+            start = time.perf_counter()
+            results["corpus"] = synthcorpus.generate_corpus(corpus_dir, pages=args.pages, fan_out=args.fan_out,
+                                                            seed=args.seed, **args.generator_options)
+            results["generation_time"] = time.perf_counter() - start
+
+        # the crawl state files (manifest, frontier) are written to the working directory
+        previous_dir = os.getcwd()
+        os.chdir(work_dir)
+        try:
+            frontier = Frontier()
+            frontier.add_url(synthcorpus.SEED_URL)
+            start = time.perf_counter()
+            corpus = Corpus(corpus_dir, lazy_decode=not args.eager_decode)
+            manifest_time = time.perf_counter() - start
+            metrics = Metrics(frontier, report_interval=float("inf"))
+            crawler = Crawler(frontier, corpus, metrics=metrics)
+            corpus.metrics = metrics
+
+            start = time.perf_counter()
+            crawler.start_crawling()
+            crawl_time = time.perf_counter() - start
+            start = time.perf_counter()
+            crawler.write_analytics_report_to_file(os.path.join(work_dir, "report.txt"))
+            report_time = time.perf_counter() - start
+        finally:
+            os.chdir(previous_dir)
+
+    trap_pages = defaultdict(int)
+    for url in crawler.download_urls:
+        path = urlparse(url).path
+        for family, prefix in (("calendar", "/calendar"), ("repeated", "/repeat/"), ("query", "/search")):
+            if path.startswith(prefix):
+                trap_pages[family] += 1
+    results.update({
+        "pages_crawled": frontier.fetched,
+        "crawl_time": crawl_time,
+        "pages_per_sec": frontier.fetched / crawl_time,
+        # ru_maxrss is in kilobytes on Linux; it covers the whole process, corpus generation included
+        "peak_rss_bytes": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+        "manifest_time": manifest_time,
+        "report_time": report_time,
+        "stages": metrics.summary()["stages"],
+        "counters": dict(metrics.counters),
+        "crawled_trap_pages": dict(trap_pages),
+        "identified_traps": len(crawler.identified_traps)
+    })
+    return results
+
+
+BENCHMARKS = {
+    "crawl": bench_crawl,
+    "dedup": bench_dedup,
+    "extract": bench_extract,
+    "graph": bench_graph,
+    "read": bench_read,
+    "recrawl": bench_recrawl,
+    "tokenize": bench_tokenize,
+    "validate": bench_validate
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawler micro benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--urls", type=int, default=200000, help="number of urls to use")
+    parser.add_argument("--pages", type=int, default=500, help="number of pages to use")
+    parser.add_argument("--corpus", help="corpus directory to read pages from instead of generating them")
+    parser.add_argument("--fan-out", type=int, default=10, help="average number of links per generated page")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the generated corpus")
+    # the other settings of the generated corpus, see synthcorpus.generate_corpus
+    synthcorpus.add_generator_arguments(parser)
+    parser.add_argument("--changed", type=int, default=50, help="number of corpus files rewritten before a recrawl")
+    parser.add_argument("--eager-decode", action="store_true", help="decode whole corpus files upfront")
+    parser.add_argument("--output", help="json file to write the results to")
+    args = parser.parse_args()
+    try:
+        args.generator_options = synthcorpus.generator_options(args)
+    except ValueError as error:
+        parser.error(str(error))
+
+    results = BENCHMARKS[args.benchmark](args)
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent=2)
@@ -0,0 +1,156 @@
+import json
+import time
+from collections import Counter
+
+from scheduler import url_host
+
+
+class CrawlBudget:
+    """
+    This class holds the limits a crawl is stopped or pruned by, each one being disabled when None:
+
+    - max_subdomain_pages: the number of urls admitted into the frontier per subdomain (the seed is not counted)
+    - max_depth: the largest link depth of an admitted url, the seed having a depth of 0
+    - max_fetches: the number of urls fetched, resumed crawls included
+    - max_seconds: the wall-clock time of this run of the crawl
+    - min_new_url_rate: the crawl stops when a window of rate_window pages adds fewer new urls per page than that
+
+    The first two are checked for every link (see admit) and the links over them are skipped, the others are checked before
+    every fetch (see check_stop). The budgets that fired are reported by report.
+
+    A resumed crawl (see get_state, and Frontier.save_frontier without a checkpoint) carries on with the admitted,
+    skipped and window counts of the previous runs, but starts with no fired budget: fired only describes the budgets
+    that fired during this run, e.g. the max_fetches that stopped the previous run is not reported again.
+
+    Attributes:
+        subdomain_pages: the number of urls admitted per subdomain
+        skipped: the number of links skipped by each pruning budget
+        fired: a description of every budget that fired during this run, by name
+        page_subdomain_pages, page_skipped, page_window: the same, and the window counts after the current page (see
+            start_page)
+    """
+
+    LIMITS = ("max_subdomain_pages", "max_depth", "max_fetches", "max_seconds", "min_new_url_rate", "rate_window")
+
+    def __init__(self, max_subdomain_pages=None, max_depth=None, max_fetches=None, max_seconds=None,
+                 min_new_url_rate=None, rate_window=1000):
+        self.max_subdomain_pages = max_subdomain_pages
+        self.max_depth = max_depth
+        self.max_fetches = max_fetches
+        self.max_seconds = max_seconds
+        self.min_new_url_rate = min_new_url_rate
+        self.rate_window = rate_window
+        self.subdomain_pages = Counter()
+        self.skipped = Counter()
+        self.fired = {}
+        self.start_time = time.perf_counter()
+        # pages crawled and urls they added in the current window of the diminishing returns rule
+        self.window_pages = 0
+        self.window_new_urls = 0
+        self.start_page()
+
+    @classmethod
+    def from_config(cls, file_name):
+        """
+        Returns the budget described by a JSON file holding an object whose keys are among LIMITS
+        """
+        with open(file_name) as config_file:
+            config = json.load(config_file)
+        unknown = set(config) - set(cls.LIMITS)
+        if unknown:
+            raise ValueError("unknown budget settings in %s: %s" % (file_name, ", ".join(sorted(unknown))))
+        return cls(**config)
+
+    def is_enabled(self):
+        return any(getattr(self, limit) is not None for limit in self.LIMITS if limit != "rate_window")
+
+    def start(self):
+        """
+        Starts the clock of max_seconds
+        """
+        self.start_time = time.perf_counter()
+
+    def start_page(self):
+        """
+        Starts tracking the changes made while crawling a new page
+        """
+        self.page_subdomain_pages = Counter()
+        self.page_skipped = Counter()
+        # filled in by page_done, which is only called once the page state has been taken
+        self.page_window = {}
+
+    def admit(self, url, depth):
+        """
+        Returns True if a link of the given depth can be added to the frontier. Adding it must be reported to admitted
+        """
+        if self.max_depth is not None and depth > self.max_depth:
+            self.skip("max_depth", "skipped the links deeper than %s" % self.max_depth)
+            return False
+        if self.max_subdomain_pages is not None and self.subdomain_pages[url_host(url)] >= self.max_subdomain_pages:
+            self.skip("max_subdomain_pages", "skipped the links to subdomains having %s urls" % self.max_subdomain_pages)
+            return False
+        return True
+
+    def admitted(self, url):
+        if self.max_subdomain_pages is not None:
+            host = url_host(url)
+            self.subdomain_pages[host] += 1
+            self.page_subdomain_pages[host] += 1
+
+    def skip(self, budget, description):
+        self.skipped[budget] += 1
+        self.page_skipped[budget] += 1
+        self.fired.setdefault(budget, description)
+
+    def page_done(self, new_urls):
+        """
+        Counts a crawled page and the number of urls it added to the frontier
+        """
+        self.window_pages += 1
+        self.window_new_urls += new_urls
+        self.page_window.update(pages=self.window_pages, new_urls=self.window_new_urls)
+
+    def check_stop(self, frontier):
+        """
+        Returns the description of the budget that requires the crawl to stop, None if it can go on
+        """
+        reason = None
+        if self.max_fetches is not None and frontier.fetched >= self.max_fetches:
+            reason = "max_fetches", "fetched %s urls" % frontier.fetched
+        elif self.max_seconds is not None and time.perf_counter() - self.start_time >= self.max_seconds:
+            reason = "max_seconds", "crawled for %s seconds" % self.max_seconds
+        elif self.min_new_url_rate is not None and self.window_pages >= self.rate_window:
+            rate = self.window_new_urls / self.window_pages
+            self.window_pages = self.window_new_urls = 0
+            if rate < self.min_new_url_rate:
+                reason = "min_new_url_rate", "the last %s pages added %.3f new urls per page" % (self.rate_window, rate)
+        if reason is None:
+            return None
+        self.fired[reason[0]] = reason[1]
+        return "%s: %s" % reason
+
+    def report(self):
+        return {
+            "limits": {limit: getattr(self, limit) for limit in self.LIMITS if getattr(self, limit) is not None and
+                       (limit != "rate_window" or self.min_new_url_rate is not None)},
+            "fired": self.fired,
+            "skipped_links": dict(self.skipped)
+        }
+
+    def get_state(self):
+        return {"subdomain_pages": self.subdomain_pages, "skipped": self.skipped,
+                "window": {"pages": self.window_pages, "new_urls": self.window_new_urls}}
+
+    def get_page_state(self):
+        return {"subdomain_pages": self.page_subdomain_pages, "skipped": self.page_skipped, "window": self.page_window}
+
+    def merge_state(self, state):
+        """
+        Merges the state of another budget (see get_state and get_page_state) into this one. The counts are summed and
+        the window counts, which are not per page, are replaced
+        """
+        self.subdomain_pages.update(state["subdomain_pages"])
+        self.skipped.update(state["skipped"])
+        if state.get("window"):
+            self.window_pages = state["window"]["pages"]
+            self.window_new_urls = state["window"]["new_urls"]
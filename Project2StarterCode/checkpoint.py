@@ -0,0 +1,182 @@
+import logging
+import os
+import pickle
+
+from analytics import SpilledList
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointJournal:
+    """
+    This class makes the state of a crawl (frontier and crawler analytics) crash safe. Every crawled page is appended to
+    a journal as a single record holding the popped url, the urls it added to the frontier and the analytics it produced.
+    Once the journal grows larger than the last snapshot, the whole state is compacted into a new snapshot and the
+    journal is emptied, so the cost of checkpointing stays proportional to the work done since the last checkpoint.
+
+    Attributes:
+        frontier: the frontier being checkpointed
+        crawler: the crawler being checkpointed
+        fsync: whether every journal record is fsync'ed (survives power loss, not only a killed process)
+        min_journal_size: the journal is never compacted before reaching this many bytes
+    """
+
+    # File names to be used when loading and saving the checkpoint
+    CHECKPOINT_DIR_NAME = "checkpoint_state"
+    SNAPSHOT_FILE_NAME = os.path.join(".", CHECKPOINT_DIR_NAME, "snapshot.pkl")
+    JOURNAL_FILE_NAME = os.path.join(".", CHECKPOINT_DIR_NAME, "journal.pkl")
+
+    def __init__(self, frontier, crawler=None, fsync=False, min_journal_size=1 << 20):
+        self.frontier = frontier
+        self.crawler = crawler
+        self.fsync = fsync
+        self.min_journal_size = min_journal_size
+        self.snapshot_size = 0
+        # incremented on every snapshot; the journal starts with the generation of the snapshot it applies to
+        self.generation = 0
+        self.journal_file = None
+
+    def restore(self):
+        """
+        Loads the last snapshot and replays the journal on top of it. The frontier and crawler are expected to be empty.
+        A partially written record at the end of the journal (the process was killed while writing it) is dropped.
+        :return: True if a previous checkpoint was found, otherwise False
+        """
+        if not os.path.isfile(self.SNAPSHOT_FILE_NAME) and not os.path.isfile(self.JOURNAL_FILE_NAME):
+            return False
+
+        if os.path.isfile(self.SNAPSHOT_FILE_NAME):
+            with open(self.SNAPSHOT_FILE_NAME, "rb") as snapshot_file:
+                snapshot = pickle.load(snapshot_file)
+                for key in snapshot.get("spilled_lists", ()):
+                    snapshot["crawl_state"][key] = self.read_spilled_list(snapshot_file)
+            if self.frontier.depths is not None:
+                self.frontier.set_depths(snapshot.get("depths") or {})
+            self.frontier.set_queue(snapshot["urls_queue"])
+            self.frontier.urls_set = snapshot["urls_set"]
+            self.frontier.fetched = snapshot["fetched"]
+            self.crawler.merge_crawl_state(snapshot["crawl_state"])
+            self.generation = snapshot["generation"]
+            self.snapshot_size = os.path.getsize(self.SNAPSHOT_FILE_NAME)
+
+        replayed = 0
+        if os.path.isfile(self.JOURNAL_FILE_NAME):
+            with open(self.JOURNAL_FILE_NAME, "r+b") as journal_file:
+                try:
+                    generation = pickle.load(journal_file)
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    generation = None
+                # a journal from an older generation was already compacted into the snapshot, the process stopped
+                # before it could be emptied
+                valid_size = journal_file.tell() if generation == self.generation else 0
+                while generation == self.generation:
+                    try:
+                        url, added_urls, page_state = pickle.load(journal_file)
+                    except (EOFError, pickle.UnpicklingError, ValueError):
+                        break
+                    self.replay_page(url, added_urls, page_state)
+                    valid_size = journal_file.tell()
+                    replayed += 1
+                journal_file.truncate(valid_size)
+            if valid_size == 0:
+                os.remove(self.JOURNAL_FILE_NAME)
+
+        logger.info("Restored checkpoint (%s journal records). Fetched: %s, Queue size: %s", replayed,
+                    self.frontier.fetched, len(self.frontier))
+        return True
+
+    def replay_page(self, url, added_urls, page_state):
+        next_url = self.frontier.get_next_url()
+        if next_url != url:
+            logger.warning("Journal is out of sync with the snapshot: expected %s, got %s", url, next_url)
+        depth = self.frontier.pop_depth(next_url)
+        for added_url in added_urls:
+            self.frontier.add_url(added_url, depth + 1)
+        self.crawler.merge_crawl_state(page_state)
+
+    def record_page(self, url, added_urls, page_state):
+        """
+        Appends a crawled page to the journal and compacts the journal into a snapshot when it has grown too large
+        :param url: the url that was popped from the frontier
+        :param added_urls: the urls that were added to the frontier while crawling it
+        :param page_state: the analytics produced by the page, as returned in Crawler.last_page_state
+        """
+        if self.journal_file is None:
+            if not os.path.exists(self.CHECKPOINT_DIR_NAME):
+                os.makedirs(self.CHECKPOINT_DIR_NAME)
+            self.open_journal("ab")
+
+        pickle.dump((url, added_urls, page_state), self.journal_file, pickle.HIGHEST_PROTOCOL)
+        self.journal_file.flush()
+        if self.fsync:
+            os.fsync(self.journal_file.fileno())
+
+        if self.journal_file.tell() > max(self.min_journal_size, self.snapshot_size):
+            self.snapshot()
+
+    def snapshot(self):
+        """
+        Writes the full state to a new snapshot and empties the journal
+        """
+        if not os.path.exists(self.CHECKPOINT_DIR_NAME):
+            os.makedirs(self.CHECKPOINT_DIR_NAME)
+
+        crawl_state = dict(self.crawler.get_crawl_state())
+        # the spilled lists are written after the rest of the state, a chunk at a time, so that they are never loaded
+        # into memory as a whole
+        spilled_lists = {key: crawl_state.pop(key) for key, value in list(crawl_state.items())
+                         if isinstance(value, SpilledList)}
+        temp_file_name = self.SNAPSHOT_FILE_NAME + ".tmp"
+        with open(temp_file_name, "wb") as snapshot_file:
+            pickle.dump({
+                "urls_queue": self.frontier.urls_queue,
+                "urls_set": self.frontier.urls_set,
+                "fetched": self.frontier.fetched,
+                "depths": self.frontier.depths,
+                "crawl_state": crawl_state,
+                "spilled_lists": list(spilled_lists),
+                "generation": self.generation + 1
+            }, snapshot_file, pickle.HIGHEST_PROTOCOL)
+            for spilled_list in spilled_lists.values():
+                self.write_spilled_list(spilled_list, snapshot_file)
+            snapshot_file.flush()
+            os.fsync(snapshot_file.fileno())
+        # the snapshot only replaces the previous one once it is complete, and the journal is only emptied after that
+        os.replace(temp_file_name, self.SNAPSHOT_FILE_NAME)
+        self.snapshot_size = os.path.getsize(self.SNAPSHOT_FILE_NAME)
+        self.generation += 1
+
+        if self.journal_file is not None:
+            self.journal_file.close()
+        self.open_journal("wb")
+        logger.info("Saved checkpoint snapshot. Fetched: %s, Queue size: %s", self.frontier.fetched, len(self.frontier))
+
+    @staticmethod
+    def write_spilled_list(spilled_list, snapshot_file):
+        """
+        Writes the items of a SpilledList as one pickle per chunk, followed by None
+        """
+        for chunk in spilled_list.chunks():
+            pickle.dump(chunk, snapshot_file, pickle.HIGHEST_PROTOCOL)
+        pickle.dump(None, snapshot_file, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def read_spilled_list(snapshot_file):
+        """
+        Reads a list written by write_spilled_list into a new SpilledList
+        """
+        spilled_list = SpilledList()
+        for chunk in iter(lambda: pickle.load(snapshot_file), None):
+            spilled_list.extend(chunk)
+        return spilled_list
+
+    def open_journal(self, mode):
+        self.journal_file = open(self.JOURNAL_FILE_NAME, mode)
+        if self.journal_file.tell() == 0:
+            pickle.dump(self.generation, self.journal_file, pickle.HIGHEST_PROTOCOL)
+            self.journal_file.flush()
+
+    def close(self):
+        if self.journal_file is not None:
+            self.journal_file.close()
+            self.journal_file = None
@@ -1,43 +1,174 @@
 import hashlib
+import logging
+import mmap
 import os
-from urllib.parse import urlparse
+import pickle
+import threading
+import time
+from collections.abc import MutableMapping
 
 from cbor import cbor
 
+import lazycbor
+from instrumentation import NullMetrics
+from urlnorm import corpus_key
+
+logger = logging.getLogger(__name__)
+
 
 class Corpus:
     """
     This class is responsible for handling corpus related functionalities like mapping a url to its local file name
     """
 
-    def __init__(self, corpus_base_dir):
+    # File name to be used when loading and saving the corpus manifest
+    MANIFEST_DIR_NAME = "corpus_state"
+    MANIFEST_FILE_NAME = os.path.join(".", MANIFEST_DIR_NAME, "manifest.pkl")
+    # Number of lookups between two checks of the corpus directory for changes
+    MANIFEST_CHECK_INTERVAL = 10000
+    # Size from which corpus files are memory-mapped when decoding lazily, smaller ones are cheaper to read whole
+    MMAP_MIN_SIZE = 1 << 20
+
+    def __init__(self, corpus_base_dir, use_manifest=True, lazy_decode=True):
         self.corpus_base_dir = os.path.join(corpus_base_dir, "")
+        #when True, fetch_url only decodes the small fields of a file and returns a CorpusResponse
+        self.lazy_decode = lazy_decode
+        # digests of the files in the corpus, stored as raw 28 byte sha224 digests. Files whose name is not a sha224 hex
+        # digest are kept as strings in manifest_names. None when the manifest is disabled
+        self.manifest = None
+        self.manifest_names = None
+        self.manifest_mtime = None
+        self.lookups_since_check = 0
+        # held while the manifest is checked and rebuilt, which the prefetch threads of PipelinedCrawler may do at the
+        # same time
+        self.manifest_lock = threading.Lock()
+        #records the time spent decoding corpus files, see instrumentation.Metrics
+        self.metrics = NullMetrics()
+        if use_manifest:
+            self.load_manifest()
 
-    def get_file_name(self, url):
+    def load_manifest(self):
         """
-        Given a url, this method looks up for a local file in the corpus and, if existed, returns the file address. Otherwise
-        returns None
+        Loads the manifest of the corpus files from the on-disk cache if it is still up to date with the corpus directory,
+        otherwise builds it by listing the directory and saves it for the next run
         """
+        corpus_dir = os.path.abspath(self.corpus_base_dir)
+        mtime = os.stat(corpus_dir).st_mtime_ns
+        if os.path.isfile(self.MANIFEST_FILE_NAME):
+            try:
+                with open(self.MANIFEST_FILE_NAME, "rb") as manifest_file:
+                    cached = pickle.load(manifest_file)
+                if cached["corpus_dir"] == corpus_dir and cached["mtime"] == mtime:
+                    self.manifest = cached["digests"]
+                    self.manifest_names = cached["names"]
+                    self.manifest_mtime = mtime
+                    logger.info("Loaded corpus manifest with %s files", len(self.manifest) + len(self.manifest_names))
+                    return
+            except Exception:
+                pass
 
-        pd = urlparse(url)
-        if pd.path:
-            path = pd.path[:-1] if pd.path[-1] == "/" else pd.path
-        else:
-            path = ""
-        url = pd.netloc + path + (("?" + pd.query) if pd.query else "")
+        self.build_manifest()
+        if not os.path.exists(self.MANIFEST_DIR_NAME):
+            os.makedirs(self.MANIFEST_DIR_NAME)
+        # written to a temporary file first so that a crash (or another crawler process) never sees a partial manifest
+        temp_file_name = "%s.%s.tmp" % (self.MANIFEST_FILE_NAME, os.getpid())
+        with open(temp_file_name, "wb") as manifest_file:
+            pickle.dump({"corpus_dir": corpus_dir, "mtime": self.manifest_mtime, "digests": self.manifest,
+                         "names": self.manifest_names}, manifest_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file_name, self.MANIFEST_FILE_NAME)
+
+    def build_manifest(self):
+        """
+        Builds the manifest by listing the corpus directory
+        """
+        # the mtime is read before listing, so a change made while listing invalidates the manifest on the next check
+        mtime = os.stat(self.corpus_base_dir).st_mtime_ns
+        # the sets are only published once complete, lookups made meanwhile by other threads use the previous ones
+        manifest = set()
+        manifest_names = set()
+        with os.scandir(self.corpus_base_dir) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                try:
+                    digest = bytes.fromhex(entry.name) if len(entry.name) == 56 else None
+                except ValueError:
+                    digest = None
+                if digest is None:
+                    manifest_names.add(entry.name)
+                else:
+                    manifest.add(digest)
+        self.manifest, self.manifest_names, self.manifest_mtime = manifest, manifest_names, mtime
+        logger.info("Built corpus manifest with %s files", len(self.manifest) + len(self.manifest_names))
+
+    def check_manifest(self):
+        """
+        Rebuilds the manifest if files were added to or removed from the corpus directory since it was built. Only one
+        thread checks at a time, the others wait for it and find the manifest up to date
+        """
+        with self.manifest_lock:
+            self.lookups_since_check = 0
+            if os.stat(self.corpus_base_dir).st_mtime_ns != self.manifest_mtime:
+                logger.info("Corpus directory changed, rebuilding the manifest ...")
+                self.load_manifest()
+
+    def in_manifest(self, hashed_link):
+        self.lookups_since_check += 1
+        if self.lookups_since_check >= self.MANIFEST_CHECK_INTERVAL:
+            self.check_manifest()
+
+        if len(hashed_link) == 56:
+            try:
+                return bytes.fromhex(hashed_link) in self.manifest
+            except ValueError:
+                pass
+        return hashed_link in self.manifest_names
+
+    def hash_url(self, url):
+        """
+        Returns the name of the corpus file of a url: the sha224 hex digest of its corpus key
+        """
+        url = corpus_key(url)
 
         try:
-            hashed_link = hashlib.sha224(url).hexdigest()
+            return hashlib.sha224(url).hexdigest()
         except (UnicodeEncodeError, TypeError):
             try:
-                hashed_link = hashlib.sha224(url.encode("utf-8")).hexdigest()
+                return hashlib.sha224(url.encode("utf-8")).hexdigest()
             except UnicodeEncodeError:
-                hashed_link = str(hash(url))
+                return str(hash(url))
+
+    def get_file_name(self, url):
+        """
+        Given a url, this method looks up for a local file in the corpus and, if existed, returns the file address. Otherwise
+        returns None
+        """
+
+        hashed_link = self.hash_url(url)
+
+        if self.manifest is not None:
+            if self.in_manifest(hashed_link):
+                return os.path.join(self.corpus_base_dir, hashed_link)
+            return None
 
         if os.path.exists(os.path.join(self.corpus_base_dir, hashed_link)):
             return os.path.join(self.corpus_base_dir, hashed_link)
         return None
 
+    def file_signature(self, url):
+        """
+        Returns the (mtime in ns, size) of the corpus file of a url, which change whenever the file is rewritten. None if
+        the url is not in the corpus
+        """
+        file_name = self.get_file_name(url)
+        if file_name is None:
+            return None
+        try:
+            stat = os.stat(file_name)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
     def fetch_url(self, url):
         """
         This method, using the given url, should find the corresponding file in the corpus and return a dictionary representing
@@ -57,36 +188,274 @@ class Corpus:
 
         file_name = self.get_file_name(url)
         if file_name is None:
-            url_data = {
-                "url": url,
-                "content": None,
-                "http_code": 404,
-                "headers": None,
-                "size": 0,
-                "content_type": None,
-                "is_redirected": False,
-                "final_url": None
-            }
-        else:
-            data_dict = cbor.load(open(file_name, "rb"))
-
-            def get_content_type(data):
-                if b'http_headers' not in data: return None
-
-                hlist = data_dict[b"http_headers"][b'value']
-                for header in hlist:
-                    if header[b'k'][b'value'] == b'Content-Type':
-                        return str(header[b'v'][b'value'])
-                return None
-
-            url_data = {
-                "url": url,
-                "content": data_dict[b'raw_content'][b'value'] if b'raw_content' in data_dict and b'value' in data_dict[b'raw_content'] else "",
-                "http_code": int(data_dict[b"http_code"][b'value']),
-                "content_type": get_content_type(data_dict),
-                "size": os.stat(file_name).st_size,
-                "is_redirected": data_dict[b'is_redirected'][b'value'] if b'is_redirected' in data_dict and b'value' in data_dict[b'is_redirected'] else False,
-                "final_url": data_dict[b'final_url'][b'value'] if b'final_url' in data_dict and b'value' in data_dict[b'final_url'] else None
-            }
+            return not_found_response(url)
+
+        start = time.perf_counter()
+        with open(file_name, "rb") as corpus_file:
+            size = os.fstat(corpus_file.fileno()).st_size
+            if size == 0:
+                # an empty (e.g. truncated) file holds no response
+                return not_found_response(url)
+            if self.lazy_decode:
+                url_data = self.read_response(url, corpus_file, size)
+            else:
+                url_data = response_from_dict(url, cbor.load(corpus_file), size)
+        self.metrics.record("decode", time.perf_counter() - start)
+
+        return url_data
+
+    def __getstate__(self):
+        # locks can't be pickled, the processes of ParallelCrawler get a lock of their own
+        state = self.__dict__.copy()
+        del state["manifest_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.manifest_lock = threading.Lock()
+
+    def read_response(self, url, corpus_file, size):
+        """
+        Reads the response stored in an open corpus file of size bytes without decoding its raw content: the small fields
+        are decoded and the raw content is only located. It is copied out of the file if the "content" key of the returned
+        CorpusResponse is accessed. Files of at least MMAP_MIN_SIZE bytes are memory-mapped, so that their content is not
+        read from disk unless it is accessed
+        """
+        if size < self.MMAP_MIN_SIZE:
+            return read_lazy_response(url, corpus_file.read(), 0, size, close_buffer=False)
+        buffer = mmap.mmap(corpus_file.fileno(), 0, access=mmap.ACCESS_READ)
+        return read_lazy_response(url, buffer, 0, size, close_buffer=True)
+
+
+class PackedCorpus(Corpus):
+    """
+    A Corpus reading the segment files written by packcorpus.pack_corpus instead of one file per url. The segments hold
+    the corpus files back to back and an index maps the digest of every file name to its (segment, offset, length), so
+    a lookup is a dictionary access and a read decodes the record where it lies in a memory-mapped segment: no directory
+    lookup, open or stat per page. Lazy reads only copy the raw content out if it is accessed, eager reads copy the
+    decoded values (not the record itself). The segments stay mapped for the lifetime of the corpus.
+    """
+
+    INDEX_FILE_NAME = "index.pkl"
+    SEGMENT_FILE_NAME = "segment-%05d.dat"
+
+    def __init__(self, packed_dir, lazy_decode=True):
+        super().__init__(packed_dir, use_manifest=False, lazy_decode=lazy_decode)
+        with open(os.path.join(self.corpus_base_dir, self.INDEX_FILE_NAME), "rb") as index_file:
+            index = pickle.load(index_file)
+        self.segment_names = index["segments"]
+        # (segment, offset, length) of every file, by raw sha224 digest or, for the other file names, by name
+        self.index = index["digests"]
+        self.index_names = index["names"]
+        self.segments = None
+        self.open_segments()
+        logger.info("Loaded packed corpus index with %s files in %s segments",
+                    len(self.index) + len(self.index_names), len(self.segment_names))
+
+    def open_segments(self):
+        self.segments = []
+        self.segment_mtimes = []
+        for segment_name in self.segment_names:
+            with open(os.path.join(self.corpus_base_dir, segment_name), "rb") as segment_file:
+                self.segments.append(mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ))
+                self.segment_mtimes.append(os.fstat(segment_file.fileno()).st_mtime_ns)
+
+    def locate(self, url):
+        """
+        Returns the (segment, offset, length) of the corpus file of a url, None if it is not in the corpus
+        """
+        hashed_link = self.hash_url(url)
+        if len(hashed_link) == 56:
+            try:
+                return self.index.get(bytes.fromhex(hashed_link))
+            except ValueError:
+                pass
+        return self.index_names.get(hashed_link)
+
+    def get_file_name(self, url):
+        """
+        Returns the name the corpus file of a url had before packing, None if it is not in the corpus
+        """
+        if self.locate(url) is None:
+            return None
+        return os.path.join(self.corpus_base_dir, self.hash_url(url))
+
+    def file_signature(self, url):
+        """
+        Returns the (mtime in ns of its segment, size) of the corpus file of a url, None if the url is not in the corpus
+        """
+        location = self.locate(url)
+        if location is None:
+            return None
+        return self.segment_mtimes[location[0]], location[2]
+
+    def fetch_url(self, url):
+        """
+        Returns the same dictionary as Corpus.fetch_url
+        """
+        location = self.locate(url)
+        if location is None:
+            return not_found_response(url)
 
+        segment, offset, length = location
+        if length == 0:
+            # an empty corpus file holds no response, see Corpus.fetch_url
+            return not_found_response(url)
+        start = time.perf_counter()
+        if self.lazy_decode:
+            url_data = read_lazy_response(url, self.segments[segment], offset, length, close_buffer=False)
+        else:
+            # decoded from a view of the mapping rather than a slice of it, which would copy the record first. The views
+            # are released right away, a segment can't be closed while they exist
+            with memoryview(self.segments[segment]) as segment_view, segment_view[offset:offset + length] as record:
+                url_data = response_from_dict(url, cbor.loads(record), length)
+        self.metrics.record("decode", time.perf_counter() - start)
         return url_data
+
+    def __getstate__(self):
+        # the mappings are reopened when unpickled, e.g. in the processes of ParallelCrawler
+        state = super().__getstate__()
+        state["segments"] = None
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self.open_segments()
+
+
+def not_found_response(url):
+    """
+    Returns the response to a url missing from the corpus
+    """
+    return {
+        "url": url,
+        "content": None,
+        "http_code": 404,
+        "headers": None,
+        "size": 0,
+        "content_type": None,
+        "is_redirected": False,
+        "final_url": None
+    }
+
+
+def response_from_dict(url, data_dict, size):
+    """
+    Returns the response stored in a decoded corpus file of size bytes
+    """
+    return {
+        "url": url,
+        "content": data_dict[b'raw_content'][b'value'] if b'raw_content' in data_dict and b'value' in data_dict[b'raw_content'] else "",
+        "http_code": int(data_dict[b"http_code"][b'value']),
+        "content_type": get_content_type(data_dict),
+        "size": size,
+        "is_redirected": data_dict[b'is_redirected'][b'value'] if b'is_redirected' in data_dict and b'value' in data_dict[b'is_redirected'] else False,
+        "final_url": data_dict[b'final_url'][b'value'] if b'final_url' in data_dict and b'value' in data_dict[b'final_url'] else None
+    }
+
+
+def read_lazy_response(url, buffer, offset, size, close_buffer):
+    """
+    Decodes the small fields of the corpus file stored at offset in a buffer and locates its raw content, see
+    Corpus.read_response. With close_buffer, the buffer belongs to the returned CorpusResponse, which closes it once the
+    content is read
+    """
+    data_dict, lazy_values, _ = lazycbor.decode_map(buffer, offset, lazy_keys=(b'raw_content',))
+    content_span = None
+    content = ""
+    if b'raw_content' in lazy_values:
+        raw_content, content_values, _ = lazycbor.decode_map(buffer, lazy_values[b'raw_content'], lazy_keys=(b'value',))
+        if b'value' in content_values:
+            content_span = lazycbor.byte_string_span(buffer, content_values[b'value'])
+            if content_span is None:
+                content = lazycbor.decode(buffer, content_values[b'value'])[0]
+
+    url_data = {
+        "url": url,
+        "http_code": int(data_dict[b"http_code"][b'value']),
+        "content_type": get_content_type(data_dict),
+        "size": size,
+        "is_redirected": data_dict[b'is_redirected'][b'value'] if b'is_redirected' in data_dict and b'value' in data_dict[b'is_redirected'] else False,
+        "final_url": data_dict[b'final_url'][b'value'] if b'final_url' in data_dict and b'value' in data_dict[b'final_url'] else None
+    }
+    if content_span is None:
+        url_data["content"] = content
+        if close_buffer:
+            buffer.close()
+        return CorpusResponse(url_data, None, None)
+    return CorpusResponse(url_data, buffer, content_span, close_buffer)
+
+
+def get_content_type(data_dict):
+    """
+    Returns the Content-Type header of a decoded corpus file, None if it has none
+    """
+    if b'http_headers' not in data_dict: return None
+
+    hlist = data_dict[b"http_headers"][b'value']
+    for header in hlist:
+        if header[b'k'][b'value'] == b'Content-Type':
+            return str(header[b'v'][b'value'])
+    return None
+
+
+class CorpusResponse(MutableMapping):
+    """
+    The dictionary returned by Corpus.fetch_url when decoding lazily. Every key is available right away except "content",
+    which is copied out of the bytes of the corpus file (read whole or memory-mapped) the first time it is accessed. Pages that are never parsed
+    (errors, non html content) therefore never have their content read from disk
+    """
+
+    def __init__(self, url_data, buffer, content_span, close_buffer=True):
+        self.url_data = url_data
+        #the bytes or memory-mapped file and the (start, end) offsets of the content in it, None once the content is loaded
+        self.buffer = buffer
+        self.content_span = content_span
+        #False when the buffer is not a mapping of its own (bytes, or a segment of a PackedCorpus shared with other
+        #responses) and must not be closed
+        self.close_buffer = close_buffer
+
+    def load_content(self):
+        """
+        Copies the raw content out of the buffer, and releases it
+        """
+        if self.buffer is None:
+            return
+        start, end = self.content_span
+        self.url_data["content"] = self.buffer[start:end]
+        self.release()
+
+    def release(self):
+        if self.buffer is not None:
+            if self.close_buffer:
+                self.buffer.close()
+            self.buffer = None
+
+    def __getitem__(self, key):
+        if key == "content":
+            self.load_content()
+        return self.url_data[key]
+
+    def __setitem__(self, key, value):
+        if key == "content":
+            self.release()
+        self.url_data[key] = value
+
+    def __delitem__(self, key):
+        if key == "content" and self.buffer is not None:
+            self.release()
+            return
+        del self.url_data[key]
+
+    def __iter__(self):
+        self.load_content()
+        return iter(self.url_data)
+
+    def __len__(self):
+        return len(self.url_data) + (1 if self.buffer is not None else 0)
+
+    def __contains__(self, key):
+        return key in self.url_data or (key == "content" and self.buffer is not None)
+
+    def __repr__(self):
+        return "CorpusResponse(%r)" % self.url_data
@@ -1,8 +1,17 @@
+import codecs
+import heapq
 import logging
 import re
-from urllib.parse import urlparse, parse_qs , urlunparse
+from urllib.parse import urljoin, urlparse, parse_qs , urlunparse
 from lxml import etree, html
-from collections import defaultdict
+from lxml.html import defs
+from collections import defaultdict, Counter
+
+from analytics import SpilledList, TopKCounter
+from fingerprint import url_fingerprint
+from instrumentation import NullMetrics
+from traps import TrapDetector, url_templates
+from urlnorm import LRUCache, canonicalize_url
 
 logger = logging.getLogger(__name__)
 
@@ -11,26 +20,74 @@ class Crawler:
     This class is responsible for scraping urls from the next available link in frontier and adding the scraped links to
     the frontier
     """
+    #content types that are worth parsing, any other type is skipped without reading its content
+    PARSABLE_CONTENT_TYPES = ("html", "xml", "text")
+    #verdicts of url_verdict, LONG being a trap because of its spelling only (e.g. a long fragment), whose template is not
+    #marked as a trap
+    VALID, INVALID, TRAP, LONG = "valid", "invalid", "trap", "long"
+    #schemes that can be crawled, and the file extensions that are not worth fetching (see url_verdict)
+    VALID_SCHEMES = frozenset(["http", "https"])
+    EXCLUDED_EXTENSIONS = re.compile(r".*\.(css|js|bmp|gif|jpe?g|ico"
+                                     r"|png|tiff?|mid|mp2|mp3|mp4"
+                                     r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+                                     r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso|epub|dll|cnf|tgz|sha1"
+                                     r"|thmx|mso|arff|rtf|jar|csv"
+                                     r"|rm|smil|wmv|swf|wma|zip|rar|gz|pdf)$")
+    #charset parameter of a Content-Type header, and a charset declaration near the start of a page
+    CHARSET_PATTERN = re.compile(r"charset=[\"']?([\w.:-]+)", re.I)
+    CHARSET_DECLARATION = re.compile(rb"charset", re.I)
+    #html parsers by encoding, shared by all the crawlers of a process
+    HTML_PARSERS = {}
+    #tags whose links make_links_absolute may resolve in a special way (see html_links)
+    SPECIAL_LINK_TAGS = {"base", "object", "param", "style"}
+    META_REFRESH_URL = re.compile(r"[^;=]*;\s*(?:url\s*=\s*)?(?P<url>.*)$", re.I)
+    #runs of ascii letters and digits, the tokens counted in word_count
+    TOKEN_PATTERN = re.compile(r"[A-Za-z0-9]+")
     STOP_WORDS = {"a","above","after","again","against","all","am","an","and","any","are","aren't","as","at","be","because","been","before","being","below","between","both","but","by","can't","cannot","could","couldn't","did","didn't","do","does","doesn't","doing","don't","down","during","each","few","for","from","further","had","hadn't","has","hasn't","have","haven't","having","he","he'd","he'll","he's","her","here","here's","hers","herself","him","himself","his","how","how's","i","i'd","i'll","i'm","i've","if","in","into","is","isn't","it","it's","its","itself","let's","me","more","most","mustn't","my","myself","no","nor","not","of","off","on","once","only","or","other","ought","our","ours","ourselves","out","over","own","same","shan't","she","she'd","she'll","she's","should","shouldn't","so","some","such","than","that","that's","the","their","theirs","them","themselves","then","there","there's","these","they","they'd","they'll","they're","they've","this","those","through","to","too","under","until","up","very","was","wasn't","we","we'd","we'll","we're","we've","were","weren't","what","what's","when","when's","where","where's","which","while","who","who's","whom","why","why's","with","won't","would","wouldn't","you","you'd","you'll","you're","you've","your","yours","yourself","yourselves"}
     
-    def __init__(self, frontier, corpus):
+    def __init__(self, frontier, corpus, journal=None, trap_detector=None, metrics=None, word_capacity=None,
+                 word_sketch=False, near_duplicates=None, url_cache_size=50000, link_graph=None, recrawl_manifest=None,
+                 budget=None):
         self.frontier = frontier
         self.corpus = corpus
+        #optional CheckpointJournal every crawled page is recorded to
+        self.journal = journal
+        #detects traps from the templates of the urls seen during the whole crawl
+        self.trap_detector = trap_detector if trap_detector is not None else TrapDetector()
+        #link_info of the recently validated links
+        self.url_cache = LRUCache(url_cache_size)
+        #optional NearDuplicateIndex; the outlinks of a near-duplicate of an already crawled page are not followed
+        self.near_duplicates = near_duplicates
+        #optional LinkGraph the valid outlinks of every crawled page are recorded to
+        self.link_graph = link_graph
+        #optional RecrawlManifest; pages whose corpus file did not change since the last crawl are not parsed again
+        self.recrawl_manifest = recrawl_manifest
+        #optional CrawlBudget pruning the links added to the frontier and stopping the crawl early
+        self.budget = budget
+        #stage latencies and counters, see instrumentation.Metrics
+        self.metrics = metrics if metrics is not None else NullMetrics()
         
         #keep track of subdomains it has visited and how many URLs it has processed from each of them
         self.subdomain_count = {}
         ##of links that ARE valid on a particular webpage
         self.most_outlinks = {"url":None, "count": 0}
-        #List of the downloaded_urls
-        self.download_urls = []
-        #List of traps we have identified
-        self.identified_traps = []
+        #List of the downloaded_urls, spilled to a temporary file as it grows
+        self.download_urls = SpilledList()
+        #List of traps we have identified, spilled to a temporary file as it grows
+        self.identified_traps = SpilledList()
         #longest page in terms of words (not counting HTML markup)
         self.longest_page = {"url":None, "count": 0}
-        #keeps track of word count (no stop words) in order for us to rank the top 50 most common words in the whole set
-        self.word_count = {}
-        self.recent_traps = []
-        self.max_recent_traps = 20
+        #keeps track of word count (no stop words) in order for us to rank the top 50 most common words in the whole set.
+        #with a word_capacity, only the counts needed to rank the word_capacity most common words are kept
+        self.word_count = Counter() if word_capacity is None else TopKCounter(word_capacity, use_sketch=word_sketch)
+        #analytics added by the last crawled page, in the same form as get_crawl_state
+        self.last_page_state = None
+        #word and subdomain counts of the page currently being parsed, its number of tokens (None until tokenized) and its
+        #near-duplicate hash (only computed with near_duplicates)
+        self.page_word_count = {}
+        self.page_subdomain_count = {}
+        self.page_token_count = None
+        self.page_fingerprint = None
 
 
         # #keep track of urls with fragments
@@ -42,28 +99,182 @@ class Crawler:
         This method starts the crawling process which is scraping urls from the next available link in frontier and adding
         the scraped links to the frontier
         """
-        outlinks_count = 0
-        
         while self.frontier.has_next_url():
+            #checked before fetching, so that resuming a crawl whose budget is used up fetches nothing
+            if self.budget_exhausted():
+                break
             url = self.frontier.get_next_url()
-            logger.info("Fetching URL %s ... Fetched: %s, Queue size: %s", url, self.frontier.fetched, len(self.frontier))
-            url_data = self.corpus.fetch_url(url)
+            logger.debug("Fetching URL %s ... Fetched: %s, Queue size: %s", url, self.frontier.fetched, len(self.frontier))
+            self.process_url(url)
+        self.metrics.finish()
+
+    def process_url(self, url, url_data=None):
+        """
+        Crawls a url popped from the frontier, adds its outlinks to the frontier and records the page in the journal
+        :return: the outlinks that were added to the frontier
+        """
+        traps_count = len(self.identified_traps)
+        next_links = self.crawl_url(url, url_data)
+        depth = self.frontier.pop_depth(url)
+        with self.metrics.stage("frontier"):
+            added_links = [next_link for next_link in next_links if self.add_to_frontier(next_link, depth + 1)]
+        if self.budget is not None:
+            self.budget.page_done(len(added_links))
+        if self.journal is not None:
+            self.journal.record_page(url, added_links, self.last_page_state)
+        self.metrics.count("traps", len(self.identified_traps) - traps_count)
+        self.metrics.count("links_added", len(added_links))
+        self.metrics.page_done()
+        return added_links
+
+    def budget_exhausted(self):
+        """
+        Returns True if the budget requires the crawl to stop, in which case the frontier is saved (and the checkpoint
+        compacted) so that the crawl can be resumed later, e.g. with a larger budget
+        """
+        if self.budget is None:
+            return False
+        reason = self.budget.check_stop(self.frontier)
+        if reason is None:
+            return False
+        logger.info("Stopping the crawl, budget exhausted (%s). Fetched: %s, Queue size: %s", reason,
+                    self.frontier.fetched, len(self.frontier))
+        self.frontier.save_frontier()
+        if self.journal is not None:
+            self.journal.snapshot()
+        return True
+
+    def crawl_url(self, url, url_data=None):
+        """
+        Fetches and processes a single url: updates the analytics and returns the valid outlinks that exist in the corpus.
+        Adding the returned links to a frontier is left to the caller
+        :param url_data: the response to the url if it was already fetched
+        """
+        traps_count = len(self.identified_traps)
+        self.page_word_count = {}
+        self.page_subdomain_count = {}
+        self.page_token_count = None
+        self.page_fingerprint = None
+        self.trap_detector.start_page()
+        if self.near_duplicates is not None:
+            self.near_duplicates.start_page()
+        if self.link_graph is not None:
+            self.link_graph.start_page()
+        if self.budget is not None:
+            self.budget.start_page()
+        #an unchanged page is neither fetched nor parsed
+        need_fingerprint = self.near_duplicates is not None
+        record = self.recrawl_manifest.lookup(url, need_fingerprint) if self.recrawl_manifest is not None else None
+        if record is None and url_data is None:
+            with self.metrics.stage("fetch"):
+                url_data = self.corpus.fetch_url(url)
+        if (record["http_code"] if record is not None else url_data["http_code"]) == 404:
+            self.metrics.count("not_found")
+
+        self.download_urls.append(url)
+
+        with self.metrics.stage("parse"):
+            content = None
+            if record is None and self.recrawl_manifest is not None:
+                #the content is only read (and digested) when the page is worth parsing
+                content = url_data["content"] if self.is_parsable(url_data) else None
+                content = content if isinstance(content, (bytes, str)) else None
+                record = self.recrawl_manifest.lookup_content(url, url_data["http_code"], content, need_fingerprint)
+            if record is not None:
+                self.metrics.count("reused_pages")
+                links = self.replay_page(url, record)
+            else:
+                links = self.extract_next_links(url_data)
+                if self.recrawl_manifest is not None:
+                    self.recrawl_manifest.record_page(url, url_data["http_code"], content, links,
+                                                      self.identified_traps[traps_count:], self.page_word_count,
+                                                      self.page_token_count, self.page_subdomain_count,
+                                                      self.page_fingerprint)
+        self.metrics.count("links_validated", len(links))
+        with self.metrics.stage("validate"):
+            accepted_links = self.is_valid_batch(links)
+        outlinks_count = len(accepted_links)
+        valid_links = [next_link for next_link, _ in accepted_links]
+        next_links = [next_link for next_link, file_name in accepted_links if file_name is not None]
+
+        if self.link_graph is not None:
+            self.link_graph.add_page(url, valid_links)
+
+        #a near-duplicate still counts its outlinks and links in the graph, only its links are not followed
+        if self.near_duplicates is not None and self.page_token_count:
+            if self.near_duplicates.add(url, self.page_fingerprint, self.page_token_count) is not None:
+                #the links of a mirror or templated copy mostly lead to pages reached from the page it copies. The ones
+                #that lead to urls not seen yet are recorded, to report the urls that no other page leads to
+                self.metrics.count("near_duplicates")
+                skipped_links = [link for link in dict.fromkeys(next_links)
+                                 if not self.frontier.is_duplicate(link, self.link_info(link)[3])]
+                self.metrics.count("near_duplicate_skipped_links", len(skipped_links))
+                self.near_duplicates.skip_links(skipped_links)
+                next_links = []
+
+        #update most_outlinks
+        page_outlinks = {'url': url,"count":outlinks_count}
+        if self.ranks_before(page_outlinks, self.most_outlinks):
+             self.most_outlinks = page_outlinks
+
+        page_traps = self.identified_traps[traps_count:]
+        self.last_page_state = {
+            "subdomain_count": self.page_subdomain_count,
+            "most_outlinks": self.most_outlinks,
+            "download_urls": [url],
+            "identified_traps": page_traps,
+            "longest_page": self.longest_page,
+            "word_count": self.page_word_count,
+            #admissions made by the caller after crawl_url returns are tracked in the same dicts
+            "trap_detector": self.trap_detector.get_page_state(),
+            "near_duplicates": self.near_duplicates.get_page_state() if self.near_duplicates is not None else None,
+            "link_graph": self.link_graph.get_page_state() if self.link_graph is not None else None,
+            "budget": self.budget.get_page_state() if self.budget is not None else None
+        }
+        return next_links
+
+    def replay_page(self, url, record):
+        """
+        Applies the results of parsing a page recorded by a RecrawlManifest to the analytics, the way extract_next_links
+        applied them when the page was parsed
+        :return: the links found on the page
+        """
+        self.identified_traps.extend(record["fragment_traps"])
+        self.page_word_count = record["word_count"]
+        self.word_count.update(self.page_word_count)
+        self.page_token_count = record["token_count"]
+        if self.page_token_count is not None and self.ranks_before({"url": url, "count": self.page_token_count},
+                                                                   self.longest_page):
+            self.longest_page = {"url": url, "count": self.page_token_count}
+        for subdomain, count in record["subdomain_count"].items():
+            self.subdomain_count[subdomain] = self.subdomain_count.get(subdomain, 0) + count
+        self.page_subdomain_count = record["subdomain_count"]
+        self.page_fingerprint = record.get("fingerprint")
+        return record["links"]
+
+    def add_to_frontier(self, url, depth=0):
+        """
+        Adds a url returned by crawl_url to the frontier, unless it is a duplicate, it is over a limit of the crawl budget
+        or its template has used up its trap budget (in which case it is recorded as a trap)
+        :param depth: the link depth of the url, one more than the depth of the page it was found on
+        :return: True if the url was added
+        """
+        #hashed once for both the lookup and the insertion, links that were just validated are already hashed
+        info = self.url_cache.get(url)
+        fingerprint = info[3] if info is not None and info[3] is not None else url_fingerprint(url)
+        if self.frontier.is_duplicate(url, fingerprint):
+            return False
+        if self.budget is not None and not self.budget.admit(url, depth):
+            return False
+        if not self.trap_detector.admit(url):
+            self.identified_traps.append(url)
+            return False
+        if not self.frontier.add_url(url, depth, fingerprint):
+            return False
+        if self.budget is not None:
+            self.budget.admitted(url)
+        return True
 
-            self.download_urls.append(url)
-            
-            for next_link in self.extract_next_links(url_data):
-                #pass in content, to keep track of page size
-                if self.is_valid(next_link):
-                    outlinks_count+=1
-                    if self.corpus.get_file_name(next_link) is not None:
-                        self.frontier.add_url(next_link)
-                        
-            #update most_outlinks
-            if outlinks_count > self.most_outlinks["count"]:
-                 self.most_outlinks = {'url': url_data['url'],"count":outlinks_count}
-                 
-            outlinks_count = 0
-        
     #     self.write_to_file("fragment_links.txt",url + '\n')
 
 
@@ -73,26 +284,91 @@ class Crawler:
     #         file.write(text)
     #         for i in self.fragment_url:
     #             file.write(i + "\n")
-            
-    def add_to_recent_traps(self,url):
-        self.recent_traps.append(url)
-        if len(self.recent_traps) > self.max_recent_traps:
-            self.recent_traps.pop(0)  
 
 
+    def get_crawl_state(self):
+        """
+        Returns the analytics gathered by this crawler so far, in a form that can be pickled and merged into another
+        crawler with merge_crawl_state
+        """
+        return {
+            "subdomain_count": self.subdomain_count,
+            "most_outlinks": self.most_outlinks,
+            "download_urls": self.download_urls,
+            "identified_traps": self.identified_traps,
+            "longest_page": self.longest_page,
+            "word_count": self.word_count,
+            "trap_detector": self.trap_detector.get_state(),
+            "near_duplicates": self.near_duplicates.get_state() if self.near_duplicates is not None else None,
+            "link_graph": self.link_graph.get_state() if self.link_graph is not None else None,
+            "budget": self.budget.get_state() if self.budget is not None else None
+        }
+
+    def merge_crawl_state(self, state):
+        """
+        Merges analytics gathered by another crawler (see get_crawl_state) into this crawler. Counts are summed, lists
+        are appended and the longest page / most outlinks keep the one ranking first (see ranks_before)
+        """
+        for subdomain, count in state["subdomain_count"].items():
+            self.subdomain_count[subdomain] = self.subdomain_count.get(subdomain,0) + count
+        self.word_count.update(state["word_count"])
+
+        self.download_urls.extend(state["download_urls"])
+        self.identified_traps.extend(state["identified_traps"])
+        self.trap_detector.merge_state(state["trap_detector"])
+        if self.near_duplicates is not None and state.get("near_duplicates") is not None:
+            self.near_duplicates.merge_state(state["near_duplicates"])
+        if self.link_graph is not None and state.get("link_graph") is not None:
+            self.link_graph.merge_state(state["link_graph"])
+        if self.budget is not None and state.get("budget") is not None:
+            self.budget.merge_state(state["budget"])
+
+        if self.ranks_before(state["longest_page"], self.longest_page):
+            self.longest_page = state["longest_page"]
+        if self.ranks_before(state["most_outlinks"], self.most_outlinks):
+            self.most_outlinks = state["most_outlinks"]
+
+    @staticmethod
+    def ranks_before(page, other):
+        """
+        Returns True if page, a {"url", "count"} record like longest_page, ranks before other: its count is larger, or
+        the counts are equal and its url comes first. Ties don't depend on the order the pages were crawled in, so a
+        crawl split across workers reports the same page as a serial crawl
+        """
+        if page["count"] != other["count"]:
+            return page["count"] > other["count"]
+        return page["url"] is not None and other["url"] is not None and page["url"] < other["url"]
+
     def generate_analytics_report(self):
+        #subdomains and urls are sorted and words with the same count are listed in alphabetical order, so the report
+        #does not depend on the order the pages were crawled in (e.g. with several workers)
         report = {}
     
-        report['subdomain_count'] = self.subdomain_count
+        report['subdomain_count'] = dict(sorted(self.subdomain_count.items()))
         report['most_outlinks'] = self.most_outlinks
         report['downloaded_urls_count'] = len(self.download_urls)
-        report['downloaded_urls'] = (self.download_urls)
+        report['downloaded_urls'] = self.download_urls.sorted()
         report['identified_traps_count'] = len(self.identified_traps)
-        report['identified_traps'] = self.identified_traps
+        report['identified_traps'] = self.identified_traps.sorted()
         report['longest_page'] = self.longest_page
     
-        sorted_word_count = sorted(self.word_count.items(), key=lambda x: x[1], reverse=True)
-        report['top_50_words'] = sorted_word_count[:50]
+        report['top_50_words'] = heapq.nsmallest(50, self.word_count.items(), key=lambda item: (-item[1], item[0]))
+        if self.near_duplicates is not None:
+            report['near_duplicate_pages_count'] = self.near_duplicates.duplicates_count()
+            report['near_duplicate_clusters'] = self.near_duplicates.clusters
+            #the links of near-duplicates that were not followed, and those of them that the crawl never reached
+            report['near_duplicate_skipped_links_count'] = len(set(self.near_duplicates.skipped_links))
+            report['near_duplicate_uncovered_links_count'] = len(self.near_duplicates.uncovered_links(self.frontier))
+        if self.link_graph is not None:
+            report['link_graph_pages_count'] = len(self.link_graph.urls)
+            report['link_graph_links_count'] = self.link_graph.edges_count()
+            report['most_linked_pages'] = self.link_graph.top_urls(self.link_graph.in_degrees(), 10)
+            report['most_linking_pages'] = self.link_graph.top_urls(self.link_graph.out_degrees(), 10)
+            #rounded before ranking, so ranks differing by rounding errors (e.g. with several workers) count as ties
+            report['top_pagerank_pages'] = self.link_graph.top_urls(self.link_graph.pagerank(), 10, decimals=6)
+            report['subdomain_connectivity'] = self.link_graph.subdomain_connectivity()
+        if self.budget is not None:
+            report['budgets'] = self.budget.report()
 
         return report
     
@@ -100,30 +376,118 @@ class Crawler:
         report = self.generate_analytics_report()
         with open(file_name, "w") as file:
             for key, value in report.items():
-                file.write(f"{key}: {value}\n\n\n")
+                #spilled lists are streamed from their files instead of being turned into one large string
+                if isinstance(value, SpilledList):
+                    file.write(f"{key}: ")
+                    value.write_repr(file)
+                    file.write("\n\n\n")
+                else:
+                    file.write(f"{key}: {value}\n\n\n")
             file.write("\n")
 
     def word_token_count(self, text):
-        tokenList = []
-        new = True
+        """
+        Returns the tokens of text, which are the runs of ascii letters and digits, lowercased
+        """
+        #lowercasing before matching would turn some non ascii characters (e.g. the Kelvin sign) into ascii letters
+        return " ".join(self.TOKEN_PATTERN.findall(text)).lower().split()
+
+    def count_words(self, token_list):
+        """
+        Counts the tokens of a page, leaving out stop words, and adds them to word_count
+        :return: the word counts of the page
+        """
+        page_word_count = Counter(token_list)
+        for stop_word in self.STOP_WORDS.intersection(page_word_count):
+            del page_word_count[stop_word]
+        self.word_count.update(page_word_count)
+        return page_word_count
+
+    def is_parsable(self, url_data):
+        """
+        Returns True if the response to a url may hold links: it was found and its content type, when given, is html,
+        xml or text
+        """
+        if url_data["http_code"] == 404:
+            return False
+        content_type = url_data["content_type"]
+        return content_type is None or any(parsable in content_type.lower() for parsable in self.PARSABLE_CONTENT_TYPES)
+
+    def parse_html(self, url_data):
+        """
+        Parses the content of a page without decoding it in Python: bytes are handed to lxml along with the charset of the
+        Content-Type header when it names a known encoding. Without one, the page is read as utf-8 unless it mentions a
+        charset near its start, in which case lxml detects the encoding from its meta tag
+        """
+        content = url_data["content"]
+        content_type = url_data.get("content_type") or ""
+        if isinstance(content, tuple):
+            content, content_type = content
+        if isinstance(content, str):
+            return html.fromstring(content)
+
+        encoding = None
+        match = self.CHARSET_PATTERN.search(content_type or "")
+        if match:
+            try:
+                encoding = codecs.lookup(match.group(1)).name
+            except LookupError:
+                pass
+        if encoding is None and not self.CHARSET_DECLARATION.search(content, 0, 4096):
+            encoding = "utf-8"
+        parser = self.HTML_PARSERS.get(encoding)
+        if parser is None:
+            parser = self.HTML_PARSERS[encoding] = html.HTMLParser(encoding=encoding)
+        return html.fromstring(content, parser=parser)
+
+    def html_links(self, root, base_url):
+        """
+        Returns the (element, attribute, absolute url) of the links of a parsed page, in the order iterlinks yields them
+        once make_links_absolute(base_url) has been applied. The tree is walked once, without being rewritten, and each
+        distinct link is resolved once. Pages with links that make_links_absolute resolves in a special way (a <base
+        href>, <object> and <param> links, urls in css) are handed to lxml instead
+        """
+        links = []
+        resolved = {}
+        link_attrs = defs.link_attrs
+        for element in root.iter(etree.Element):
+            tag = element.tag
+            if tag in self.SPECIAL_LINK_TAGS and (tag != "base" or element.get("href") is not None) and (
+                    tag != "style" or "url(" in (element.text or "").lower() or "@import" in (element.text or "")):
+                return self.lxml_links(root, base_url)
+            attributes = element.keys()
+            if not attributes:
+                continue
+            if "style" in attributes and "url(" in element.get("style").lower():
+                return self.lxml_links(root, base_url)
+
+            found = [(attribute, element.get(attribute)) for attribute in link_attrs.intersection(attributes)]
+            if len(found) > 1:
+                found = [(attribute, element.get(attribute)) for attribute in link_attrs if attribute in attributes]
+            if tag == "meta" and element.get("http-equiv", "").lower() == "refresh":
+                content = element.get("content", "")
+                match = self.META_REFRESH_URL.search(content)
+                link = (match.group("url") if match else content).strip()
+                if link:
+                    if link[:1] == link[-1:] and link[:1] in ("'", '"'):
+                        link = link[1:-1]
+                    found.append(("content", link))
+
+            for attribute, link in found:
+                link = link.strip()
+                absolute_url = resolved.get(link)
+                if absolute_url is None:
+                    absolute_url = resolved[link] = urljoin(base_url, link)
+                links.append((element, attribute, absolute_url))
+        return links
+
+    def lxml_links(self, root, base_url):
+        """
+        Returns the links of a parsed page like html_links does, by letting lxml rewrite them in the tree
+        """
+        root.make_links_absolute(base_url)
+        return [(element, attribute, link) for element, attribute, link, _ in root.iterlinks()]
 
-        for char in text:     
-            if not char: 
-                break
-            if char.isalnum() is False or char.isascii() is False: 
-                try:
-                    tokenList[-1] = tokenList[-1].lower()
-                except:
-                    pass   
-                new = True
-            elif new:
-                tokenList.append(char)
-                new = False
-            else:
-                tokenList[-1] = tokenList[-1]+char
-        return tokenList
-        
-            
     def extract_next_links(self, url_data):
         """
         The url_data coming from the fetch_url method will be given as a parameter to this method. url_data contains the
@@ -134,70 +498,53 @@ class Crawler:
 
         Suggested library: lxml
         """
-        #tracks highest outlinks count
-        outlinks_count = 0
-        
         # list to hold the absolute URL's
         outputLinks = []  
 
-        if url_data["content"] and url_data["http_code"] != 404:
+        #the content is only read once the response is known to be worth parsing
+        if self.is_parsable(url_data) and url_data["content"]:
             try:
-                content = url_data["content"]
-                content_type = url_data.get("content_type",'')
-                if isinstance(content, tuple):
-                    content, content_type = content
-                
-                if isinstance(content,bytes):
-                    encoding = 'utf-8'
-                    if 'charset=' in content_type:
-                        encoding = content_type.split('charset')[-1].split(';')[0].strip()
-                        #decode binary content to a string
-                    content = content.decode(encoding) 
-                if isinstance(content,str):
-                    pass
-                
-                
-                # #decode binary content to a string
-                # content = url_data["content"].decode(encoding)
                 #parse HTML content
-                htmlFile = html.fromstring(content)
-                htmlFile.make_links_absolute(url_data["url"])
+                htmlFile = self.parse_html(url_data)
+                links = self.html_links(htmlFile, url_data["url"])
             
                 #update word counts excluding html markup
-                text = htmlFile.text_content()
-                token_list = self.word_token_count(text)
-                for token in token_list:
-                    if token not in self.STOP_WORDS:
-                        self.word_count[token] = self.word_count.get(token,0) + 1
-
-                if len(token_list) > self.longest_page["count"]:
-                    self.longest_page = {"url": url_data['url'],"count":len(token_list)}
+                with self.metrics.stage("tokenize"):
+                    text = htmlFile.text_content()
+                    token_list = self.word_token_count(text)
+                    self.page_word_count = self.count_words(token_list)
+                    self.page_token_count = len(token_list)
+                    if self.near_duplicates is not None:
+                        self.page_fingerprint = self.near_duplicates.fingerprint(token_list)
+
+                page_length = {"url": url_data['url'],"count":len(token_list)}
+                if self.ranks_before(page_length, self.longest_page):
+                    self.longest_page = page_length
                     
                     
                 
                 current_url_parse = urlparse(url_data["url"])
-                for link in htmlFile.iterlinks():
-                    #update redirect and final url information in dictionary
-                    if (link[0].tag == 'meta' and 'refresh' in link[0].get('http-equiv', '').lower()):
-                        url_data["final_url"] = link
-                        redirect_url_dict = self.corpus.fetch_url(link)
-                        redirect_url_dict["is_redirected"] = True
-
-                    absolute_url = link[2]
-                    outgoing_url_parse = urlparse(absolute_url)
+                current_url_unfragmented = urlunparse(current_url_parse._replace(fragment=''))
+                for element, attribute, absolute_url in links:
+                    #update final url information in dictionary, the url of a meta refresh is its content attribute
+                    if element.tag == 'meta' and attribute == 'content':
+                        url_data["final_url"] = absolute_url
+
                     # if link contains fragment and has the same base url leading upto the fragment, add to trap list
-                    if ((outgoing_url_parse.fragment) and (urlunparse(outgoing_url_parse._replace(fragment='')) == urlunparse(current_url_parse._replace(fragment='')))):
-                            self.identified_traps.append(link[2])
-                            self.add_to_recent_traps(link[2])
+                    if '#' in absolute_url:
+                        outgoing_url_parse = urlparse(absolute_url)
+                        if ((outgoing_url_parse.fragment) and (urlunparse(outgoing_url_parse._replace(fragment='')) == current_url_unfragmented)):
+                            self.identified_traps.append(absolute_url)
+                            continue
                     # else add to output link
-                    else:
-                        outputLinks.append(absolute_url)
+                    outputLinks.append(absolute_url)
                 
 
 
                 #updates subdomain count
                 subdomain = current_url_parse.hostname
                 self.subdomain_count[subdomain] = self.subdomain_count.get(subdomain,0) + 1   
+                self.page_subdomain_count = {subdomain: 1}
 
                 
             except Exception as e:
@@ -220,48 +567,103 @@ class Crawler:
         filter out crawler traps. Duplicated urls will be taken care of by frontier. You don't need to check for duplication
         in this method
         """
+        verdict, templates, _, _ = self.link_info(url)
+
+        #urls sharing a template with a known trap, or whose template already used up its budget
+        if self.trap_detector.is_trap_template(*templates):
+            self.identified_traps.append(url)
+            return False
+
+        if verdict == self.TRAP:
+            self.identified_traps.append(url)
+            self.trap_detector.mark_trap_template(templates[0])
+            return False
+        if verdict == self.LONG:
+            self.identified_traps.append(url)
+            return False
+        return verdict == self.VALID
+
+    def is_valid_batch(self, urls):
+        """
+        Applies is_valid to all the outlinks of a page at once. The rules that only depend on a url are looked up once per
+        distinct url (see link_info), then the trap rules are applied to every link in order, with the same effects as
+        calling is_valid on each of them: a link found several times is accepted or rejected (and recorded as a trap) as
+        many times
+        :return: the (url, corpus file name) of every valid link, in order, the file name being None if the url is not in
+        the corpus
+        """
+        infos = {url: self.link_info(url) for url in dict.fromkeys(urls)}
+        accepted = []
+        traps = []
+        #whether the templates of a url are trapped, until a new template is marked as a trap. The budgets of the
+        #templates only change when urls are added to the frontier, after the whole page is validated
+        trapped = {}
+        for url in urls:
+            verdict, templates, file_name, _ = infos[url]
+            is_trapped = trapped.get(url)
+            if is_trapped is None:
+                is_trapped = trapped[url] = self.trap_detector.is_trap_template(*templates)
+            if is_trapped:
+                traps.append(url)
+            elif verdict == self.TRAP:
+                traps.append(url)
+                self.trap_detector.mark_trap_template(templates[0])
+                trapped = {}
+            elif verdict == self.LONG:
+                traps.append(url)
+            elif verdict == self.VALID:
+                accepted.append((url, file_name))
+        self.identified_traps.extend(traps)
+        return accepted
+
+    def link_info(self, url):
+        """
+        Returns the verdict of the rules of is_valid on a url (see url_verdict), the templates of its canonical form (see
+        traps.url_templates), and its corpus file name and frontier fingerprint if it is valid and in the corpus. Links
+        repeated across pages are looked up in url_cache instead of being parsed again
+        """
+        info = self.url_cache.get(url)
+        if info is None:
+            #the rules apply to the url as spelled on the page, e.g. the max length counts its fragment and port
+            verdict = self.url_verdict(url)
+            canonical_url = canonicalize_url(url)
+            file_name = self.corpus.get_file_name(url) if verdict == self.VALID else None
+            fingerprint = url_fingerprint(canonical_url) if file_name is not None else None
+            info = (verdict, url_templates(canonical_url), file_name, fingerprint)
+            self.url_cache.put(url, info)
+        return info
+
+    def url_verdict(self, url):
+        """
+        Applies the rules of is_valid that only depend on the url itself
+        :return: VALID, INVALID, or TRAP (LONG) if the url matches one of the trap rules
+        """
         max_length = 200
         max_query_parameters = 5
-        similarity_threshold = 4
         parsed = urlparse(url)
         
-        for trap_url in self.recent_traps:
-            differences = sum(c1 != c2 for c1, c2 in zip(url,trap_url)) + abs(len(url) - len(trap_url))
-            if differences <= similarity_threshold:
-                self.identified_traps.append(url)
-                self.add_to_recent_traps(url)
-                return False
-        
         #keeps track of length of URL if it gets too long don't fetch
         if len(url) > max_length:
-            self.identified_traps.append(url)
-            self.add_to_recent_traps(url)
-            return False
+            return self.TRAP if len(canonicalize_url(url)) > max_length else self.LONG
     
         
         # non-consecutive repeating patterns
         path_segments = [segment for segment in parsed.path.split('/') if segment]
         if len(path_segments) != len(set(path_segments)):
-            self.identified_traps.append(url)
-            self.add_to_recent_traps(url)
-            return False
+            return self.TRAP
         
         query_params = parse_qs(parsed.query)
         param_terms = {"week" , "day" , "date"}
         for param, values in query_params.items():
             if len(values) != len(set(values)):
-                return False
+                return self.INVALID
             if any(param_terms in param.lower() for param_terms in param_terms):
-                self.identified_traps.append(url)
-                self.add_to_recent_traps(url)
-                return False
+                return self.TRAP
             
         
         #check for dynamic links  by checking for # of &(parameters) in the query
         if len(query_params) > max_query_parameters:
-            self.identified_traps.append(url)
-            self.add_to_recent_traps(url)
-            return False
+            return self.TRAP
         
         ########################################### functions we tried and adjusted 
         # #check if the URL contains a fragment (#)
@@ -279,19 +681,15 @@ class Crawler:
         #     self.identified_traps.append(url)
         #     return False
         
-        if parsed.scheme not in set(["http", "https"]):
-            return False
+        if parsed.scheme not in self.VALID_SCHEMES:
+            return self.INVALID
         
         # self.write_to_file("crawler_links.txt",url + '\n')
         try:
-            return ".ics.uci.edu" in parsed.hostname \
-                   and not re.match(".*\.(css|js|bmp|gif|jpe?g|ico" + "|png|tiff?|mid|mp2|mp3|mp4" \
-                                    + "|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf" \
-                                    + "|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso|epub|dll|cnf|tgz|sha1" \
-                                    + "|thmx|mso|arff|rtf|jar|csv" \
-                                    + "|rm|smil|wmv|swf|wma|zip|rar|gz|pdf)$", parsed.path.lower())
+            valid = ".ics.uci.edu" in parsed.hostname and not self.EXCLUDED_EXTENSIONS.match(parsed.path.lower())
+            return self.VALID if valid else self.INVALID
             
         except TypeError:
-            print("TypeError for ", parsed)
-            return False
+            logger.warning("TypeError for %s", parsed)
+            return self.INVALID
         
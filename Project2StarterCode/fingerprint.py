@@ -0,0 +1,114 @@
+import hashlib
+import math
+from array import array
+
+from urlnorm import canonicalize_url
+
+
+def url_fingerprint(url):
+    """
+    Returns the 64 bit fingerprint of the canonical form of a url. 0 is never returned, it marks the empty table slots
+    """
+    digest = hashlib.blake2b(canonicalize_url(url).encode("utf-8", "surrogatepass"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") or 1
+
+
+class FingerprintSet:
+    """
+    A set of urls that only stores their 64 bit fingerprints (see url_fingerprint) in an open addressing hash table backed
+    by an array, so every url costs 16 to 32 bytes (depending on how full the table is) instead of a full Python string.
+    Urls that are equal once canonicalized are considered the same url.
+
+    Two different urls share a fingerprint with probability 2^-64, so looking up a new url in a set of n urls returns a
+    false positive with probability at most n / 2^64 (see false_positive_rate). False negatives are not possible.
+
+    Hashing a url costs much more than probing the table, so callers that look a url up before adding it should compute
+    its fingerprint once and use contains_fingerprint and add_fingerprint.
+
+    Attributes:
+        table: the hash table, 0 marks an empty slot
+        count: the number of fingerprints in the table
+    """
+
+    # The table is doubled once it is more than half full
+    MAX_LOAD_FACTOR = 0.5
+
+    def __init__(self, urls=(), capacity=1024):
+        self.count = 0
+        self.allocate(capacity)
+        self.update(urls)
+
+    def allocate(self, capacity):
+        size = 1 << max(4, math.ceil(capacity / self.MAX_LOAD_FACTOR - 1).bit_length())
+        self.table = array("Q", bytes(8 * size))
+        self.mask = size - 1
+
+    def add(self, url):
+        return self.add_fingerprint(url_fingerprint(url))
+
+    def add_fingerprint(self, fingerprint):
+        """
+        Adds a fingerprint to the set
+        :return: True if it was added, False if it was already in the set
+        """
+        table = self.table
+        mask = self.mask
+        i = fingerprint & mask
+        while table[i]:
+            if table[i] == fingerprint:
+                return False
+            i = (i + 1) & mask
+        table[i] = fingerprint
+        self.count += 1
+        if self.count > len(table) * self.MAX_LOAD_FACTOR:
+            self.resize(len(table) * 2)
+        return True
+
+    def contains_fingerprint(self, fingerprint):
+        table = self.table
+        mask = self.mask
+        i = fingerprint & mask
+        while table[i]:
+            if table[i] == fingerprint:
+                return True
+            i = (i + 1) & mask
+        return False
+
+    def resize(self, size):
+        fingerprints = list(self.fingerprints())
+        self.allocate(size * self.MAX_LOAD_FACTOR)
+        self.count = 0
+        for fingerprint in fingerprints:
+            self.add_fingerprint(fingerprint)
+
+    def update(self, urls):
+        """
+        Adds all the given urls, or all the fingerprints of another FingerprintSet, to the set
+        """
+        if isinstance(urls, FingerprintSet):
+            for fingerprint in urls.fingerprints():
+                self.add_fingerprint(fingerprint)
+        else:
+            for url in urls:
+                self.add(url)
+
+    def fingerprints(self):
+        return (fingerprint for fingerprint in self.table if fingerprint)
+
+    def false_positive_rate(self):
+        """
+        Returns the upper bound on the probability that a url which was never added is reported as a duplicate
+        """
+        return self.count / 2 ** 64
+
+    def memory_usage(self):
+        """
+        Returns the number of bytes used by the table
+        """
+        return self.table.itemsize * len(self.table)
+
+    def __contains__(self, url):
+        return self.contains_fingerprint(url_fingerprint(url))
+
+    def __len__(self):
+        return self.count
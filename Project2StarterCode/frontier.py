@@ -1,8 +1,12 @@
 import logging
 import os
 from collections import deque
+from itertools import islice
 import pickle
 
+from fingerprint import FingerprintSet, url_fingerprint
+from scheduler import HostQueue
+
 logger = logging.getLogger(__name__)
 
 class Frontier:
@@ -12,9 +16,12 @@ class Frontier:
     load existing state
 
     Attributes:
-        urls_queue: A queue of urls to be download by crawlers
-        urls_set: A set of urls to avoid duplicated urls
+        urls_queue: A queue of urls to be download by crawlers, a FIFO deque or a HostQueue scheduling urls per host
+        urls_set: A set of url fingerprints to avoid duplicated urls (see FingerprintSet)
         fetched: the number of fetched urls so far
+        depths: the link depth of every queued url by fingerprint (the seed has a depth of 0), None unless track_depths is
+            set
+        budget: optional CrawlBudget of the crawl, whose state is saved and loaded along with the frontier
     """
 
     # File names to be used when loading and saving the frontier state
@@ -22,24 +29,66 @@ class Frontier:
     URL_QUEUE_FILE_NAME = os.path.join(".", FRONTIER_DIR_NAME, "url_queue.pkl")
     URL_SET_FILE_NAME = os.path.join(".", FRONTIER_DIR_NAME, "url_set.pkl")
     FETCHED_FILE_NAME = os.path.join(".", FRONTIER_DIR_NAME, "fetched.pkl")
+    DEPTHS_FILE_NAME = os.path.join(".", FRONTIER_DIR_NAME, "depths.pkl")
+    BUDGET_FILE_NAME = os.path.join(".", FRONTIER_DIR_NAME, "budget.pkl")
+    # The url every crawl starts from
+    SEED_URL = "http://www.ics.uci.edu/"
 
 
-    def __init__(self):
-        self.urls_queue = deque()
-        self.urls_set = set()
+    def __init__(self, urls_queue=None, track_depths=False, budget=None):
+        self.urls_queue = urls_queue if urls_queue is not None else deque()
+        self.urls_set = FingerprintSet()
         self.fetched = 0
+        self.depths = {} if track_depths else None
+        self.budget = budget
 
-    def add_url(self, url):
+    def add_url(self, url, depth=0, fingerprint=None):
         """
         Adds a url to the urls queue
         :param url: the url to be added
+        :param depth: the number of links between the seed and the url
+        :param fingerprint: the fingerprint of the url, if the caller already computed it (see is_duplicate)
+        :return: True if the url was added, False if it was a duplicate
+        """
+        if fingerprint is None:
+            fingerprint = url_fingerprint(url)
+        if self.urls_set.add_fingerprint(fingerprint):
+            if isinstance(self.urls_queue, HostQueue):
+                self.urls_queue.append(url, depth)
+            else:
+                self.urls_queue.append(url)
+            if self.depths is not None:
+                self.depths[fingerprint] = depth
+            return True
+        return False
+
+    def pop_depth(self, url):
+        """
+        Returns the depth of a url returned by get_next_url and forgets it, 0 if depths are not tracked
+        """
+        if not self.depths:
+            return 0
+        return self.depths.pop(url_fingerprint(url), 0)
+
+    def queued_depth(self, url):
+        """
+        Returns the depth of a queued url, 0 if depths are not tracked
         """
-        if not self.is_duplicate(url):
-            self.urls_queue.append(url)
-            self.urls_set.add(url)
+        if not self.depths:
+            return 0
+        return self.depths.get(url_fingerprint(url), 0)
 
-    def is_duplicate(self, url):
-        return url in self.urls_set
+    def set_depths(self, depths):
+        """
+        Replaces the depths of the queued urls, converting the depths saved by url to depths by fingerprint
+        """
+        self.depths = {url_fingerprint(url) if isinstance(url, str) else url: depth for url, depth in depths.items()}
+
+    def is_duplicate(self, url, fingerprint=None):
+        """
+        :param fingerprint: the fingerprint of the url, if the caller already computed it (see url_fingerprint)
+        """
+        return self.urls_set.contains_fingerprint(url_fingerprint(url) if fingerprint is None else fingerprint)
 
     def get_next_url(self):
         """
@@ -49,6 +98,24 @@ class Frontier:
             self.fetched += 1
             return self.urls_queue.popleft()
 
+    def set_queue(self, urls):
+        """
+        Replaces the queued urls, converting them to the kind of queue this frontier uses. Queues saved with a deque can
+        be loaded into a frontier using a HostQueue and the other way around. The depths of the urls must be set first
+        """
+        if isinstance(self.urls_queue, HostQueue):
+            self.urls_queue = self.urls_queue.with_urls(urls, self.queued_depth)
+        elif isinstance(urls, deque):
+            self.urls_queue = urls
+        else:
+            self.urls_queue = deque(urls)
+
+    def peek_urls(self, count):
+        """
+        Returns the next count urls to be fetched, in order, without removing them from the queue
+        """
+        return list(islice(self.urls_queue, count))
+
     def has_next_url(self):
         """
         Returns true if there are more urls in the queue, otherwise false
@@ -68,6 +135,12 @@ class Frontier:
         pickle.dump(self.urls_queue, url_queue_file)
         pickle.dump(self.urls_set, url_set_file)
         pickle.dump(self.fetched, fetched_file)
+        if self.depths is not None:
+            with open(self.DEPTHS_FILE_NAME, "wb") as depths_file:
+                pickle.dump(self.depths, depths_file)
+        if self.budget is not None:
+            with open(self.BUDGET_FILE_NAME, "wb") as budget_file:
+                pickle.dump(self.budget.get_state(), budget_file)
 
     def load_frontier(self):
         """
@@ -76,16 +149,28 @@ class Frontier:
         if os.path.isfile(self.URL_QUEUE_FILE_NAME) and os.path.isfile(self.URL_SET_FILE_NAME) and\
                 os.path.isfile(self.FETCHED_FILE_NAME):
             try:
-                self.urls_queue = pickle.load(open(self.URL_QUEUE_FILE_NAME, "rb"))
-                self.urls_set = pickle.load(open(self.URL_SET_FILE_NAME, "rb"))
+                # states saved without depths restart counting from the queued urls
+                if self.depths is not None and os.path.isfile(self.DEPTHS_FILE_NAME):
+                    with open(self.DEPTHS_FILE_NAME, "rb") as depths_file:
+                        self.set_depths(pickle.load(depths_file))
+                self.set_queue(pickle.load(open(self.URL_QUEUE_FILE_NAME, "rb")))
+                urls_set = pickle.load(open(self.URL_SET_FILE_NAME, "rb"))
+                # states saved before the fingerprint set was introduced hold a set of url strings
+                if isinstance(urls_set, FingerprintSet):
+                    self.urls_set = urls_set
+                else:
+                    self.urls_set.update(urls_set)
                 self.fetched = pickle.load(open(self.FETCHED_FILE_NAME, "rb"))
+                if self.budget is not None and os.path.isfile(self.BUDGET_FILE_NAME):
+                    with open(self.BUDGET_FILE_NAME, "rb") as budget_file:
+                        self.budget.merge_state(pickle.load(budget_file))
                 logger.info("Loaded previous frontier state into memory. Fetched: %s, Queue size: %s", self.fetched,
                             len(self.urls_queue))
             except:
                 pass
         else:
             logger.info("No previous frontier state found. Starting from the seed URL ...")
-            self.add_url("http://www.ics.uci.edu/")
+            self.add_url(self.SEED_URL)
 
     def __len__(self):
         return len(self.urls_queue)
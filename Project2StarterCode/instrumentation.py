@@ -0,0 +1,284 @@
+import logging
+import signal
+import time
+from collections import Counter
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """
+    A histogram of durations with log-linear buckets: every power of two of nanoseconds is split into 4 buckets, so a
+    percentile is known within 25% whatever the duration, using a few hundred integers
+    """
+
+    SUB_BUCKET_BITS = 2
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.buckets = [0] * (64 << self.SUB_BUCKET_BITS)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds):
+        nanoseconds = int(seconds * 1e9)
+        bits = nanoseconds.bit_length()
+        if bits > self.SUB_BUCKET_BITS:
+            # the bits following the leading one select the sub bucket
+            index = (bits << self.SUB_BUCKET_BITS) | ((nanoseconds >> (bits - 1 - self.SUB_BUCKET_BITS)) & 3)
+        else:
+            index = nanoseconds
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+
+    def bucket_upper_bound(self, index):
+        bits = index >> self.SUB_BUCKET_BITS
+        if bits <= self.SUB_BUCKET_BITS:
+            return index / 1e9
+        sub_bucket = index & 3
+        return ((4 + sub_bucket + 1) << (bits - 1 - self.SUB_BUCKET_BITS)) / 1e9
+
+    def percentile(self, percent):
+        """
+        Returns the upper bound in seconds of the bucket holding the given percentile, 0 if nothing was recorded
+        """
+        if not self.count:
+            return 0.0
+        rank = self.count * percent / 100
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if count and seen >= rank:
+                return self.bucket_upper_bound(index)
+        return 0.0
+
+    def merge(self, other):
+        self.buckets = [count + other_count for count, other_count in zip(self.buckets, other.buckets)]
+        self.count += other.count
+        self.total += other.total
+
+
+class StageTimer:
+    """
+    Context manager recording the time spent in a stage into the histograms of that stage
+    """
+
+    def __init__(self, histograms):
+        self.histograms = histograms
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        for histogram in self.histograms:
+            histogram.record(elapsed)
+        return False
+
+
+class Metrics:
+    """
+    This class collects the crawl telemetry: a latency histogram per stage (see STAGES) and event counters. Instead of
+    logging every url, it logs a summary every report_interval seconds with the throughput, the queue size, the trap rate
+    and the p50/p99 latency of every stage over the interval. The whole crawl is summarized by finish.
+
+    Attributes:
+        frontier: the frontier whose size is reported
+        report_interval: seconds between two summaries
+        histograms: the latency histograms of the whole crawl, per stage
+        counters: the event counters of the whole crawl
+    """
+
+    STAGES = ("fetch", "decode", "parse", "tokenize", "validate", "frontier")
+    # The clock is only read every that many pages to decide whether a summary is due
+    CHECK_INTERVAL = 32
+
+    def __init__(self, frontier=None, report_interval=10.0):
+        self.frontier = frontier
+        self.report_interval = report_interval
+        self.histograms = {}
+        self.interval_histograms = {}
+        self.timers = {}
+        self.counters = Counter()
+        self.interval_counters = Counter()
+        self.start_time = time.perf_counter()
+        self.interval_start = self.start_time
+        for stage in self.STAGES:
+            self.add_stage(stage)
+
+    def add_stage(self, stage):
+        self.histograms[stage] = LatencyHistogram()
+        self.interval_histograms[stage] = LatencyHistogram()
+        self.timers[stage] = StageTimer((self.histograms[stage], self.interval_histograms[stage]))
+
+    def stage(self, stage):
+        """
+        Returns a context manager timing a stage, to be used as `with metrics.stage("parse"):`
+        """
+        if stage not in self.timers:
+            self.add_stage(stage)
+        return self.timers[stage]
+
+    def record(self, stage, seconds):
+        """
+        Records the duration of a stage measured by the caller. Unlike stage, it can be used from several threads, at the
+        cost of the odd sample being lost when two threads record at the same time
+        """
+        if stage not in self.timers:
+            self.add_stage(stage)
+        self.histograms[stage].record(seconds)
+        self.interval_histograms[stage].record(seconds)
+
+    def count(self, counter, value=1):
+        self.counters[counter] += value
+        self.interval_counters[counter] += value
+
+    def page_done(self):
+        """
+        Counts a crawled page and logs a summary if the report interval has elapsed
+        """
+        self.count("pages")
+        if self.interval_counters["pages"] % self.CHECK_INTERVAL == 0:
+            now = time.perf_counter()
+            if now - self.interval_start >= self.report_interval:
+                self.log_summary(now)
+
+    def log_summary(self, now):
+        elapsed = now - self.interval_start
+        counters = self.interval_counters
+        checked = counters["links_validated"]
+        logger.info("%s pages/sec, Fetched: %s, Queue size: %s, Trap rate: %.1f%% | %s",
+                    round(counters["pages"] / elapsed, 1), self.counters["pages"],
+                    len(self.frontier) if self.frontier is not None else "-",
+                    100.0 * counters["traps"] / checked if checked else 0.0,
+                    format_stages(self.interval_histograms))
+        for histogram in self.interval_histograms.values():
+            histogram.reset()
+        self.interval_counters = Counter()
+        self.interval_start = now
+
+    def summary(self):
+        """
+        Returns the counters and per stage statistics of the whole crawl
+        """
+        elapsed = time.perf_counter() - self.start_time
+        return {
+            "elapsed": elapsed,
+            "pages_per_sec": self.counters["pages"] / elapsed if elapsed else 0.0,
+            "counters": dict(self.counters),
+            "stages": {stage: {"count": histogram.count, "total": histogram.total, "p50": histogram.percentile(50),
+                               "p99": histogram.percentile(99)}
+                       for stage, histogram in self.histograms.items() if histogram.count}
+        }
+
+    def get_state(self):
+        return {"histograms": self.histograms, "counters": self.counters}
+
+    def merge_state(self, state):
+        """
+        Merges the histograms and counters of another Metrics (see get_state) into this one
+        """
+        for stage, histogram in state["histograms"].items():
+            if stage not in self.timers:
+                self.add_stage(stage)
+            self.histograms[stage].merge(histogram)
+        self.counters.update(state["counters"])
+
+    def finish(self):
+        """
+        Logs the summary of the whole crawl
+        """
+        summary = self.summary()
+        logger.info("Crawled %s pages in %.1fs (%s pages/sec) | %s", self.counters["pages"], summary["elapsed"],
+                    round(summary["pages_per_sec"], 1), format_stages(self.histograms))
+        return summary
+
+
+class NullStageTimer:
+    """
+    A StageTimer doing nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+class NullMetrics:
+    """
+    Stands in for Metrics when instrumentation is disabled, so the instrumented code doesn't need to check for it
+    """
+
+    TIMER = NullStageTimer()
+
+    def stage(self, stage):
+        return self.TIMER
+
+    def record(self, stage, seconds):
+        pass
+
+    def count(self, counter, value=1):
+        pass
+
+    def page_done(self):
+        pass
+
+    def summary(self):
+        return {}
+
+    def get_state(self):
+        return None
+
+    def merge_state(self, state):
+        pass
+
+    def finish(self):
+        return {}
+
+
+def format_stages(histograms):
+    return ", ".join("%s p50=%.2fms p99=%.2fms" % (stage, histogram.percentile(50) * 1000,
+                                                  histogram.percentile(99) * 1000)
+                     for stage, histogram in histograms.items() if histogram.count)
+
+
+class SamplingProfiler:
+    """
+    A statistical profiler sampling the call stack of the main thread on every SIGPROF, which the kernel sends every
+    interval seconds of CPU time. It costs nothing between samples, unlike cProfile which hooks every call. The samples are
+    written in the collapsed stack format read by flame graph tools ("outer;inner;leaf count" per line).
+    Only available on Unix
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+
+    def start(self):
+        signal.signal(signal.SIGPROF, self.sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_DFL)
+
+    def sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append("%s (%s:%s)" % (code.co_name, code.co_filename, frame.f_lineno))
+            frame = frame.f_back
+        self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, file_name):
+        with open(file_name, "w") as profile_file:
+            for stack, count in self.samples.most_common():
+                profile_file.write("%s %s\n" % (stack, count))
+        logger.info("Wrote %s profile samples to %s", sum(self.samples.values()), file_name)
@@ -0,0 +1,161 @@
+"""
+A minimal CBOR (RFC 7049) reader working directly on a buffer (bytes or mmap). Unlike cbor.load, it can decode a map
+while skipping over the values it doesn't need, and locate a byte string without copying it, which lets Corpus read the
+small fields of a corpus file without touching its raw content.
+"""
+import struct
+
+BREAK = 0xff
+
+
+class CBORDecodeError(ValueError):
+    pass
+
+
+def read_head(buf, pos):
+    """
+    Reads the initial byte of a data item and its argument
+    :return: (major type, argument or None for indefinite length items, position after the head)
+    """
+    initial = buf[pos]
+    major = initial >> 5
+    info = initial & 0x1f
+    pos += 1
+    if info < 24:
+        return major, info, pos
+    if info == 24:
+        return major, buf[pos], pos + 1
+    if info == 25:
+        return major, struct.unpack_from(">H", buf, pos)[0], pos + 2
+    if info == 26:
+        return major, struct.unpack_from(">I", buf, pos)[0], pos + 4
+    if info == 27:
+        return major, struct.unpack_from(">Q", buf, pos)[0], pos + 8
+    if info == 31 and major in (2, 3, 4, 5):
+        return major, None, pos
+    raise CBORDecodeError("invalid additional information %s at offset %s" % (info, pos - 1))
+
+
+def decode(buf, pos=0):
+    """
+    Decodes the data item starting at pos. Byte strings are returned as bytes, text strings as str, maps as dicts
+    :return: (value, position after the item)
+    """
+    initial = buf[pos]
+    major = initial >> 5
+    # fast path for the small integers and short strings most keys and fields are made of
+    if initial < 0x18:
+        return initial, pos + 1
+    if major in (2, 3) and initial & 0x1f < 24:
+        end = pos + 1 + (initial & 0x1f)
+        value = bytes(buf[pos + 1:end])
+        return (value if major == 2 else value.decode("utf-8")), end
+    if major == 7:
+        info = initial & 0x1f
+        if info == 20:
+            return False, pos + 1
+        if info == 21:
+            return True, pos + 1
+        if info in (22, 23):
+            return None, pos + 1
+        if info == 25:
+            return struct.unpack_from(">e", buf, pos + 1)[0], pos + 3
+        if info == 26:
+            return struct.unpack_from(">f", buf, pos + 1)[0], pos + 5
+        if info == 27:
+            return struct.unpack_from(">d", buf, pos + 1)[0], pos + 9
+        _, value, pos = read_head(buf, pos)
+        return value, pos
+
+    major, length, pos = read_head(buf, pos)
+    if major == 0:
+        return length, pos
+    if major == 1:
+        return -1 - length, pos
+    if major in (2, 3):
+        if length is None:
+            chunks = []
+            while buf[pos] != BREAK:
+                chunk, pos = decode(buf, pos)
+                chunks.append(chunk)
+            value = (b"" if major == 2 else "").join(chunks)
+            return value, pos + 1
+        value = bytes(buf[pos:pos + length])
+        return (value if major == 2 else value.decode("utf-8")), pos + length
+    if major == 4:
+        items = []
+        while (len(items) < length) if length is not None else (buf[pos] != BREAK):
+            item, pos = decode(buf, pos)
+            items.append(item)
+        return items, (pos if length is not None else pos + 1)
+    if major == 5:
+        items = {}
+        count = 0
+        while (count < length) if length is not None else (buf[pos] != BREAK):
+            key, pos = decode(buf, pos)
+            items[key], pos = decode(buf, pos)
+            count += 1
+        return items, (pos if length is not None else pos + 1)
+    # major 6, tagged item: bignums are converted to ints, other tags are ignored
+    value, pos = decode(buf, pos)
+    if length in (2, 3) and isinstance(value, bytes):
+        value = int.from_bytes(value, "big")
+        if length == 3:
+            value = -1 - value
+    return value, pos
+
+
+def skip(buf, pos):
+    """
+    Returns the position after the data item starting at pos, without decoding it
+    """
+    major, length, pos = read_head(buf, pos)
+    if length is None:
+        while buf[pos] != BREAK:
+            pos = skip(buf, pos)
+        return pos + 1
+    if major in (2, 3):
+        return pos + length
+    if major == 4:
+        for _ in range(length):
+            pos = skip(buf, pos)
+    elif major == 5:
+        for _ in range(2 * length):
+            pos = skip(buf, pos)
+    elif major == 6:
+        pos = skip(buf, pos)
+    return pos
+
+
+def byte_string_span(buf, pos):
+    """
+    Returns the (start, end) offsets of the content of the definite length byte string starting at pos, or None if the
+    item is something else
+    """
+    major, length, pos = read_head(buf, pos)
+    if major != 2 or length is None:
+        return None
+    return pos, pos + length
+
+
+def decode_map(buf, pos=0, lazy_keys=()):
+    """
+    Decodes the map starting at pos like decode, except for the values of lazy_keys which are skipped over
+    :return: (dict of the decoded entries, dict of the positions of the skipped values, position after the map)
+    """
+    major, length, pos = read_head(buf, pos)
+    if major != 5:
+        raise CBORDecodeError("expected a map at offset %s" % pos)
+    items = {}
+    lazy_items = {}
+    count = 0
+    while (count < length) if length is not None else (buf[pos] != BREAK):
+        key, pos = decode(buf, pos)
+        if key in lazy_keys:
+            lazy_items[key] = pos
+            pos = skip(buf, pos)
+        else:
+            items[key], pos = decode(buf, pos)
+        count += 1
+    return items, lazy_items, (pos if length is not None else pos + 1)
+
@@ -0,0 +1,160 @@
+from array import array
+
+import numpy as np
+
+from scheduler import url_host
+
+
+class LinkGraph:
+    """
+    This class records the link graph of the crawl: every page crawled and every valid link found on it. Urls get integer
+    ids in the order they are first seen and the edges are appended to two arrays of ids (sources and targets), so an
+    edge costs 8 bytes rather than a Python object. The analytics freeze the edges into a CSR adjacency (see freeze) and
+    are computed with numpy.
+
+    Attributes:
+        ids: the id of every url
+        urls: the url of every id
+        sources, targets: the ids of the two ends of every edge
+        page_urls, page_sources, page_targets: the same, only for the current page (see start_page)
+    """
+
+    def __init__(self):
+        self.ids = {}
+        self.urls = []
+        self.sources = array("I")
+        self.targets = array("I")
+        # (indptr, indices) of the CSR adjacency, until an edge is added
+        self.csr = None
+        self.start_page()
+
+    def start_page(self):
+        """
+        Starts tracking the edges added by a new page
+        """
+        self.page_urls = []
+        self.page_sources = array("I")
+        self.page_targets = array("I")
+
+    def url_id(self, url):
+        url_id = self.ids.get(url)
+        if url_id is None:
+            url_id = self.ids[url] = len(self.urls)
+            self.urls.append(url)
+        return url_id
+
+    def add_page(self, url, links):
+        """
+        Adds the edges from a page to its links. A link found several times on the page counts once, and links to the
+        page itself are left out
+        """
+        links = [link for link in dict.fromkeys(links) if link != url]
+        source = self.url_id(url)
+        self.sources.extend([source] * len(links))
+        self.targets.extend([self.url_id(link) for link in links])
+        self.page_urls = [url] + links
+        self.page_sources = array("I", bytes(4 * len(links)))
+        self.page_targets = array("I", range(1, len(links) + 1))
+        self.csr = None
+
+    def get_state(self):
+        return {"urls": self.urls, "sources": self.sources, "targets": self.targets}
+
+    def get_page_state(self):
+        return {"urls": self.page_urls, "sources": self.page_sources, "targets": self.page_targets}
+
+    def merge_state(self, state):
+        """
+        Merges the edges of another graph (see get_state and get_page_state) into this one
+        """
+        if not state["sources"]:
+            for url in state["urls"]:
+                self.url_id(url)
+            return
+        ids = np.array([self.url_id(url) for url in state["urls"]], dtype=np.uint32)
+        self.sources.frombytes(ids[np.array(state["sources"], dtype=np.int64)].tobytes())
+        self.targets.frombytes(ids[np.array(state["targets"], dtype=np.int64)].tobytes())
+        self.csr = None
+
+    def edges_count(self):
+        return len(self.sources)
+
+    def freeze(self):
+        """
+        Returns the CSR adjacency of the graph: the targets of the edges of id i are indices[indptr[i]:indptr[i + 1]]
+        """
+        if self.csr is None:
+            sources = np.array(self.sources, dtype=np.int64)
+            targets = np.array(self.targets, dtype=np.int64)
+            indptr = np.zeros(len(self.urls) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(sources, minlength=len(self.urls)), out=indptr[1:])
+            self.csr = (indptr, targets[np.argsort(sources, kind="stable")])
+        return self.csr
+
+    def out_degrees(self):
+        return np.diff(self.freeze()[0])
+
+    def in_degrees(self):
+        return np.bincount(self.freeze()[1], minlength=len(self.urls))
+
+    def pagerank(self, damping=0.85, tolerance=1e-6, max_iterations=100):
+        """
+        Returns the PageRank of every id, computed by power iteration until the ranks change by less than tolerance in
+        total. The rank of the pages without outlinks (including the ones that were not crawled) is spread over all pages
+        """
+        indptr, indices = self.freeze()
+        num_urls = len(self.urls)
+        if not num_urls:
+            return np.zeros(0)
+        out_degrees = np.diff(indptr)
+        edge_sources = np.repeat(np.arange(num_urls), out_degrees)
+        dangling = out_degrees == 0
+        inverse_degrees = np.zeros(num_urls)
+        inverse_degrees[~dangling] = 1.0 / out_degrees[~dangling]
+        ranks = np.full(num_urls, 1.0 / num_urls)
+        for _ in range(max_iterations):
+            contributions = np.bincount(indices, weights=(ranks * inverse_degrees)[edge_sources], minlength=num_urls)
+            new_ranks = (1 - damping) / num_urls + damping * (contributions + ranks[dangling].sum() / num_urls)
+            change = np.abs(new_ranks - ranks).sum()
+            ranks = new_ranks
+            if change < tolerance:
+                break
+        return ranks
+
+    def top_urls(self, scores, n, decimals=None):
+        """
+        Returns the n urls with the largest scores (ties in url order, which unlike the ids does not depend on the order
+        the pages were crawled in) with their scores
+        :param decimals: optional number of decimals the scores are rounded to before ranking them
+        """
+        if decimals is not None:
+            scores = np.round(scores, decimals)
+        if n <= 0 or not len(scores):
+            return []
+        # only the urls scoring at least the n-th largest score can make it, whatever the ties
+        threshold = -np.partition(-scores, min(n, len(scores)) - 1)[min(n, len(scores)) - 1]
+        candidates = np.flatnonzero(scores >= threshold).tolist()
+        top = sorted(candidates, key=lambda url_id: (-scores[url_id], self.urls[url_id]))[:n]
+        return [(self.urls[url_id], scores[url_id].item()) for url_id in top]
+
+    def subdomain_connectivity(self):
+        """
+        Returns, for every subdomain in alphabetical order, the number of links between its pages, the number of links to
+        and from other subdomains and the number of other subdomains it links to
+        """
+        indptr, indices = self.freeze()
+        hosts = {}
+        url_hosts = np.array([hosts.setdefault(url_host(url), len(hosts)) for url in self.urls], dtype=np.int64)
+        num_hosts = len(hosts)
+        source_hosts = url_hosts[np.repeat(np.arange(len(self.urls)), np.diff(indptr))]
+        target_hosts = url_hosts[indices]
+        internal = source_hosts == target_hosts
+        internal_links = np.bincount(source_hosts[internal], minlength=num_hosts)
+        outgoing_links = np.bincount(source_hosts[~internal], minlength=num_hosts)
+        incoming_links = np.bincount(target_hosts[~internal], minlength=num_hosts)
+        host_pairs = np.unique(source_hosts[~internal] * num_hosts + target_hosts[~internal])
+        linked_subdomains = np.bincount(host_pairs // num_hosts, minlength=num_hosts) if num_hosts else host_pairs
+        return {host: {"internal_links": internal_links[index].item(), "outgoing_links": outgoing_links[index].item(),
+                       "incoming_links": incoming_links[index].item(),
+                       "linked_subdomains": linked_subdomains[index].item()}
+                for host, index in sorted(hosts.items())}
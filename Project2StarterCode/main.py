@@ -1,29 +1,194 @@
+import argparse
 import atexit
 import logging
 
-import sys
-
-from corpus import Corpus
+from budgets import CrawlBudget
+from checkpoint import CheckpointJournal
+from corpus import Corpus, PackedCorpus
 from crawler import Crawler
 from frontier import Frontier
+from instrumentation import Metrics, SamplingProfiler
+from linkgraph import LinkGraph
+from neardup import NearDuplicateIndex
+from parallel import ParallelCrawler
+from pipeline import PipelinedCrawler
+from recrawl import RecrawlManifest
+from scheduler import PRIORITIES, HostQueue
+from traps import TrapDetector
 
 if __name__ == "__main__":
+    # Parses the cmd args
+    parser = argparse.ArgumentParser()
+    parser.add_argument("corpus_dir", help="path to the corpus directory")
+    parser.add_argument("--packed", action="store_true",
+                        help="corpus_dir holds a corpus packed into segments by packcorpus.py")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of crawler processes; the frontier is sharded by hostname when more than 1. "
+                             "Pages are crawled in another order than with 1, so once a url template uses up its "
+                             "--trap-budget, the urls reported as traps (and the pages crawled) can differ")
+    parser.add_argument("--prefetch", type=int, default=0,
+                        help="number of upcoming frontier urls read from the corpus in background threads while parsing")
+    parser.add_argument("--host-queues", action="store_true",
+                        help="keep a queue per host and serve the hosts in round robin instead of one FIFO queue")
+    parser.add_argument("--host-weight", action="append", default=[], metavar="HOST=WEIGHT",
+                        help="with --host-queues, number of urls served in a row from HOST (1 by default)")
+    parser.add_argument("--priority", choices=sorted(PRIORITIES),
+                        help="with --host-queues, serve the urls of a host by increasing score instead of FIFO: depth "
+                             "is the number of links from the seed, path-depth the number of path segments")
+    parser.add_argument("--max-in-flight", type=int,
+                        help="with --prefetch, number of urls of a host that can be prefetched at the same time")
+    parser.add_argument("--no-manifest", action="store_true",
+                        help="check the corpus directory on every lookup instead of using an in-memory manifest")
+    parser.add_argument("--eager-decode", action="store_true",
+                        help="decode whole corpus files upfront instead of reading their content only when it is parsed")
+    parser.add_argument("--checkpoint", action="store_true",
+                        help="journal every crawled page so that the crawl can be resumed after a crash")
+    parser.add_argument("--trap-budget", type=int, default=1000,
+                        help="number of urls crawled per url template before the template is considered a trap")
+    parser.add_argument("--word-capacity", type=int,
+                        help="bound the memory of the word counts by only ranking this many most common words")
+    parser.add_argument("--word-sketch", action="store_true",
+                        help="with --word-capacity, estimate the counts of evicted words with a count-min sketch")
+    parser.add_argument("--url-cache-size", type=int, default=50000,
+                        help="number of recently validated links whose verdict is cached (0 disables the cache)")
+    parser.add_argument("--near-duplicates", type=int, metavar="DISTANCE",
+                        help="do not follow the links of pages whose SimHash is within DISTANCE bits of a crawled page")
+    parser.add_argument("--near-duplicate-min-tokens", type=int, default=100, metavar="TOKENS",
+                        help="with --near-duplicates, only match the pages having at least this many tokens")
+    parser.add_argument("--link-graph", action="store_true",
+                        help="record the link graph and report in-degrees, out-degrees, PageRank and subdomain links")
+    parser.add_argument("--recrawl", action="store_true",
+                        help="crawl again from the seed url, only parsing the pages whose corpus file changed since the "
+                             "last --recrawl run")
+    parser.add_argument("--budget-config", metavar="FILE",
+                        help="JSON file holding the crawl budget settings (the names of the budget options with "
+                             "underscores); the options given on the command line override it")
+    parser.add_argument("--max-subdomain-pages", type=int,
+                        help="number of urls added to the frontier per subdomain, the links over it are skipped")
+    parser.add_argument("--max-depth", type=int,
+                        help="number of links between the seed and a url, the deeper links are skipped")
+    parser.add_argument("--max-fetches", type=int,
+                        help="stop the crawl once this many urls were fetched, resumed runs included")
+    parser.add_argument("--max-seconds", type=float, help="stop the crawl after running for this many seconds")
+    parser.add_argument("--min-new-url-rate", type=float,
+                        help="stop the crawl once a window of pages adds fewer new urls per page than this")
+    parser.add_argument("--rate-window", type=int,
+                        help="number of pages the new url rate of --min-new-url-rate is measured over (1000 by default)")
+    parser.add_argument("--no-metrics", action="store_true",
+                        help="disable the stage latency histograms and the periodic progress summary")
+    parser.add_argument("--metrics-interval", type=float, default=10.0,
+                        help="seconds between two progress summaries")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="sample the call stack while crawling and write it to FILE in the collapsed stack format")
+    args = parser.parse_args()
+    if args.checkpoint and args.workers > 1:
+        parser.error("--checkpoint is not supported with more than one worker")
+    if args.prefetch and args.workers > 1:
+        parser.error("--prefetch is not supported with more than one worker")
+    if args.near_duplicates is not None and args.workers > 1:
+        parser.error("--near-duplicates is not supported with more than one worker")
+    if args.recrawl and args.workers > 1:
+        parser.error("--recrawl is not supported with more than one worker")
+    if not args.host_queues and (args.host_weight or args.priority):
+        parser.error("--host-weight and --priority require --host-queues")
+    if args.priority == "depth" and args.workers > 1:
+        parser.error("--priority depth is not supported with more than one worker")
+    if not args.prefetch and args.max_in_flight is not None:
+        parser.error("--max-in-flight requires --prefetch")
+    if args.max_in_flight is not None and args.max_in_flight < 1:
+        parser.error("--max-in-flight must be at least 1")
+    weights = {}
+    for host_weight in args.host_weight:
+        host, _, weight = host_weight.rpartition("=")
+        if not host or not weight.isdecimal() or int(weight) < 1:
+            parser.error("invalid --host-weight %r, expected HOST=WEIGHT with a positive integer WEIGHT" % host_weight)
+        weights[host] = int(weight)
+    try:
+        budget = CrawlBudget.from_config(args.budget_config) if args.budget_config else CrawlBudget()
+    except (OSError, ValueError, TypeError) as error:
+        parser.error("invalid --budget-config: %s" % error)
+    for limit in CrawlBudget.LIMITS:
+        if getattr(args, limit) is not None:
+            setattr(budget, limit, getattr(args, limit))
+    budget = budget if budget.is_enabled() else None
+    if budget is not None and args.workers > 1:
+        parser.error("crawl budgets are not supported with more than one worker")
+
     # Configures basic logging
     logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
                         level=logging.INFO)
 
-    # Instantiates frontier and loads the last state if exists
-    frontier = Frontier()
-    frontier.load_frontier()
+    # Instantiates frontier, the link depths are needed by the max depth budget and the depth priority
+    track_depths = (budget is not None and budget.max_depth is not None) or args.priority == "depth"
+    if args.host_queues:
+        frontier = Frontier(urls_queue=HostQueue(priority=PRIORITIES.get(args.priority), weights=weights),
+                            track_depths=track_depths, budget=budget)
+    else:
+        frontier = Frontier(track_depths=track_depths, budget=budget)
 
     # Instantiates corpus object with the given cmd arg
-    corpus = Corpus(sys.argv[1])
+    if args.packed:
+        corpus = PackedCorpus(args.corpus_dir, lazy_decode=not args.eager_decode)
+    else:
+        corpus = Corpus(args.corpus_dir, use_manifest=not args.no_manifest, lazy_decode=not args.eager_decode)
+
+    # Instantiates a crawler object
+    trap_detector = TrapDetector(budget=args.trap_budget)
+    metrics = None if args.no_metrics else Metrics(frontier, report_interval=args.metrics_interval)
+    near_duplicates = None
+    if args.near_duplicates is not None:
+        near_duplicates = NearDuplicateIndex(args.near_duplicates, min_tokens=args.near_duplicate_min_tokens)
+    link_graph = LinkGraph() if args.link_graph else None
+    recrawl_manifest = None
+    if args.recrawl:
+        recrawl_manifest = RecrawlManifest(corpus)
+        recrawl_manifest.load()
+        atexit.register(recrawl_manifest.save)
+    if args.workers > 1:
+        crawler = ParallelCrawler(frontier, corpus, num_workers=args.workers, trap_detector=trap_detector,
+                                  metrics=metrics, word_capacity=args.word_capacity, word_sketch=args.word_sketch,
+                                  url_cache_size=args.url_cache_size, link_graph=link_graph)
+    elif args.prefetch:
+        crawler = PipelinedCrawler(frontier, corpus, prefetch_depth=args.prefetch, max_in_flight=args.max_in_flight,
+                                   trap_detector=trap_detector, metrics=metrics, word_capacity=args.word_capacity,
+                                   word_sketch=args.word_sketch,
+                                   near_duplicates=near_duplicates, url_cache_size=args.url_cache_size,
+                                   link_graph=link_graph, recrawl_manifest=recrawl_manifest, budget=budget)
+    else:
+        crawler = Crawler(frontier, corpus, trap_detector=trap_detector, metrics=metrics,
+                          word_capacity=args.word_capacity, word_sketch=args.word_sketch,
+                          near_duplicates=near_duplicates, url_cache_size=args.url_cache_size,
+                          link_graph=link_graph, recrawl_manifest=recrawl_manifest, budget=budget)
+    corpus.metrics = crawler.metrics
+
+    # Restores the last checkpoint or loads the last frontier state if exists
+    if args.checkpoint:
+        crawler.journal = CheckpointJournal(frontier, crawler)
+        atexit.register(crawler.journal.close)
+        if not crawler.journal.restore():
+            if args.recrawl:
+                frontier.add_url(Frontier.SEED_URL)
+            else:
+                frontier.load_frontier()
+            # the journal only records changes, so it needs a snapshot of the state it starts from
+            crawler.journal.snapshot()
+    elif args.recrawl:
+        # a recrawl starts over, the state of the previous crawl is in the recrawl manifest
+        frontier.add_url(Frontier.SEED_URL)
+    else:
+        frontier.load_frontier()
 
     # Registers a shutdown hook to save frontier state upon unexpected shutdown
     atexit.register(frontier.save_frontier)
 
-    # Instantiates a crawler object and starts crawling
-    crawler = Crawler(frontier, corpus)
+    # Starts crawling
+    if args.profile:
+        profiler = SamplingProfiler()
+        profiler.start()
+    if budget is not None:
+        budget.start()
     crawler.start_crawling()
+    if args.profile:
+        profiler.stop()
+        profiler.write(args.profile)
     crawler.write_analytics_report_to_file("my_crawler_report.txt")
-
@@ -0,0 +1,163 @@
+import hashlib
+
+# SPREAD[k][b] spreads the 8 bits of the byte b found at position k of a hash into 8 of the 64 counters packed in an
+# int, each counter taking COUNTER_BITS bits. Adding the spread hashes of the tokens adds 1 to the counter of every bit
+# set in their hash, 64 counters at a time
+COUNTER_BITS = 32
+COUNTER_MASK = (1 << COUNTER_BITS) - 1
+SPREAD = [[sum(((byte >> bit) & 1) << (COUNTER_BITS * (8 * position + bit)) for bit in range(8)) for byte in range(256)]
+          for position in range(8)]
+
+
+def shingles(token_list, size=4):
+    """
+    Returns the distinct runs of size consecutive tokens of a page (its shingles), or the whole page as a single shingle
+    if it is shorter than that
+    """
+    if len(token_list) <= size:
+        return {" ".join(token_list): 1}
+    return dict.fromkeys((" ".join(token_list[i:i + size]) for i in range(len(token_list) - size + 1)), 1)
+
+
+def simhash(token_counts):
+    """
+    Returns the 64 bit SimHash of a page from the counts of its tokens: every bit is set if the tokens whose hash has that
+    bit set make up more than half of the page (counting every token as many times as it appears). Pages sharing most
+    of their tokens get hashes differing in a few bits. The tokens are hashed with blake2b, so hashes are stable across
+    processes and runs
+    """
+    s0, s1, s2, s3, s4, s5, s6, s7 = SPREAD
+    packed_counts = 0
+    total = 0
+    for token, count in token_counts.items():
+        digest = hashlib.blake2b(token.encode("utf-8", "surrogatepass"), digest_size=8).digest()
+        packed_counts += count * (s0[digest[0]] | s1[digest[1]] | s2[digest[2]] | s3[digest[3]] | s4[digest[4]] |
+                                  s5[digest[5]] | s6[digest[6]] | s7[digest[7]])
+        total += count
+    fingerprint = 0
+    for bit in range(64):
+        if 2 * ((packed_counts >> (COUNTER_BITS * bit)) & COUNTER_MASK) > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+class NearDuplicateIndex:
+    """
+    This class finds the pages whose SimHash is within max_distance bits of a page seen before. The hashes are split into
+    max_distance + 1 bands and indexed by band (LSH): two hashes differing in at most max_distance bits are equal on at
+    least one band, so only the pages sharing a band with the new page need to be compared.
+
+    Pages are hashed from their shingles (see shingles), each counted once: the hash of the counts of their words would
+    be the same for any two long pages drawing their words from the same vocabulary, whatever the order of the words.
+    Pages of fewer than min_tokens tokens (e.g. navigation or error pages) are too short for their hashes to be told
+    apart, and are neither matched nor indexed.
+
+    Every page that is not a near-duplicate is the representative of its own cluster, and the near-duplicates found are
+    added to the cluster of the page they matched. The valid links of a near-duplicate that were not in the frontier
+    yet are not followed, they are kept in skipped_links to measure the coverage lost (see uncovered_links).
+
+    Attributes:
+        max_distance: the largest number of different bits between two near-duplicate hashes
+        bands: for every band, the urls of the representatives by value of the band
+        fingerprints: the hash of every representative
+        clusters: the near-duplicates of every representative that has some
+        skipped_links: the links of the near-duplicates that were not added to the frontier
+        page_fingerprints, page_clusters, page_skipped_links: the same, only for the current page (see start_page)
+    """
+
+    def __init__(self, max_distance=3, min_tokens=100, shingle_size=4):
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens
+        self.shingle_size = shingle_size
+        num_bands = max_distance + 1
+        # (shift, mask) of every band, the last band taking the remaining bits
+        self.band_masks = [(64 * band // num_bands, (1 << (64 * (band + 1) // num_bands - 64 * band // num_bands)) - 1)
+                           for band in range(num_bands)]
+        self.bands = [{} for _ in range(num_bands)]
+        self.fingerprints = {}
+        self.clusters = {}
+        self.skipped_links = []
+        self.page_fingerprints = {}
+        self.page_clusters = {}
+        self.page_skipped_links = []
+
+    def start_page(self):
+        """
+        Starts tracking the changes made while crawling a new page
+        """
+        self.page_fingerprints = {}
+        self.page_clusters = {}
+        self.page_skipped_links = []
+
+    def fingerprint(self, token_list):
+        """
+        Returns the hash of a page from its tokens, None if it has none
+        """
+        return simhash(shingles(token_list, self.shingle_size)) if token_list else None
+
+    def find(self, fingerprint):
+        """
+        Returns the url of a representative whose hash is within max_distance bits of fingerprint, None if there is none
+        """
+        for band, (shift, mask) in zip(self.bands, self.band_masks):
+            for url in band.get((fingerprint >> shift) & mask, ()):
+                if bin(self.fingerprints[url] ^ fingerprint).count("1") <= self.max_distance:
+                    return url
+        return None
+
+    def add(self, url, fingerprint, token_count):
+        """
+        Adds a page to the index, unless it has fewer than min_tokens tokens
+        :param fingerprint: the hash of the page (see fingerprint)
+        :return: the url of the page it is a near-duplicate of, None if it is a new or short page
+        """
+        if fingerprint is None or token_count < self.min_tokens:
+            return None
+        duplicate_of = self.find(fingerprint)
+        if duplicate_of is None:
+            self.add_representative(url, fingerprint)
+            self.page_fingerprints[url] = fingerprint
+        else:
+            self.clusters.setdefault(duplicate_of, []).append(url)
+            self.page_clusters.setdefault(duplicate_of, []).append(url)
+        return duplicate_of
+
+    def add_representative(self, url, fingerprint):
+        self.fingerprints[url] = fingerprint
+        for band, (shift, mask) in zip(self.bands, self.band_masks):
+            band.setdefault((fingerprint >> shift) & mask, []).append(url)
+
+    def skip_links(self, links):
+        """
+        Records the links of a near-duplicate that are not followed
+        """
+        self.skipped_links.extend(links)
+        self.page_skipped_links.extend(links)
+
+    def uncovered_links(self, frontier):
+        """
+        Returns the skipped links that no other page led the crawl to, i.e. the urls the crawl missed because of
+        near-duplicates
+        """
+        return [link for link in dict.fromkeys(self.skipped_links) if not frontier.is_duplicate(link)]
+
+    def duplicates_count(self):
+        return sum(len(duplicates) for duplicates in self.clusters.values())
+
+    def get_state(self):
+        return {"fingerprints": self.fingerprints, "clusters": self.clusters, "skipped_links": self.skipped_links}
+
+    def get_page_state(self):
+        return {"fingerprints": self.page_fingerprints, "clusters": self.page_clusters,
+                "skipped_links": self.page_skipped_links}
+
+    def merge_state(self, state):
+        """
+        Merges the state of another index (see get_state and get_page_state) into this one
+        """
+        for url, fingerprint in state["fingerprints"].items():
+            if url not in self.fingerprints:
+                self.add_representative(url, fingerprint)
+        for url, duplicates in state["clusters"].items():
+            self.clusters.setdefault(url, []).extend(duplicates)
+        self.skipped_links.extend(state.get("skipped_links", ()))
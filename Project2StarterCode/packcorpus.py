@@ -0,0 +1,88 @@
+import argparse
+import json
+import logging
+import os
+import pickle
+import time
+
+from corpus import PackedCorpus
+
+logger = logging.getLogger(__name__)
+
+# Segments are closed once they reach this size, so that no single file gets too large to copy around
+DEFAULT_SEGMENT_SIZE = 1 << 30
+
+
+def pack_corpus(corpus_dir, packed_dir, segment_size=DEFAULT_SEGMENT_SIZE):
+    """
+    Packs the files of a corpus directory into a few segment files readable by PackedCorpus. The files are copied as they
+    are, back to back, and the index of their (segment, offset, length) is written last, so an interrupted packing never
+    leaves a usable but incomplete packed corpus.
+
+    :param segment_size: size in bytes after which a new segment is started
+    :return: a summary of the packed corpus
+    """
+    if os.path.isfile(os.path.join(packed_dir, PackedCorpus.INDEX_FILE_NAME)):
+        raise ValueError("%s already holds a packed corpus" % packed_dir)
+    if not os.path.exists(packed_dir):
+        os.makedirs(packed_dir)
+
+    start = time.perf_counter()
+    with os.scandir(corpus_dir) as entries:
+        file_names = sorted(entry.name for entry in entries if entry.is_file())
+
+    segments = []
+    digests = {}
+    names = {}
+    segment_file = None
+    offset = 0
+    total = 0
+    try:
+        for file_name in file_names:
+            with open(os.path.join(corpus_dir, file_name), "rb") as corpus_file:
+                data = corpus_file.read()
+            if segment_file is None or offset >= segment_size:
+                if segment_file is not None:
+                    segment_file.close()
+                segments.append(PackedCorpus.SEGMENT_FILE_NAME % len(segments))
+                segment_file = open(os.path.join(packed_dir, segments[-1]), "wb")
+                offset = 0
+            segment_file.write(data)
+
+            # same keys as the manifest of Corpus: raw digests for sha224 hex names, the name for any other file
+            location = (len(segments) - 1, offset, len(data))
+            try:
+                digest = bytes.fromhex(file_name) if len(file_name) == 56 else None
+            except ValueError:
+                digest = None
+            if digest is None:
+                names[file_name] = location
+            else:
+                digests[digest] = location
+            offset += len(data)
+            total += len(data)
+    finally:
+        if segment_file is not None:
+            segment_file.close()
+
+    temp_file_name = os.path.join(packed_dir, "%s.%s.tmp" % (PackedCorpus.INDEX_FILE_NAME, os.getpid()))
+    with open(temp_file_name, "wb") as index_file:
+        pickle.dump({"segments": segments, "digests": digests, "names": names}, index_file, pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_file_name, os.path.join(packed_dir, PackedCorpus.INDEX_FILE_NAME))
+
+    elapsed = time.perf_counter() - start
+    logger.info("Packed %s files (%s bytes) into %s segments in %.1fs", len(file_names), total, len(segments), elapsed)
+    return {"files": len(file_names), "bytes": total, "segments": len(segments), "time": elapsed}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packs a corpus directory into segment files read by PackedCorpus")
+    parser.add_argument("corpus_dir", help="corpus directory to pack")
+    parser.add_argument("packed_dir", help="directory to write the segments and their index to")
+    parser.add_argument("--segment-size", type=int, default=DEFAULT_SEGMENT_SIZE,
+                        help="size in bytes after which a new segment is started")
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
+                        level=logging.INFO)
+    print(json.dumps(pack_corpus(args.corpus_dir, args.packed_dir, args.segment_size), indent=2))
@@ -0,0 +1,217 @@
+import logging
+import multiprocessing
+import queue
+import traceback
+import zlib
+from collections import deque
+from urllib.parse import urlparse
+
+from crawler import Crawler
+from frontier import Frontier
+from instrumentation import Metrics
+from linkgraph import LinkGraph
+from scheduler import HostQueue
+
+logger = logging.getLogger(__name__)
+
+
+def shard_of(url, num_shards):
+    """
+    Returns the index of the worker that owns the given url. Urls are partitioned by hostname (the same key Crawler uses
+    for subdomain_count) using crc32, which unlike hash() is stable across processes
+    """
+    hostname = urlparse(url).hostname or ""
+    return zlib.crc32(hostname.encode("utf-8")) % num_shards
+
+
+class ShardCrawler(Crawler):
+    """
+    The Crawler of a worker. Pages go through Crawler.process_url like in a serial crawl, so the stage timings and the
+    counters are recorded the same way, except that the outlinks owned by other shards are collected in outgoing, to be
+    routed to their inbox, instead of being added to the frontier of this shard
+    """
+
+    def __init__(self, frontier, corpus, shard, num_shards, **kwargs):
+        super().__init__(frontier, corpus, **kwargs)
+        self.shard = shard
+        self.num_shards = num_shards
+        # the outlinks of the current page owned by other shards, per shard
+        self.outgoing = {}
+
+    def add_to_frontier(self, url, depth=0):
+        owner = shard_of(url, self.num_shards)
+        if owner != self.shard:
+            self.outgoing.setdefault(owner, []).append(url)
+            return False
+        return super().add_to_frontier(url, depth)
+
+
+def _add_pending(pending, delta):
+    with pending.get_lock():
+        pending.value += delta
+
+
+def _crawl_shard(shard, num_shards, corpus, trap_detector, queued_urls, urls_set, inboxes, pending, results,
+                 report_interval=None, link_graph=False, crawler_options=None):
+    """
+    Worker process entry point, see _run_shard. A failure is posted to results as (shard, None, traceback) so that the
+    parent does not wait for a result that will never come
+    """
+    try:
+        _run_shard(shard, num_shards, corpus, trap_detector, queued_urls, urls_set, inboxes, pending, results,
+                   report_interval, link_graph, crawler_options)
+    except BaseException:
+        logger.exception("[shard %s] Crawler worker failed", shard)
+        results.put((shard, None, traceback.format_exc()))
+
+
+def _run_shard(shard, num_shards, corpus, trap_detector, queued_urls, urls_set, inboxes, pending, results,
+               report_interval, link_graph, crawler_options):
+    """
+    Crawls every url owned by this shard and routes outlinks owned by other shards to their inbox, along with the
+    templates the page marked as traps (every shard gets those, so that the shard owning a host rejects the other urls
+    of a trapped template too). `pending` counts urls that are queued, in transit or being processed across all shards;
+    it only reaches zero once the whole crawl is done. Progress summaries are logged every report_interval seconds,
+    unless it is None. With link_graph, the links of the shard are recorded to a LinkGraph. crawler_options are passed on
+    to the Crawler of the shard. queued_urls is a HostQueue when the frontier schedules its urls per host
+    """
+    frontier = Frontier(urls_queue=queued_urls if isinstance(queued_urls, HostQueue) else deque(queued_urls))
+    frontier.urls_set = urls_set
+    metrics = Metrics(frontier, report_interval) if report_interval is not None else None
+    crawler = ShardCrawler(frontier, corpus, shard, num_shards, trap_detector=trap_detector, metrics=metrics,
+                           link_graph=LinkGraph() if link_graph else None, **(crawler_options or {}))
+    corpus.metrics = crawler.metrics
+    inbox = inboxes[shard]
+
+    def receive(message):
+        trap_templates, links = message
+        for template in trap_templates:
+            crawler.trap_detector.mark_trap_template(template)
+        added = 0
+        for link in links:
+            if crawler.add_to_frontier(link):
+                added += 1
+            else:
+                _add_pending(pending, -1)
+        # counted by the shard adding them, the page they were found on only counts the links of its own shard
+        crawler.metrics.count("links_added", added)
+
+    while True:
+        try:
+            while True:
+                receive(inbox.get_nowait())
+        except queue.Empty:
+            pass
+
+        if frontier.has_next_url():
+            url = frontier.get_next_url()
+            logger.debug("[shard %s] Fetching URL %s ... Fetched: %s, Queue size: %s", shard, url, frontier.fetched,
+                         len(frontier))
+
+            crawler.outgoing = {}
+            _add_pending(pending, len(crawler.process_url(url)))
+
+            # the page state only holds the templates marked by this page, not the ones received from other shards
+            trap_templates = list(crawler.trap_detector.page_trapped_templates)
+            for owner in range(num_shards):
+                links = crawler.outgoing.get(owner, [])
+                if owner != shard and (links or trap_templates):
+                    _add_pending(pending, len(links))
+                    inboxes[owner].put((trap_templates, links))
+
+            # the page itself is done only after its outlinks have been counted
+            _add_pending(pending, -1)
+        elif pending.value == 0:
+            break
+        else:
+            try:
+                receive(inbox.get(timeout=0.05))
+            except queue.Empty:
+                pass
+
+    results.put((shard, crawler.get_crawl_state(), frontier.urls_set, frontier.fetched, crawler.metrics.get_state()))
+
+
+class ParallelCrawler(Crawler):
+    """
+    A crawler that partitions the frontier by hostname across num_workers processes. Every worker runs a regular Crawler
+    over its own shard and keeps its own partial analytics, which are merged into this crawler once all the workers are
+    done, so generate_analytics_report and write_analytics_report_to_file work as usual
+    """
+
+    # settings of this crawler that the crawlers of the workers are created with
+    WORKER_OPTIONS = ("word_capacity", "word_sketch", "url_cache_size")
+
+    def __init__(self, frontier, corpus, num_workers=None, **kwargs):
+        super().__init__(frontier, corpus, **kwargs)
+        self.num_workers = num_workers or multiprocessing.cpu_count()
+        self.crawler_options = {option: kwargs[option] for option in self.WORKER_OPTIONS if option in kwargs}
+
+    def start_crawling(self):
+        """
+        Distributes the frontier among the workers, waits for the crawl to finish and merges the partial results back into
+        this crawler and its frontier
+        """
+        num_shards = self.num_workers
+        queued_urls = [[] for _ in range(num_shards)]
+        for url in self.frontier.urls_queue:
+            queued_urls[shard_of(url, num_shards)].append(url)
+        self.frontier.set_queue(())
+
+        pending = multiprocessing.Value("q", sum(len(urls) for urls in queued_urls))
+        # the workers schedule their urls the way the frontier does
+        if isinstance(self.frontier.urls_queue, HostQueue):
+            queued_urls = [self.frontier.urls_queue.with_urls(urls) for urls in queued_urls]
+        inboxes = [multiprocessing.Queue() for _ in range(num_shards)]
+        results = multiprocessing.Queue()
+        report_interval = self.metrics.report_interval if isinstance(self.metrics, Metrics) else None
+        # fingerprints can't be mapped back to a hostname, so every worker starts with all the urls seen so far
+        workers = [multiprocessing.Process(target=_crawl_shard,
+                                           args=(shard, num_shards, self.corpus, self.trap_detector, queued_urls[shard],
+                                                 self.frontier.urls_set, inboxes, pending, results, report_interval,
+                                                 self.link_graph is not None, self.crawler_options))
+                   for shard in range(num_shards)]
+
+        logger.info("Starting %s crawler workers ...", num_shards)
+        for worker in workers:
+            worker.start()
+
+        # results have to be drained before joining, otherwise a worker can block on a full pipe
+        try:
+            partials = sorted(self.collect_results(workers, results), key=lambda result: result[0])
+        except RuntimeError:
+            # the other workers would wait forever for the urls the failed one was responsible for
+            for worker in workers:
+                worker.terminate()
+            for worker in workers:
+                worker.join()
+            raise
+        for worker in workers:
+            worker.join()
+
+        for shard, state, shard_urls_set, fetched, metrics_state in partials:
+            self.merge_crawl_state(state)
+            self.frontier.urls_set.update(shard_urls_set)
+            self.frontier.fetched += fetched
+            if metrics_state is not None:
+                self.metrics.merge_state(metrics_state)
+        self.metrics.finish()
+
+    def collect_results(self, workers, results, poll_interval=0.5):
+        """
+        Returns the result posted by every worker. Raises a RuntimeError as soon as a worker posts a failure or dies (e.g.
+        killed by the OS) without posting its result
+        """
+        partials = {}
+        while len(partials) < len(workers):
+            try:
+                result = results.get(timeout=poll_interval)
+            except queue.Empty:
+                for shard, worker in enumerate(workers):
+                    if shard not in partials and not worker.is_alive() and worker.exitcode != 0:
+                        raise RuntimeError("Crawler worker %s died with exit code %s" % (shard, worker.exitcode))
+                continue
+            if result[1] is None:
+                raise RuntimeError("Crawler worker %s failed:\n%s" % (result[0], result[2]))
+            partials[result[0]] = result
+        return list(partials.values())
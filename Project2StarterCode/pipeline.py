@@ -0,0 +1,91 @@
+import logging
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from crawler import Crawler
+from scheduler import url_host
+
+logger = logging.getLogger(__name__)
+
+
+class PipelinedCrawler(Crawler):
+    """
+    A crawler that overlaps reading the corpus with parsing. While the main thread parses a page and validates its links,
+    a pool of threads fetches (and for parsable pages, reads the content of) the next prefetch_depth urls of the frontier.
+    The urls are only peeked at, not popped, so the frontier is consumed in exactly the same order as by Crawler and a
+    checkpoint never misses a url that was being prefetched. At most prefetch_depth responses are held in memory.
+
+    With max_in_flight, at most that many urls of a host are being prefetched at the same time. The other urls of the
+    host are prefetched once a slot is free, or fetched by the main thread if they are reached first. With a
+    recrawl_manifest, the urls whose corpus file did not change since the last crawl are not prefetched, since they are
+    neither fetched nor parsed.
+    """
+
+    def __init__(self, frontier, corpus, prefetch_depth=16, num_threads=4, max_in_flight=None, **kwargs):
+        super().__init__(frontier, corpus, **kwargs)
+        self.prefetch_depth = prefetch_depth
+        self.num_threads = num_threads
+        self.max_in_flight = max_in_flight
+
+    def start_crawling(self):
+        """
+        This method starts the crawling process which is scraping urls from the next available link in frontier and adding
+        the scraped links to the frontier
+        """
+        prefetched = {}
+        # the upcoming urls the recrawl_manifest is going to reuse, so that they are only looked up once
+        unchanged = set()
+        with ThreadPoolExecutor(max_workers=self.num_threads, thread_name_prefix="prefetch") as executor:
+            while self.frontier.has_next_url():
+                # checked before fetching, so that resuming a crawl whose budget is used up fetches nothing
+                if self.budget_exhausted():
+                    # the pages prefetched past the stop are left to the next run
+                    for future in prefetched.values():
+                        future.cancel()
+                    break
+                self.submit_prefetches(executor, prefetched, unchanged)
+
+                url = self.frontier.get_next_url()
+                logger.debug("Fetching URL %s ... Fetched: %s, Queue size: %s", url, self.frontier.fetched,
+                             len(self.frontier))
+                # the fetch stage only measures the time spent waiting for the prefetching threads. A url that was not
+                # prefetched (held back by max_in_flight, or unchanged since the last crawl) is left to crawl_url
+                future = prefetched.pop(url, None)
+                unchanged.discard(url)
+                url_data = None
+                if future is not None:
+                    with self.metrics.stage("fetch"):
+                        url_data = future.result()
+                self.process_url(url, url_data)
+        self.metrics.finish()
+
+    def submit_prefetches(self, executor, prefetched, unchanged):
+        """
+        Starts prefetching the upcoming urls of the frontier that are not prefetched yet, within the max_in_flight limit,
+        except the ones the recrawl_manifest would reuse, which are added to unchanged
+        """
+        need_fingerprint = self.near_duplicates is not None
+        in_flight = None
+        if self.max_in_flight is not None:
+            in_flight = Counter(url_host(url) for url, future in prefetched.items() if not future.done())
+        for next_url in self.frontier.peek_urls(self.prefetch_depth):
+            if next_url in prefetched or next_url in unchanged:
+                continue
+            if self.recrawl_manifest is not None and self.recrawl_manifest.is_unchanged(next_url, need_fingerprint):
+                unchanged.add(next_url)
+                continue
+            if in_flight is not None:
+                host = url_host(next_url)
+                if in_flight[host] >= self.max_in_flight:
+                    continue
+                in_flight[host] += 1
+            prefetched[next_url] = executor.submit(self.prefetch, next_url)
+
+    def prefetch(self, url):
+        """
+        Fetches a url and, if it is going to be parsed, reads its content
+        """
+        url_data = self.corpus.fetch_url(url)
+        if self.is_parsable(url_data):
+            url_data["content"]
+        return url_data
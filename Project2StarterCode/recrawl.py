@@ -0,0 +1,130 @@
+import hashlib
+import logging
+import os
+import pickle
+
+logger = logging.getLogger(__name__)
+
+
+class RecrawlManifest:
+    """
+    This class lets a crawl reuse the parsing done by a previous crawl of the same corpus. For every parsed url, it keeps
+    the signature (mtime and size) of its corpus file, a digest of its content and what parsing it produced: the links
+    found, the same-page fragment traps, the page word counts and token count, the subdomain counted and the near-duplicate
+    hash of the page (when the crawl looks for near-duplicates). A url whose file still has the same signature, or whose
+    content still has the same digest, is not parsed again: the crawler applies the recorded results instead (see
+    Crawler.replay_page). Links are still validated and added to the frontier as usual, so the crawl order, the traps
+    found and the report are the same as those of a full crawl.
+
+    Records are never dropped, urls that are not reached by a crawl keep their record for the next one.
+
+    Attributes:
+        corpus: the corpus the signatures are read from
+        records: the record of every parsed url
+        reused, parsed: the number of pages whose record was reused and of pages parsed since the manifest was loaded
+    """
+
+    # File name to be used when loading and saving the manifest
+    MANIFEST_DIR_NAME = "recrawl_state"
+    MANIFEST_FILE_NAME = os.path.join(".", MANIFEST_DIR_NAME, "manifest.pkl")
+
+    def __init__(self, corpus):
+        self.corpus = corpus
+        self.records = {}
+        self.reused = 0
+        self.parsed = 0
+
+    def load(self):
+        """
+        Loads the manifest saved by the previous crawl, if any
+        """
+        if os.path.isfile(self.MANIFEST_FILE_NAME):
+            try:
+                with open(self.MANIFEST_FILE_NAME, "rb") as manifest_file:
+                    self.records = pickle.load(manifest_file)
+                logger.info("Loaded recrawl manifest with %s pages", len(self.records))
+                return
+            except Exception:
+                logger.warning("Could not read the recrawl manifest, every page will be parsed")
+        self.records = {}
+
+    def save(self):
+        if not os.path.exists(self.MANIFEST_DIR_NAME):
+            os.makedirs(self.MANIFEST_DIR_NAME)
+        # written to a temporary file first so that a crash never leaves a partial manifest
+        temp_file_name = "%s.%s.tmp" % (self.MANIFEST_FILE_NAME, os.getpid())
+        with open(temp_file_name, "wb") as manifest_file:
+            pickle.dump(self.records, manifest_file, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_file_name, self.MANIFEST_FILE_NAME)
+        logger.info("Saved recrawl manifest with %s pages (%s reused, %s parsed)", len(self.records), self.reused,
+                    self.parsed)
+
+    def lookup(self, url, need_fingerprint=False):
+        """
+        Returns the record of a url if its corpus file has not changed since it was parsed, without reading the file
+        :param need_fingerprint: whether the near-duplicate hash of the page is needed, the pages recorded without it
+        being parsed again
+        """
+        if self.is_unchanged(url, need_fingerprint):
+            self.reused += 1
+            return self.records[url]
+        return None
+
+    def is_unchanged(self, url, need_fingerprint=False):
+        """
+        Returns True if lookup would return the record of a url, without counting it as reused
+        """
+        record = self.usable_record(url, need_fingerprint)
+        return record is not None and record["signature"] == self.corpus.file_signature(url)
+
+    def lookup_content(self, url, http_code, content, need_fingerprint=False):
+        """
+        Returns the record of a url whose corpus file changed (e.g. it was rewritten) but whose response did not
+        :param content: the content of the response if it is parsed, otherwise None
+        """
+        record = self.usable_record(url, need_fingerprint)
+        if record is None or record["http_code"] != http_code or record["digest"] != content_digest(content):
+            return None
+        record["signature"] = self.corpus.file_signature(url)
+        self.reused += 1
+        return record
+
+    def usable_record(self, url, need_fingerprint):
+        """
+        Returns the record of a url, unless the near-duplicate hash of the page is needed and was not recorded
+        """
+        record = self.records.get(url)
+        if record is not None and need_fingerprint and record.get("fingerprint") is None and record["token_count"]:
+            return None
+        return record
+
+    def record_page(self, url, http_code, content, links, fragment_traps, word_count, token_count, subdomain_count,
+                    fingerprint=None):
+        """
+        Records the results of parsing a url, see lookup_content for content
+        :param fingerprint: the near-duplicate hash of the page, if it was computed
+        """
+        self.parsed += 1
+        signature = self.corpus.file_signature(url)
+        if signature is None:
+            self.records.pop(url, None)
+            return
+        self.records[url] = {
+            "signature": signature,
+            "digest": content_digest(content),
+            "http_code": http_code,
+            "links": links,
+            "fragment_traps": fragment_traps,
+            "word_count": word_count,
+            "token_count": token_count,
+            "subdomain_count": subdomain_count,
+            "fingerprint": fingerprint
+        }
+
+
+def content_digest(content):
+    if content is None:
+        return None
+    if isinstance(content, str):
+        content = content.encode("utf-8", "surrogatepass")
+    return hashlib.blake2b(content, digest_size=16).digest()
@@ -0,0 +1,162 @@
+import heapq
+from collections import deque
+from urllib.parse import urlparse
+
+
+def url_host(url):
+    """
+    Returns the hostname of a url, the same key Crawler uses for subdomain_count. Urls that can't be parsed share ""
+    """
+    try:
+        return urlparse(url).hostname or ""
+    except ValueError:
+        return ""
+
+
+def link_depth(url, depth):
+    """
+    A url score ranking the urls found closest to the seed first: their link depth (see Frontier.depths)
+    """
+    return depth
+
+
+def path_depth(url, depth):
+    """
+    A url score ranking shallow urls first: the number of segments of the path, plus one if there is a query
+    """
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return 0
+    return len([segment for segment in parsed.path.split("/") if segment]) + (1 if parsed.query else 0)
+
+
+# Url scores that can be used as HostQueue priorities, by name. They are called with a url and its link depth
+PRIORITIES = {"depth": link_depth, "path-depth": path_depth}
+
+
+def heap_urls(heap):
+    """
+    Yields the urls of a heap of (priority, sequence number, url) in the order heappop would return them, without
+    changing the heap. The heap is walked down from its root, only visiting the entries yielded and their children, so
+    the first k urls cost O(k log k) whatever the size of the heap
+    """
+    candidates = [(heap[0], 0)] if heap else []
+    while candidates:
+        entry, index = heapq.heappop(candidates)
+        yield entry[2]
+        for child in (2 * index + 1, 2 * index + 2):
+            if child < len(heap):
+                heapq.heappush(candidates, (heap[child], child))
+
+
+class HostQueue:
+    """
+    A queue of urls that can replace the deque of Frontier.urls_queue. It keeps one queue per host and serves the hosts
+    in weighted round robin: a host with weight w gets w urls in a row before the next host is served (1 by default),
+    so a large host can't hold back the others for long. Within a host, urls are served in FIFO order, or by increasing
+    priority (ties in FIFO order) when a priority function is given.
+
+    Attributes:
+        priority: optional function returning the priority of a url from the url and its link depth, lower first
+        weights: the weight of each host, the hosts not in it have a weight of 1
+    """
+
+    def __init__(self, urls=(), priority=None, weights=None):
+        self.priority = priority
+        self.weights = weights or {}
+        # per host, a deque of urls or a heap of (priority, sequence number, url)
+        self.queues = {}
+        # the hosts having urls, in the order they are served
+        self.ring = deque()
+        # the number of urls served in a row from the host at the head of the ring
+        self.turn = 0
+        self.sequence = 0
+        self.size = 0
+        self.extend(urls)
+
+    def with_urls(self, urls, url_depth=None):
+        """
+        Returns a new HostQueue with the same settings holding the given urls
+        :param url_depth: optional function returning the link depth of a url, which is 0 otherwise
+        """
+        queue = HostQueue(priority=self.priority, weights=self.weights)
+        for url in urls:
+            queue.append(url, url_depth(url) if url_depth is not None else 0)
+        return queue
+
+    def append(self, url, depth=0):
+        """
+        Adds a url to the queue of its host
+        :param depth: the link depth of the url, passed on to the priority function
+        """
+        host = url_host(url)
+        queue = self.queues.get(host)
+        if queue is None:
+            queue = self.queues[host] = [] if self.priority is not None else deque()
+            self.ring.append(host)
+        if self.priority is not None:
+            heapq.heappush(queue, (self.priority(url, depth), self.sequence, url))
+            self.sequence += 1
+        else:
+            queue.append(url)
+        self.size += 1
+
+    def extend(self, urls):
+        for url in urls:
+            self.append(url)
+
+    def popleft(self):
+        """
+        Removes and returns the next url
+        """
+        ring = self.ring
+        if not ring:
+            raise IndexError("pop from an empty HostQueue")
+        host = ring[0]
+        queue = self.queues[host]
+        url = heapq.heappop(queue)[2] if self.priority is not None else queue.popleft()
+        self.size -= 1
+        self.turn += 1
+        if not queue:
+            del self.queues[host]
+            ring.popleft()
+            self.turn = 0
+        elif self.turn >= self.weights.get(host, 1):
+            ring.rotate(-1)
+            self.turn = 0
+        return url
+
+    def host_urls(self, host):
+        """
+        Returns an iterator over the urls of a host in the order they will be served, without changing the queue
+        """
+        queue = self.queues[host]
+        if self.priority is None:
+            return iter(queue)
+        return heap_urls(queue)
+
+    def __iter__(self):
+        """
+        Iterates over the urls in the order popleft would return them
+        """
+        ring = deque(self.ring)
+        remaining = {host: len(self.queues[host]) for host in ring}
+        iterators = {}
+        turn = self.turn
+        while ring:
+            host = ring[0]
+            if host not in iterators:
+                iterators[host] = self.host_urls(host)
+            yield next(iterators[host])
+            remaining[host] -= 1
+            turn += 1
+            if not remaining[host]:
+                ring.popleft()
+                turn = 0
+            elif turn >= self.weights.get(host, 1):
+                ring.rotate(-1)
+                turn = 0
+
+    def __len__(self):
+        return self.size
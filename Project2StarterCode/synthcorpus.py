@@ -0,0 +1,224 @@
+import argparse
+import codecs
+import hashlib
+import json
+import logging
+import os
+import random
+from urllib.parse import urlparse
+
+from cbor import cbor
+
+from urlnorm import corpus_key
+
+logger = logging.getLogger(__name__)
+
+SEED_URL = "http://www.ics.uci.edu/"
+HOSTS = ["www.ics.uci.edu", "vision.ics.uci.edu", "cml.ics.uci.edu", "mondego.ics.uci.edu", "sdcl.ics.uci.edu",
+         "wics.ics.uci.edu", "archive.ics.uci.edu", "evoke.ics.uci.edu", "www.informatics.uci.edu"]
+WORDS = ["the", "of", "and", "research", "faculty", "students", "courses", "data", "graduate", "computer", "science",
+         "software", "systems", "learning", "machine", "vision", "lab", "seminar", "project", "publications", "news",
+         "events", "about", "people", "informatics", "UCI", "Irvine", "2019", "ICS-31", "x86", "e-mail", "café",
+         "naïve", "résumé", "Müller"]
+# Content types of the non html pages, served from urls without an extension so that is_valid lets them through
+NON_HTML_TYPES = [b"application/pdf", b"image/png", b"application/octet-stream", b"application/zip"]
+# Encodings of the html pages and how the charset is declared: in the Content-Type header, in a meta tag or not at all
+ENCODINGS = [("utf-8", None), ("utf-8", "header"), ("iso-8859-1", "header"), ("iso-8859-1", "meta"),
+             ("utf-16", "header")]
+DECLARATIONS = ("header", "meta", "none")
+TRAP_FAMILIES = ("calendar", "repeated", "query")
+
+
+def corpus_file_name(url):
+    """
+    Returns the name of the corpus file of a url, the same way Corpus.get_file_name computes it
+    """
+    return hashlib.sha224(corpus_key(url).encode("utf-8")).hexdigest()
+
+
+def write_page(corpus_dir, url, content, content_type, http_code=200):
+    """
+    Writes a response to the corpus, in the CBOR layout of the crawled corpus
+    """
+    data = {
+        b"url": {b"value": url.encode("utf-8")},
+        b"http_code": {b"value": http_code},
+        b"raw_content": {b"value": content},
+        b"http_headers": {b"value": [{b"k": {b"value": b"Content-Type"}, b"v": {b"value": content_type}}]},
+        b"is_redirected": {b"value": False}
+    }
+    with open(os.path.join(corpus_dir, corpus_file_name(url)), "wb") as corpus_file:
+        cbor.dump(data, corpus_file)
+
+
+def parse_encoding(value):
+    """
+    Parses an encoding given as ENCODING[:DECLARATION] (see DECLARATIONS, none by default) into an item of ENCODINGS
+    """
+    encoding, _, declared = value.partition(":")
+    declared = declared or "none"
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise ValueError("unknown encoding: %s" % encoding)
+    if declared not in DECLARATIONS:
+        raise ValueError("the declaration of %s must be one of %s" % (encoding, ", ".join(DECLARATIONS)))
+    return encoding, None if declared == "none" else declared
+
+
+def add_generator_arguments(parser):
+    """
+    Adds the options of generate_corpus other than pages, fan_out and seed to an argparse parser, the benchmarks taking
+    the same ones (see generator_options)
+    """
+    parser.add_argument("--missing-ratio", type=float, default=0.05, help="fraction of links to missing pages")
+    parser.add_argument("--non-html-ratio", type=float, default=0.05, help="fraction of non html pages")
+    parser.add_argument("--not-found-ratio", type=float, default=0.02, help="fraction of pages stored as 404")
+    parser.add_argument("--traps", nargs="*", choices=TRAP_FAMILIES, default=TRAP_FAMILIES,
+                        help="trap families to generate")
+    parser.add_argument("--trap-depth", type=int, default=50, help="number of pages per trap family and host")
+    parser.add_argument("--encodings", nargs="+", metavar="ENCODING[:DECLARATION]",
+                        help="encodings of the html pages, each declared in the Content-Type header, in a meta tag or not "
+                             "at all (header, meta or none, the default); all of ENCODINGS when not given")
+
+
+def generator_options(args):
+    """
+    Returns the keyword arguments of generate_corpus given by the options of add_generator_arguments. Raises a
+    ValueError if an encoding is invalid
+    """
+    return {
+        "missing_ratio": args.missing_ratio,
+        "non_html_ratio": args.non_html_ratio,
+        "not_found_ratio": args.not_found_ratio,
+        "traps": args.traps,
+        "trap_depth": args.trap_depth,
+        "encodings": [parse_encoding(value) for value in args.encodings] if args.encodings else ENCODINGS
+    }
+
+
+def html_page(rng, title, links, num_words, charset_meta=None):
+    """
+    Returns an html page with a paragraph of num_words random words followed by the given links
+    """
+    # a skewed choice of words so the word frequencies look like natural text
+    words = " ".join(WORDS[min(int(rng.expovariate(0.15)), len(WORDS) - 1)] for _ in range(num_words))
+    meta = '<meta charset="%s">' % charset_meta if charset_meta else ""
+    anchors = "\n".join('<a href="%s">%s</a>' % (link, rng.choice(WORDS)) for link in links)
+    return "<html><head>%s<title>%s</title></head><body><p>%s</p>\n%s</body></html>" % (meta, title, words, anchors)
+
+
+def trap_urls(family, host, index):
+    """
+    Returns the url of the index-th page of a trap family, each page linking to the next one
+    """
+    if family == "calendar":
+        return "http://%s/calendar/?date=%04d-%02d-%02d" % (host, 2019 + index // 360, index // 30 % 12 + 1,
+                                                           index % 30 + 1)
+    if family == "repeated":
+        return "http://%s/repeat/%s" % (host, "events/" * (index + 1))
+    return "http://%s/search?q=news&%s" % (host, "&".join("filter%d=on" % i for i in range(index + 1)))
+
+
+def generate_corpus(corpus_dir, pages=1000, fan_out=10, seed=0, missing_ratio=0.05, non_html_ratio=0.05,
+                    not_found_ratio=0.02, traps=TRAP_FAMILIES, trap_depth=50, encodings=ENCODINGS):
+    """
+    Generates a synthetic corpus readable by Corpus, rooted at SEED_URL.
+
+    :param pages: number of regular pages, the seed included
+    :param fan_out: average number of links per page
+    :param missing_ratio: fraction of the links pointing to pages missing from the corpus
+    :param non_html_ratio: fraction of the pages that are not html
+    :param not_found_ratio: fraction of the pages stored with a 404 status
+    :param traps: trap families to add (see TRAP_FAMILIES), each one reachable from a few regular pages
+    :param trap_depth: number of pages of every trap family and host
+    :param encodings: (encoding, declaration) pairs the html pages are encoded with, see ENCODINGS. The seed is always
+    utf-8 without declaration
+    :return: a summary of the generated corpus
+    """
+    rng = random.Random(seed)
+    if not os.path.exists(corpus_dir):
+        os.makedirs(corpus_dir)
+
+    urls = [SEED_URL]
+    for i in range(1, pages):
+        path = "/".join(rng.choice(WORDS[3:20]) for _ in range(rng.randint(1, 3)))
+        urls.append("http://%s/%s/%d%s" % (rng.choice(HOSTS), path, i, rng.choice(["/", ".html", ".php?id=%d" % i])))
+    trap_hosts = {family: rng.sample(HOSTS, 2) for family in traps}
+
+    summary = {"pages": 0, "html_pages": 0, "non_html_pages": 0, "not_found_pages": 0, "trap_pages": 0, "links": 0,
+               "bytes": 0}
+    for i, url in enumerate(urls):
+        if i and rng.random() < non_html_ratio:
+            size = rng.randint(256, 4096)
+            content = rng.getrandbits(8 * size).to_bytes(size, "little")
+            write_page(corpus_dir, url, content, rng.choice(NON_HTML_TYPES))
+            summary["non_html_pages"] += 1
+            summary["bytes"] += len(content)
+            continue
+
+        links = []
+        for _ in range(max(1, int(rng.gauss(fan_out, fan_out / 3)))):
+            choice = rng.random()
+            if choice < missing_ratio:
+                links.append("http://%s/missing/%d.html" % (rng.choice(HOSTS), rng.randrange(10 * pages)))
+            elif choice < missing_ratio + 0.05:
+                links.append("#section%d" % rng.randrange(5))
+            elif choice < missing_ratio + 0.1:
+                links.append("http://www.example.com/%d.pdf" % rng.randrange(pages))
+            else:
+                target = urlparse(urls[rng.randrange(pages)])
+                # links to the same host are relative
+                same_host = target.netloc == urlparse(url).netloc
+                links.append(target.path + ("?" + target.query if target.query else "") if same_host
+                             else target.geturl())
+        for family, hosts in trap_hosts.items():
+            if i % max(1, pages // 5) == 0:
+                links.append(trap_urls(family, rng.choice(hosts), 0))
+
+        # the seed is always readable, whatever the encodings the crawler handles
+        encoding, declared = rng.choice(encodings) if i else ENCODINGS[0]
+        content_type = b"text/html"
+        if declared == "header":
+            content_type += b"; charset=" + encoding.encode()
+        page = html_page(rng, "Page %d" % i, links, rng.randint(20, 1500), encoding if declared == "meta" else None)
+        content = page.encode(encoding, "xmlcharrefreplace")
+        http_code = 404 if i and rng.random() < not_found_ratio else 200
+        write_page(corpus_dir, url, content, content_type, http_code)
+        summary["html_pages"] += 1
+        summary["not_found_pages"] += http_code == 404
+        summary["links"] += len(links)
+        summary["bytes"] += len(content)
+
+    for family, hosts in trap_hosts.items():
+        for host in hosts:
+            for index in range(trap_depth):
+                url = trap_urls(family, host, index)
+                links = [trap_urls(family, host, index + 1), SEED_URL]
+                content = html_page(rng, "%s %d" % (family, index), links, rng.randint(20, 200)).encode("utf-8")
+                write_page(corpus_dir, url, content, b"text/html")
+                summary["trap_pages"] += 1
+                summary["links"] += len(links)
+                summary["bytes"] += len(content)
+
+    summary["pages"] = summary["html_pages"] + summary["non_html_pages"] + summary["trap_pages"]
+    logger.info("Generated %s pages in %s", summary["pages"], corpus_dir)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generates a synthetic corpus in the layout read by Corpus")
+    parser.add_argument("corpus_dir", help="directory to write the corpus to")
+    parser.add_argument("--pages", type=int, default=1000, help="number of regular pages")
+    parser.add_argument("--fan-out", type=int, default=10, help="average number of links per page")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    add_generator_arguments(parser)
+    args = parser.parse_args()
+    try:
+        options = generator_options(args)
+    except ValueError as error:
+        parser.error(str(error))
+
+    logging.basicConfig(format='%(asctime)s (%(name)s) %(levelname)s %(message)s', datefmt='%m/%d/%Y %I:%M:%S %p',
+                        level=logging.INFO)
+    print(json.dumps(generate_corpus(args.corpus_dir, args.pages, args.fan_out, args.seed, **options), indent=2))
@@ -0,0 +1,29 @@
+import os
+import sys
+
+import pytest
+
+# the crawler modules are imported by name, the way main.py imports them from its own directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import synthcorpus
+
+
+@pytest.fixture(scope="session")
+def corpus_dir(tmp_path_factory):
+    """
+    A small synthetic corpus, with traps, shared by the tests that crawl
+    """
+    corpus_dir = str(tmp_path_factory.mktemp("corpus"))
+    synthcorpus.generate_corpus(corpus_dir, pages=300, fan_out=8, seed=1, trap_depth=20)
+    return corpus_dir
+
+
+@pytest.fixture
+def work_dir(tmp_path, monkeypatch):
+    """
+    Runs a test in an empty directory, since the frontier, corpus manifest and checkpoint state are saved to the current
+    directory
+    """
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
@@ -0,0 +1,117 @@
+import io
+import pickle
+import random
+from collections import Counter
+
+import pytest
+
+from analytics import SpilledList, TopKCounter
+
+
+@pytest.fixture
+def spilled_list(tmp_path):
+    items = ["http://www.ics.uci.edu/%d" % i for i in range(53)]
+    return items, SpilledList(items, buffer_size=10, spill_dir=str(tmp_path))
+
+
+def test_spilled_list_iteration(spilled_list):
+    items, spilled = spilled_list
+    assert spilled.spilled == 50
+    assert len(spilled.buffer) == 3
+    assert len(spilled) == len(items)
+    assert list(spilled) == items
+    assert all(len(chunk) <= 10 for chunk in spilled.chunks())
+    assert spilled
+
+
+def test_spilled_list_indexing(spilled_list):
+    items, spilled = spilled_list
+    for index in (0, 9, 10, 49, 50, 52, -1, -53):
+        assert spilled[index] == items[index]
+    for index in (53, -54):
+        with pytest.raises(IndexError):
+            spilled[index]
+    for index in (slice(None), slice(5, 25), slice(50, None), slice(-2, None), slice(None, None, 7), slice(40, 10)):
+        assert spilled[index] == items[index]
+
+
+def test_spilled_list_append_while_iterating(spilled_list):
+    items, spilled = spilled_list
+    iterated = []
+    for item in spilled:
+        iterated.append(item)
+        if len(iterated) == 5:
+            spilled.extend(["extra"] * 20)
+    assert iterated[:len(items)] == items
+    assert list(spilled) == items + ["extra"] * 20
+
+
+def test_spilled_list_pickles_as_a_list(spilled_list):
+    items, spilled = spilled_list
+    copy = pickle.loads(pickle.dumps(spilled))
+    assert type(copy) is list
+    assert copy == items
+
+
+def test_spilled_list_repr(spilled_list):
+    items, spilled = spilled_list
+    file = io.StringIO()
+    spilled.write_repr(file)
+    assert file.getvalue() == str(items) == repr(spilled)
+    empty = io.StringIO()
+    SpilledList().write_repr(empty)
+    assert empty.getvalue() == "[]"
+    assert not SpilledList()
+
+
+def test_spilled_list_sorted(tmp_path):
+    items = ["http://www.ics.uci.edu/%d" % random.Random(3).randrange(1000) for _ in range(95)]
+    items = [item + str(i % 7) for i, item in enumerate(items)]
+    spilled = SpilledList(items, buffer_size=10, spill_dir=str(tmp_path))
+    sorted_list = spilled.sorted()
+    assert list(sorted_list) == sorted(items)
+    assert list(spilled) == items
+    assert list(SpilledList().sorted()) == []
+
+
+def random_pages(seed, pages=200, vocabulary=3000):
+    rng = random.Random(seed)
+    words = ["w%d" % i for i in range(vocabulary)]
+    # a skewed distribution, so a few words are much more frequent than the rest
+    return [Counter(rng.choices(words, weights=[1 / (i + 1) for i in range(vocabulary)], k=50)) for _ in range(pages)]
+
+
+def test_top_k_counter_is_exact_without_evictions():
+    counts = Counter()
+    top = TopKCounter(capacity=10000)
+    for page in random_pages(1):
+        counts.update(page)
+        top.update(page)
+    assert dict(top.items()) == dict(counts)
+    assert top.most_common() == counts.most_common()
+    assert top.most_common(50) == counts.most_common(50)
+    assert top["w0"] == counts["w0"]
+
+
+@pytest.mark.parametrize("use_sketch", [False, True])
+def test_top_k_counter_guaranteed_counts(use_sketch):
+    counts = Counter()
+    top = TopKCounter(capacity=100, use_sketch=use_sketch)
+    for page in random_pages(2, pages=400):
+        counts.update(page)
+        top.update(page)
+    assert len(top) <= 200
+    # a guaranteed count never exceeds the actual count, and the most frequent words are still found
+    for word, count in top.items():
+        assert count <= counts[word]
+    top_words = {word for word, _ in top.most_common(10)}
+    assert len(top_words & {word for word, _ in counts.most_common(20)}) >= 8
+
+
+def test_top_k_counter_merge():
+    first, second = TopKCounter(), TopKCounter()
+    first.update({"a": 2, "b": 1})
+    second.update({"a": 1, "c": 5})
+    first.update(second)
+    assert dict(first.items()) == {"a": 3, "b": 1, "c": 5}
+    assert first.most_common(1) == [("c", 5)]
@@ -0,0 +1,136 @@
+import os
+
+import pytest
+
+from budgets import CrawlBudget
+from checkpoint import CheckpointJournal
+from corpus import Corpus
+from crawler import Crawler
+from frontier import Frontier
+from linkgraph import LinkGraph
+from scheduler import HostQueue, PRIORITIES
+from traps import TrapDetector
+
+
+def new_crawler(corpus_dir, host_queues=False, budget=None):
+    if host_queues:
+        frontier = Frontier(urls_queue=HostQueue(priority=PRIORITIES["depth"]), track_depths=True, budget=budget)
+    else:
+        frontier = Frontier(budget=budget)
+    return Crawler(frontier, Corpus(corpus_dir), trap_detector=TrapDetector(budget=20), link_graph=LinkGraph(),
+                   budget=budget)
+
+
+def report(crawler):
+    report = crawler.generate_analytics_report()
+    return {key: list(value) if key in ("downloaded_urls", "identified_traps") else value
+            for key, value in report.items()}
+
+
+def crawl(crawler, max_pages=None):
+    """
+    Crawls like Crawler.start_crawling, stopping after max_pages pages without saving anything, as if the process had
+    been killed
+    """
+    pages = 0
+    while crawler.frontier.has_next_url() and (max_pages is None or pages < max_pages):
+        if crawler.budget_exhausted():
+            break
+        crawler.process_url(crawler.frontier.get_next_url())
+        pages += 1
+
+
+def start(crawler, min_journal_size):
+    crawler.journal = CheckpointJournal(crawler.frontier, crawler, min_journal_size=min_journal_size)
+    if not crawler.journal.restore():
+        crawler.frontier.add_url(Frontier.SEED_URL)
+        crawler.journal.snapshot()
+
+
+@pytest.mark.parametrize("host_queues", [False, True])
+@pytest.mark.parametrize("min_journal_size", [0, 1 << 30])
+def test_resume_after_a_crash(corpus_dir, work_dir, host_queues, min_journal_size):
+    expected = new_crawler(corpus_dir, host_queues)
+    expected.frontier.add_url(Frontier.SEED_URL)
+    crawl(expected)
+    assert expected.frontier.fetched > 100
+
+    # min_journal_size 0 compacts the journal into a snapshot after every page, 1 << 30 never does
+    interrupted = new_crawler(corpus_dir, host_queues)
+    start(interrupted, min_journal_size)
+    crawl(interrupted, max_pages=60)
+    interrupted.journal.close()
+
+    resumed = new_crawler(corpus_dir, host_queues)
+    start(resumed, min_journal_size)
+    assert resumed.frontier.fetched == 60
+    crawl(resumed)
+    resumed.journal.close()
+    assert report(resumed) == report(expected)
+
+
+def test_partial_journal_record_is_dropped(corpus_dir, work_dir):
+    interrupted = new_crawler(corpus_dir)
+    start(interrupted, 1 << 30)
+    crawl(interrupted, max_pages=30)
+    interrupted.journal.close()
+    # the process was killed while writing the record of the 30th page
+    journal_size = os.path.getsize(CheckpointJournal.JOURNAL_FILE_NAME)
+    with open(CheckpointJournal.JOURNAL_FILE_NAME, "r+b") as journal_file:
+        journal_file.truncate(journal_size - 10)
+
+    expected = new_crawler(corpus_dir)
+    expected.frontier.add_url(Frontier.SEED_URL)
+    crawl(expected, max_pages=29)
+    resumed = new_crawler(corpus_dir)
+    start(resumed, 1 << 30)
+    assert resumed.frontier.fetched == 29
+    assert os.path.getsize(CheckpointJournal.JOURNAL_FILE_NAME) < journal_size - 10
+    assert report(resumed) == report(expected)
+    resumed.journal.close()
+
+
+def new_budget():
+    return CrawlBudget(max_subdomain_pages=40, min_new_url_rate=0.01, rate_window=7)
+
+
+@pytest.mark.parametrize("min_journal_size", [0, 1 << 30])
+def test_resume_budget_state(corpus_dir, work_dir, min_journal_size):
+    expected = new_crawler(corpus_dir, budget=new_budget())
+    expected.frontier.add_url(Frontier.SEED_URL)
+    crawl(expected, max_pages=60)
+
+    interrupted = new_crawler(corpus_dir, budget=new_budget())
+    start(interrupted, min_journal_size)
+    crawl(interrupted, max_pages=40)
+    interrupted.journal.close()
+
+    resumed = new_crawler(corpus_dir, budget=new_budget())
+    start(resumed, min_journal_size)
+    crawl(resumed, max_pages=20)
+    resumed.journal.close()
+    assert resumed.budget.get_state() == expected.budget.get_state()
+    assert resumed.budget.window_pages == 60 % 7
+    assert report(resumed) == report(expected)
+
+
+def test_frontier_saves_budget_state(corpus_dir, work_dir):
+    crawler = new_crawler(corpus_dir, budget=CrawlBudget(max_fetches=30, max_subdomain_pages=5))
+    crawler.frontier.add_url(Frontier.SEED_URL)
+    crawler.start_crawling()
+    assert crawler.budget.fired.keys() == {"max_fetches", "max_subdomain_pages"}
+
+    resumed = new_crawler(corpus_dir, budget=CrawlBudget(max_subdomain_pages=5))
+    resumed.frontier.load_frontier()
+    assert resumed.frontier.fetched == 30
+    assert resumed.budget.subdomain_pages == crawler.budget.subdomain_pages
+    assert resumed.budget.skipped == crawler.budget.skipped
+    assert (resumed.budget.window_pages, resumed.budget.window_new_urls) == \
+        (crawler.budget.window_pages, crawler.budget.window_new_urls)
+    # only the budgets firing during this run are reported
+    assert resumed.budget.fired == {}
+
+
+def test_no_checkpoint(work_dir):
+    crawler = Crawler(Frontier(), None)
+    assert not CheckpointJournal(crawler.frontier, crawler).restore()
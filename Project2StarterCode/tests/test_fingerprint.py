@@ -0,0 +1,72 @@
+import pickle
+
+from fingerprint import FingerprintSet, url_fingerprint
+from urlnorm import canonicalize_url
+
+
+def test_add_and_contains():
+    urls = FingerprintSet()
+    assert urls.add("http://www.ics.uci.edu/a")
+    assert not urls.add("http://www.ics.uci.edu/a")
+    assert "http://www.ics.uci.edu/a" in urls
+    assert "http://www.ics.uci.edu/b" not in urls
+    assert len(urls) == 1
+
+
+def test_canonical_forms_are_the_same_url():
+    urls = FingerprintSet(["http://www.ics.uci.edu/a?x=1&y=2"])
+    assert "HTTP://WWW.ICS.UCI.EDU/a?x=1&y=2" in urls
+    assert "http://www.ics.uci.edu:80/a?x=1&y=2" in urls
+    assert "http://www.ics.uci.edu/a?x=1&y=2#top" in urls
+    assert "http://www.ics.uci.edu/a?y=2&x=1" in urls
+    assert "http://www.ics.uci.edu/A?x=1&y=2" not in urls
+    assert len(urls) == 1
+
+
+def test_fingerprint_is_computed_from_the_canonical_url():
+    url = "HTTP://www.ICS.uci.edu:80/a/./b/../c?b=2&a=1#frag"
+    assert url_fingerprint(url) == url_fingerprint(canonicalize_url(url))
+    assert url_fingerprint(url) != 0
+    urls = FingerprintSet()
+    assert urls.add_fingerprint(url_fingerprint(url))
+    assert urls.contains_fingerprint(url_fingerprint(canonicalize_url(url)))
+    assert url in urls
+
+
+def test_canonical_fast_path_matches_the_full_canonicalization():
+    # urls accepted by the fast path of canonicalize_url are returned as they are (without their fragment), which is
+    # what the full canonicalization gives for them
+    for url in ["http://www.ics.uci.edu/", "http://www.ics.uci.edu/a/b.html", "https://vision.ics.uci.edu/p?x=1",
+                "http://www.ics.uci.edu/a#frag", "http://www.ics.uci.edu/a?x=1#frag"]:
+        canonical_url = canonicalize_url(url)
+        assert canonical_url == url.partition("#")[0]
+        assert canonicalize_url(canonical_url) == canonical_url
+
+
+def test_resize_keeps_every_url():
+    urls = FingerprintSet(capacity=4)
+    size = len(urls.table)
+    added = ["http://www.ics.uci.edu/page/%d" % i for i in range(5000)]
+    for url in added:
+        assert urls.add(url)
+    assert len(urls.table) > size
+    assert len(urls) == len(added)
+    assert all(url in urls for url in added)
+    assert not any("http://www.ics.uci.edu/other/%d" % i in urls for i in range(5000))
+    assert urls.count <= len(urls.table) * FingerprintSet.MAX_LOAD_FACTOR
+
+
+def test_update_from_another_set():
+    first = FingerprintSet(["http://a.ics.uci.edu/", "http://b.ics.uci.edu/"])
+    second = FingerprintSet(["http://b.ics.uci.edu/", "http://c.ics.uci.edu/"])
+    first.update(second)
+    assert len(first) == 3
+    assert "http://c.ics.uci.edu/" in first
+
+
+def test_pickle_round_trip():
+    urls = FingerprintSet("http://www.ics.uci.edu/%d" % i for i in range(100))
+    copy = pickle.loads(pickle.dumps(urls))
+    assert len(copy) == 100
+    assert set(copy.fingerprints()) == set(urls.fingerprints())
+    assert "http://www.ics.uci.edu/42" in copy
@@ -0,0 +1,38 @@
+from corpus import Corpus
+from crawler import Crawler
+from frontier import Frontier
+from instrumentation import Metrics
+from linkgraph import LinkGraph
+from parallel import ParallelCrawler
+
+
+def crawl(corpus_dir, **kwargs):
+    frontier = Frontier()
+    frontier.add_url(Frontier.SEED_URL)
+    crawler_class = ParallelCrawler if "num_workers" in kwargs else Crawler
+    crawler = crawler_class(frontier, Corpus(corpus_dir), metrics=Metrics(frontier, report_interval=3600),
+                            link_graph=LinkGraph(), **kwargs)
+    crawler.start_crawling()
+    return crawler
+
+
+def written_report(crawler, file_name):
+    crawler.write_analytics_report_to_file(file_name)
+    with open(file_name) as report_file:
+        return report_file.read()
+
+
+def test_workers_match_a_serial_crawl(corpus_dir, work_dir):
+    serial = crawl(corpus_dir)
+    parallel = crawl(corpus_dir, num_workers=3)
+    # the default trap budget is large enough for no template to use it up, so both crawls reach the same pages
+    assert written_report(parallel, "parallel.txt") == written_report(serial, "serial.txt")
+    assert parallel.metrics.counters == serial.metrics.counters
+    assert parallel.metrics.histograms["frontier"].count == serial.metrics.histograms["frontier"].count
+
+
+def test_ranks_before():
+    assert Crawler.ranks_before({"url": "http://b/", "count": 2}, {"url": "http://a/", "count": 1})
+    assert Crawler.ranks_before({"url": "http://a/", "count": 1}, {"url": "http://b/", "count": 1})
+    assert not Crawler.ranks_before({"url": "http://b/", "count": 1}, {"url": "http://a/", "count": 1})
+    assert not Crawler.ranks_before({"url": "http://a/", "count": 0}, {"url": None, "count": 0})
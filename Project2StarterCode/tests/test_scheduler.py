@@ -0,0 +1,79 @@
+import pytest
+
+from scheduler import HostQueue, heap_urls, link_depth, path_depth
+
+
+def drain(queue):
+    urls = []
+    while queue:
+        urls.append(queue.popleft())
+    return urls
+
+
+def test_round_robin_between_hosts():
+    queue = HostQueue(["http://a.ics.uci.edu/1", "http://a.ics.uci.edu/2", "http://a.ics.uci.edu/3",
+                       "http://b.ics.uci.edu/1", "http://c.ics.uci.edu/1", "http://b.ics.uci.edu/2"])
+    assert drain(queue) == ["http://a.ics.uci.edu/1", "http://b.ics.uci.edu/1", "http://c.ics.uci.edu/1",
+                            "http://a.ics.uci.edu/2", "http://b.ics.uci.edu/2", "http://a.ics.uci.edu/3"]
+
+
+def test_weights():
+    queue = HostQueue(["http://a.ics.uci.edu/%d" % i for i in range(4)] + ["http://b.ics.uci.edu/%d" % i for i in range(2)],
+                      weights={"a.ics.uci.edu": 2})
+    assert drain(queue) == ["http://a.ics.uci.edu/0", "http://a.ics.uci.edu/1", "http://b.ics.uci.edu/0",
+                            "http://a.ics.uci.edu/2", "http://a.ics.uci.edu/3", "http://b.ics.uci.edu/1"]
+
+
+def test_popleft_empty():
+    queue = HostQueue()
+    assert len(queue) == 0
+    with pytest.raises(IndexError):
+        queue.popleft()
+
+
+def test_path_depth_priority():
+    queue = HostQueue(priority=path_depth)
+    queue.extend(["http://a.ics.uci.edu/x/y/z", "http://a.ics.uci.edu/x", "http://a.ics.uci.edu/x/y?q=1",
+                  "http://a.ics.uci.edu/w", "http://a.ics.uci.edu/"])
+    # lower priorities first, ties in FIFO order
+    assert drain(queue) == ["http://a.ics.uci.edu/", "http://a.ics.uci.edu/x", "http://a.ics.uci.edu/w",
+                            "http://a.ics.uci.edu/x/y/z", "http://a.ics.uci.edu/x/y?q=1"]
+
+
+def test_link_depth_priority():
+    queue = HostQueue(priority=link_depth)
+    queue.append("http://a.ics.uci.edu/deep", 3)
+    queue.append("http://a.ics.uci.edu/x/y/z/shallow", 1)
+    queue.append("http://a.ics.uci.edu/seed", 0)
+    assert drain(queue) == ["http://a.ics.uci.edu/seed", "http://a.ics.uci.edu/x/y/z/shallow",
+                            "http://a.ics.uci.edu/deep"]
+
+
+@pytest.mark.parametrize("priority", [None, path_depth])
+def test_iteration_order_is_pop_order(priority):
+    urls = ["http://%s.ics.uci.edu/%s" % (host, "/".join(["p"] * (i % 4)) + "?i=%d" % i)
+            for i in range(40) for host in ("a", "b", "c")[:i % 3 + 1]]
+    queue = HostQueue(urls, priority=priority, weights={"b.ics.uci.edu": 3})
+    # start from the middle of a turn
+    queue.popleft()
+    listed = list(queue)
+    assert len(listed) == len(queue)
+    assert listed == drain(queue)
+
+
+def test_heap_urls_does_not_change_the_heap():
+    queue = HostQueue(["http://a.ics.uci.edu/%s" % "/".join(["p"] * (i % 5)) for i in range(20)], priority=path_depth)
+    heap = list(queue.queues["a.ics.uci.edu"])
+    listed = list(heap_urls(queue.queues["a.ics.uci.edu"]))
+    assert queue.queues["a.ics.uci.edu"] == heap
+    assert listed == drain(queue)
+
+
+def test_with_urls_keeps_settings_and_depths():
+    queue = HostQueue(priority=link_depth, weights={"a.ics.uci.edu": 2})
+    depths = {"http://a.ics.uci.edu/1": 2, "http://a.ics.uci.edu/2": 1}
+    copy = queue.with_urls(["http://a.ics.uci.edu/1", "http://a.ics.uci.edu/2"], depths.get)
+    assert copy.priority is link_depth
+    assert copy.weights == queue.weights
+    assert len(queue) == 0
+    assert drain(copy) == ["http://a.ics.uci.edu/2", "http://a.ics.uci.edu/1"]
@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from benchmark import iter_corpus_texts, legacy_word_token_count
+from crawler import Crawler
+
+
+def legacy_count_words(token_list):
+    word_count = {}
+    for token in token_list:
+        if token not in Crawler.STOP_WORDS:
+            word_count[token] = word_count.get(token, 0) + 1
+    return word_count
+
+
+def assert_same_tokens(text):
+    crawler = Crawler(None, None)
+    # the legacy tokenizer only lowercased a token once the character following it was read, so it left the case of a
+    # token ending the text unchanged
+    legacy_tokens = [token.lower() for token in legacy_word_token_count(text)]
+    tokens = crawler.word_token_count(text)
+    assert tokens == legacy_tokens
+    assert crawler.count_words(tokens) == legacy_count_words(legacy_tokens)
+    assert crawler.word_count == legacy_count_words(legacy_tokens)
+
+
+@pytest.mark.parametrize("text", [
+    "",
+    "   \n\t ",
+    "Hello World",
+    "hello, WORLD!",
+    "The end",
+    "don't won't it's O'Brien's",
+    "café naïve résumé Straße",
+    "Ｆｕｌｌｗｉｄｔｈ ａｓｃｉｉ",
+    "Kelvin İstanbul",
+    "x² ³ ¼ ٣ 2019-05-01 v1.2.3 0xFF 42nd",
+    "under_score hyphen-ated dot.ted",
+    "mixedCASE123abc ABC123",
+    "日本語のテキスト and english",
+    "emoji 🙂 between words",
+])
+def test_edge_cases(text):
+    assert_same_tokens(text)
+
+
+def test_last_token_is_lowercased():
+    assert Crawler(None, None).word_token_count("Research News") == ["research", "news"]
+    assert legacy_word_token_count("Research News") == ["research", "News"]
+
+
+def test_corpus_pages(corpus_dir):
+    texts = list(iter_corpus_texts(corpus_dir, 1000))
+    assert texts
+    for text in texts:
+        assert_same_tokens(text)
+
+
+@pytest.mark.skipif(not os.environ.get("CRAWLER_TEST_CORPUS"), reason="CRAWLER_TEST_CORPUS is not set")
+def test_real_corpus_pages():
+    for text in iter_corpus_texts(os.environ["CRAWLER_TEST_CORPUS"], 2000):
+        assert_same_tokens(text)
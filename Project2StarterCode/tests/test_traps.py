@@ -0,0 +1,72 @@
+from traps import TrapDetector, url_templates, value_template
+
+
+def test_value_template():
+    assert value_template("news") == "news"
+    assert value_template("2019-05-01") == "<date>"
+    assert value_template("0123456789abcdef0123") == "<id>"
+    assert value_template("page12") == "page<n>"
+
+
+def test_url_templates():
+    assert url_templates("http://www.ics.uci.edu/calendar/2019-05-01/?day=3&b=x") == \
+        ("www.ics.uci.edu/calendar/<date>/?b=x&day=<n>", None)
+    assert url_templates("http://h.ics.uci.edu/id/0123456789abcdef0123") == ("h.ics.uci.edu/id/<id>?", None)
+    # urls differing only by their query order share a template
+    assert url_templates("http://h.ics.uci.edu/p?a=1&b=2")[0] == url_templates("http://h.ics.uci.edu/p?b=3&a=4")[0]
+
+
+def test_session_templates():
+    template, session_template = url_templates("http://www.ics.uci.edu/a/p;jsessionid=ABC?x=1&sid=42")
+    assert template == "www.ics.uci.edu/a/p?x=<n>"
+    assert session_template == "session:www.ics.uci.edu/a/p?x=1"
+    assert url_templates("http://www.ics.uci.edu/a/p?x=1&SID=43")[1] == session_template
+
+
+def test_template_budget():
+    detector = TrapDetector(budget=3)
+    for i in range(3):
+        url = "http://www.ics.uci.edu/page/%d" % i
+        assert not detector.is_trap(url)
+        assert detector.admit(url)
+    assert detector.is_trap("http://www.ics.uci.edu/page/3")
+    assert not detector.admit("http://www.ics.uci.edu/page/3")
+    assert not detector.is_trap("http://www.ics.uci.edu/other/3")
+
+
+def test_session_budget():
+    detector = TrapDetector(session_budget=1)
+    assert detector.admit("http://www.ics.uci.edu/p?x=1&sid=1")
+    assert detector.is_trap("http://www.ics.uci.edu/p?x=1&sid=2")
+    assert not detector.admit("http://www.ics.uci.edu/p?x=1&sid=2")
+    # another page under the same template has a session budget of its own
+    assert detector.admit("http://www.ics.uci.edu/p?x=2&sid=1")
+
+
+def test_mark_trap():
+    detector = TrapDetector()
+    detector.mark_trap("http://www.ics.uci.edu/a/1/a/1/a/1")
+    assert detector.is_trap("http://www.ics.uci.edu/a/2/a/3/a/4")
+    assert not detector.is_trap("http://www.ics.uci.edu/a/2")
+
+
+def test_page_state_and_merge():
+    detector = TrapDetector(budget=2)
+    detector.admit("http://www.ics.uci.edu/page/1")
+    detector.start_page()
+    detector.admit("http://www.ics.uci.edu/page/2")
+    detector.mark_trap("http://www.ics.uci.edu/cal/2019-01-01")
+    page_state = detector.get_page_state()
+    assert page_state["template_counts"] == {"www.ics.uci.edu/page/<n>?": 1}
+    assert page_state["trapped_templates"] == ["www.ics.uci.edu/cal/<date>?"]
+
+    merged = TrapDetector(budget=2)
+    merged.merge_state(detector.get_state())
+    assert merged.is_trap("http://www.ics.uci.edu/page/3")
+    assert merged.is_trap("http://www.ics.uci.edu/cal/2020-02-02")
+
+    replayed = TrapDetector(budget=2)
+    replayed.merge_state({"template_counts": {"www.ics.uci.edu/page/<n>?": 1}, "trapped_templates": []})
+    replayed.merge_state(page_state)
+    assert replayed.template_counts == detector.template_counts
+    assert replayed.trapped_templates == detector.trapped_templates
@@ -0,0 +1,150 @@
+import re
+from urllib.parse import urlsplit
+
+# Placeholders replacing the variable parts of a url in its template
+NUMBER_PATTERN = re.compile(r"\d+")
+DATE_PATTERN = re.compile(r"(\d{4}[-_.]\d{1,2}([-_.]\d{1,2})?|\d{1,2}[-_.]\d{1,2}[-_.]\d{2,4})")
+ID_PATTERN = re.compile(r"([0-9a-fA-F]{16,}|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})")
+
+# Query (or path ;param) names carrying a session id
+SESSION_PARAMS = {"sid", "sessid", "sessionid", "session_id", "phpsessid", "jsessionid", "aspsessionid", "cfid",
+                  "cftoken"}
+
+
+def value_template(value):
+    """
+    Returns the template of a path segment or query value: dates become <date>, long hex strings and uuids become <id>
+    and any other run of digits becomes <n>
+    """
+    if not NUMBER_PATTERN.search(value):
+        return value
+    if DATE_PATTERN.fullmatch(value):
+        return "<date>"
+    if ID_PATTERN.fullmatch(value):
+        return "<id>"
+    return NUMBER_PATTERN.sub("<n>", value)
+
+
+def url_templates(url):
+    """
+    Returns the template of a url, which is its host, path and query with the variable parts replaced by placeholders
+    and the query parameters sorted, and its session template. The session template is the url without its session id
+    parameters, or None if it has none
+    """
+    parsed = urlsplit(url)
+    host = parsed.hostname or ""
+    path_template = []
+    session_path = []
+    has_session = False
+    for segment in parsed.path.split("/"):
+        segment, _, params = segment.partition(";")
+        if params and params.partition("=")[0].lower() in SESSION_PARAMS:
+            has_session = True
+        path_template.append(value_template(segment))
+        session_path.append(segment)
+
+    query_template = []
+    session_query = []
+    for param in parsed.query.split("&"):
+        if not param:
+            continue
+        name, _, value = param.partition("=")
+        if name.lower() in SESSION_PARAMS:
+            has_session = True
+            continue
+        query_template.append(name + "=" + value_template(value))
+        session_query.append(param)
+
+    template = host + "/".join(path_template) + "?" + "&".join(sorted(query_template))
+    if not has_session:
+        return template, None
+    return template, "session:" + host + "/".join(session_path) + "?" + "&".join(sorted(session_query))
+
+
+class TrapDetector:
+    """
+    This class detects crawler traps by normalizing urls into templates (see url_templates) and counting, per template,
+    how many urls were admitted into the frontier. A url is a trap once its template has been flagged by one of the
+    is_valid rules or once the template has used up its budget. Urls that only differ by a session id share a session
+    template with a budget of its own, so the same page is not crawled again under another session.
+
+    Attributes:
+        budget: the number of urls admitted per template
+        session_budget: the number of urls admitted per session template
+        template_counts: the number of admitted urls per template
+        trapped_templates: the templates flagged as traps
+        page_template_counts, page_trapped_templates: the same, only for the current page (see start_page)
+    """
+
+    def __init__(self, budget=1000, session_budget=1):
+        self.budget = budget
+        self.session_budget = session_budget
+        self.template_counts = {}
+        self.trapped_templates = set()
+        self.page_template_counts = {}
+        self.page_trapped_templates = []
+
+    def start_page(self):
+        """
+        Starts tracking the changes made while crawling a new page
+        """
+        self.page_template_counts = {}
+        self.page_trapped_templates = []
+
+    def is_trap(self, url):
+        """
+        Returns True if the template of the url was flagged as a trap or has used up its budget
+        """
+        return self.is_trap_template(*url_templates(url))
+
+    def is_trap_template(self, template, session_template=None):
+        """
+        is_trap, given the templates of the url
+        """
+        if template in self.trapped_templates or self.template_counts.get(template, 0) >= self.budget:
+            return True
+        return session_template is not None and self.template_counts.get(session_template, 0) >= self.session_budget
+
+    def mark_trap(self, url):
+        """
+        Flags the template of the url as a trap, so every url sharing it is rejected from now on
+        """
+        self.mark_trap_template(url_templates(url)[0])
+
+    def mark_trap_template(self, template):
+        if template not in self.trapped_templates:
+            self.trapped_templates.add(template)
+            self.page_trapped_templates.append(template)
+
+    def admit(self, url):
+        """
+        Counts a url being added to the frontier against the budget of its templates
+        :return: False if one of its templates has already used up its budget, in which case the url is not counted
+        """
+        template, session_template = url_templates(url)
+        if self.template_counts.get(template, 0) >= self.budget:
+            return False
+        if session_template is not None:
+            if self.template_counts.get(session_template, 0) >= self.session_budget:
+                return False
+            self.count(session_template, 1)
+        self.count(template, 1)
+        return True
+
+    def count(self, template, count):
+        self.template_counts[template] = self.template_counts.get(template, 0) + count
+        self.page_template_counts[template] = self.page_template_counts.get(template, 0) + count
+
+    def get_state(self):
+        return {"template_counts": self.template_counts, "trapped_templates": list(self.trapped_templates)}
+
+    def get_page_state(self):
+        return {"template_counts": self.page_template_counts, "trapped_templates": self.page_trapped_templates}
+
+    def merge_state(self, state):
+        """
+        Merges the state of another detector (see get_state and get_page_state) into this one
+        """
+        for template, count in state["template_counts"].items():
+            self.template_counts[template] = self.template_counts.get(template, 0) + count
+        self.trapped_templates.update(state["trapped_templates"])
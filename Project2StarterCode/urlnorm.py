@@ -0,0 +1,81 @@
+import re
+from collections import OrderedDict
+from urllib.parse import urlparse, urlsplit, urlunsplit
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+# Urls that are in canonical form once their fragment is dropped: lowercase scheme and host, no port or userinfo, and at
+# most one query parameter. Most links match it and skip the parsing done by canonicalize_url
+CANONICAL_URL_PATTERN = re.compile(r"https?://[a-z0-9.-]+(/[^?#\s]*)?(\?[^#&\s]+)?(#\S*)?")
+
+
+def canonicalize_url(url):
+    """
+    Returns the canonical form of a url: lowercased scheme and host, no default port, no fragment and the query
+    parameters sorted by name (parameters sharing a name keep their order). Urls only differing in these are the same url
+    """
+    if CANONICAL_URL_PATTERN.fullmatch(url):
+        return url.partition("#")[0]
+    try:
+        parts = urlsplit(url)
+        netloc = parts.netloc
+        if netloc:
+            userinfo, _, hostport = netloc.rpartition("@")
+            if hostport.startswith("["):
+                host, port = hostport, ""
+            else:
+                host, _, port = hostport.partition(":")
+            if port and DEFAULT_PORTS.get(parts.scheme.lower()) == int(port):
+                port = ""
+            netloc = (userinfo + "@" if userinfo else "") + host.lower() + (":" + port if port else "")
+        query = parts.query
+        if "&" in query:
+            query = "&".join(sorted(query.split("&"), key=lambda param: param.partition("=")[0]))
+        return urlunsplit((parts.scheme.lower(), netloc, parts.path, query, ""))
+    except ValueError:
+        return url
+
+
+def corpus_key(url):
+    """
+    Returns the key a url is stored under in the corpus: its host, path without trailing slash and query, as spelled in
+    the url (the corpus was saved from the urls actually crawled, so they are not canonicalized)
+    """
+    parsed = urlparse(url)
+    if parsed.path:
+        path = parsed.path[:-1] if parsed.path[-1] == "/" else parsed.path
+    else:
+        path = ""
+    return parsed.netloc + path + (("?" + parsed.query) if parsed.query else "")
+
+
+class LRUCache:
+    """
+    A dictionary holding at most capacity entries, dropping the least recently used one when full. A capacity of 0
+    disables caching
+    """
+
+    def __init__(self, capacity=50000):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        entry = self.entries.get(key, default)
+        if entry is default:
+            self.misses += 1
+        else:
+            self.entries.move_to_end(key)
+            self.hits += 1
+        return entry
+
+    def put(self, key, value):
+        if self.capacity <= 0:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.capacity:
+            self.entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self.entries)